@@ -0,0 +1,126 @@
+"""Capturing a usable print: retries and an image quality gate.
+
+The sensor only says whether it took an image. Whether the image is any
+good shows up later, as IMAGEMESS/FEATUREFAIL from image_2_tz() or as a
+template that matches nothing. A capture here retries those internally,
+up to a number of placements, instead of failing the whole request.
+When the image is uploaded anyway (to store it, or to rank enrollment
+captures), image_quality() scores it first, and a poor capture is
+rejected before it is templated.
+
+image_quality() works on BLOCK x BLOCK blocks of the image:
+
+    contrast  ridge contrast of the best-pressed blocks, relative to a good print
+    coverage  fraction of blocks that show ridges at all, relative to a full print
+    clarity   fraction of ridge blocks nearly as contrasted as the best ones;
+              smudged, wet or dry patches lower it
+
+and the score is their product, in [0, 1].
+"""
+import time
+
+import adafruit_fingerprint
+import numpy as np
+
+from sensor import IMAGE_HEIGHT, IMAGE_WIDTH
+
+BLOCK = 8
+RIDGE_STD = 20  # block standard deviation above which a block shows ridges
+FULL_CONTRAST = 50  # block standard deviation of well-pressed ridges
+FULL_COVERAGE = 0.6  # fraction of blocks a full print covers
+CLEAR_FRACTION = 0.6  # a clear block has at least this fraction of the best blocks' contrast
+
+# get_image()/image_2_tz() codes after which placing the finger again can help.
+RETRY_CODES = frozenset({
+    adafruit_fingerprint.IMAGEFAIL,
+    adafruit_fingerprint.IMAGEMESS,
+    adafruit_fingerprint.FEATUREFAIL,
+    adafruit_fingerprint.INVALIDIMAGE,
+})
+
+
+def image_quality(image):
+    """Quality of a sensor image: {"score", "contrast", "coverage", "clarity"}, each 0-1."""
+    image = np.asarray(image, dtype=np.float32).reshape(IMAGE_HEIGHT, IMAGE_WIDTH)
+    std = image.reshape(IMAGE_HEIGHT // BLOCK, BLOCK, IMAGE_WIDTH // BLOCK, BLOCK).std(axis=(1, 3))
+    ridges = std > RIDGE_STD
+    best = np.percentile(std, 90)
+    contrast = min(1.0, best / FULL_CONTRAST)
+    coverage = min(1.0, ridges.mean() / FULL_COVERAGE)
+    clarity = float((std[ridges] >= CLEAR_FRACTION * best).mean()) if ridges.any() else 0.0
+    return {
+        "score": round(contrast * coverage * clarity, 3),
+        "contrast": round(contrast, 3),
+        "coverage": round(coverage, 3),
+        "clarity": round(clarity, 3),
+    }
+
+
+def grade(finger, slot=1, reader=None, min_quality=0):
+    """Score and template the image the sensor has just taken.
+
+    With a reader (uart.ImageReader) the image is uploaded and scored
+    first, and one scoring below min_quality is rejected as IMAGEMESS
+    without being templated. slot=None skips templating. Returns
+    (code, image, quality); image and quality are None without a reader.
+    """
+    image = quality = None
+    if reader is not None:
+        image = reader.read()
+        quality = image_quality(image)
+        if quality["score"] < min_quality:
+            return adafruit_fingerprint.IMAGEMESS, image, quality
+    if slot is None:
+        return adafruit_fingerprint.OK, image, quality
+    return finger.image_2_tz(slot), image, quality
+
+
+def wait_for_lift(finger, timeout=None, poll_interval=0.02):
+    """Poll get_image() until the finger is off the sensor.
+
+    Until then the sensor just images the same press again. Raises
+    TimeoutError if the finger is still there after timeout seconds.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while finger.get_image() != adafruit_fingerprint.NOFINGER:
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError("Remove your finger from the sensor.")
+        time.sleep(poll_interval)
+
+
+def capture_template(finger, slot=1, attempts=3, reader=None, min_quality=0, timeout=None, poll_interval=0.02):
+    """Wait for a finger and grade() its image, placing it again up to attempts times.
+
+    Blocking version of SensorWorker.capture_template() for the scripts in
+    utils/; the finger is lifted before each retry. Returns (code, image,
+    quality) of the last attempt; raises TimeoutError if no finger was
+    placed, or it was not removed, within timeout seconds.
+    """
+    for attempt in range(attempts):
+        if attempt:
+            wait_for_lift(finger, timeout, poll_interval)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while (code := finger.get_image()) == adafruit_fingerprint.NOFINGER:
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError("No finger placed on the sensor.")
+            time.sleep(poll_interval)
+        image = quality = None
+        if code == adafruit_fingerprint.OK:
+            code, image, quality = grade(finger, slot, reader, min_quality)
+        if code not in RETRY_CODES:
+            break
+    return code, image, quality
+
+
+def read_char_buffer(finger, slot=1):
+    """Template in char buffer slot, as bytes."""
+    return bytes(finger.get_fpdata(sensorbuffer="char", slot=slot))
+
+
+def build_model(finger, templates):
+    """Load templates (one or two) into char buffers 1, 2 and merge them into buffer 1."""
+    for slot, template in enumerate(templates, start=1):
+        finger.send_fpdata(list(template), sensorbuffer="char", slot=slot)
+    if len(templates) == 1:
+        return adafruit_fingerprint.OK
+    return finger.create_model()
@@ -0,0 +1,146 @@
+import threading
+import time
+
+import adafruit_fingerprint
+
+import features
+import metrics
+import pattern_class
+from uart import ImageReader
+
+STAGES = ("sensor", "upload", "extract", "classify", "gallery")
+
+
+class CascadeMatcher:
+    """Two-stage 1:N match of the print in the sensor's char buffer 1.
+
+    The on-chip search runs first: it costs a few short UART frames, while
+    the host gallery needs the whole image uploaded (seconds at 57600 baud)
+    and its minutiae extracted. Only when the sensor finds nothing, or
+    answers with less than min_confidence, is the image read and passed to
+    identify(descriptor), which returns (labels, scores, complete) like
+    IdentificationEngine.identify; its best score must reach threshold.
+    Without identify the matcher is sensor-only, and sensor answers below
+    min_confidence count as misses.
+
+    Gallery labels are the IDs prints were enrolled under; with known set,
+    identify() is asked for its `candidates` best matches and those whose ID
+    known(id) rejects (e.g. deleted from the database but still in the
+    gallery) are skipped, so the best known one at or above threshold wins.
+
+    With binning, the image is also classified (pattern_class.py) and
+    identify(descriptor, bins=...) is asked for the probe's own bins first
+    and for the neighbouring bins only if those hold no known match.
+
+    match() runs every step on the calling thread, so the caller must own
+    the sensor (e.g. through SensorWorker.call); calls for different
+    sensors may run concurrently. Time spent in each stage
+    and how often each stage produced the match are kept for stats().
+    """
+
+    def __init__(self, identify=None, min_confidence=0, threshold=0.2, binning=False, known=None, candidates=8):
+        self.identify = identify
+        self.known = known
+        self.candidates = candidates
+        self.min_confidence = min_confidence
+        self.threshold = threshold
+        self.binning = binning
+        self._readers = {}
+        self._lock = threading.Lock()
+        self.matches = 0
+        self.misses = 0
+        self.hits = dict.fromkeys(("sensor", "gallery"), 0)
+        self.bin_hits = dict.fromkeys(("probe", "neighbour"), 0)
+        self.unknown = 0
+        self.calls = dict.fromkeys(STAGES, 0)
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.last_latency = None
+
+    def _timed(self, stage, fn, *args):
+        started = time.perf_counter()
+        try:
+            with metrics.timed(metrics.MATCH_STAGE_SECONDS, stage=stage):
+                return fn(*args)
+        finally:
+            with self._lock:
+                self.calls[stage] += 1
+                self.seconds[stage] += time.perf_counter() - started
+
+    def _search_sensor(self, finger):
+        code = finger.finger_fast_search()
+        return code, finger.finger_id, finger.confidence
+
+    def _read_image(self, finger):
+        if finger not in self._readers:
+            self._readers[finger] = ImageReader(finger)
+        return self._readers[finger].read()
+
+    def _gallery_match(self, descriptor, bins=None):
+        """Best known gallery match at or above threshold, or None."""
+        options = {} if bins is None else {"bins": bins}
+        if self.known is not None:
+            options["k"] = self.candidates
+        labels, scores, _ = self._timed("gallery", lambda: self.identify(descriptor, **options))
+        for label, score in zip(labels, scores):
+            if score < self.threshold:
+                break
+            if self.known is None or self.known(int(label)):
+                return "gallery", int(label), float(score)
+            with self._lock:
+                self.unknown += 1
+        return None
+
+    def _search_gallery(self, image, descriptor):
+        if not self.binning:
+            return self._gallery_match(descriptor)
+        bins = pattern_class.probe_bins(self._timed("classify", pattern_class.classify, image))
+        for tier, tier_bins in (("probe", bins), ("neighbour", pattern_class.neighbour_bins(bins))):
+            result = self._gallery_match(descriptor, tier_bins)
+            if result is not None:
+                with self._lock:
+                    self.bin_hits[tier] += 1
+                return result
+        return None
+
+    def match(self, finger):
+        """Return (stage, id, confidence) of the match, or None.
+
+        confidence is the sensor's score for stage "sensor" and the
+        minutiae similarity (0-1) for stage "gallery".
+        """
+        started = time.perf_counter()
+        result = None
+        code, finger_id, confidence = self._timed("sensor", self._search_sensor, finger)
+        if code == adafruit_fingerprint.OK and confidence >= self.min_confidence:
+            result = ("sensor", finger_id, confidence)
+        elif self.identify is not None:
+            image = self._timed("upload", self._read_image, finger)
+            descriptor = self._timed("extract", features.extract, image)
+            result = self._search_gallery(image, descriptor)
+
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.matches += 1
+                self.hits[result[0]] += 1
+            self.last_latency = time.perf_counter() - started
+        return result
+
+    def stats(self):
+        with self._lock:
+            attempts = self.matches + self.misses
+            return {
+                "attempts": attempts,
+                "matches": self.matches,
+                "misses": self.misses,
+                "hit_rate": {stage: hits / attempts if attempts else None for stage, hits in self.hits.items()},
+                "bin_hits": dict(self.bin_hits) if self.binning else None,
+                "unknown_gallery_ids": self.unknown,
+                "stage_calls": dict(self.calls),
+                "stage_mean_ms": {
+                    stage: 1000 * self.seconds[stage] / self.calls[stage] if self.calls[stage] else None
+                    for stage in STAGES
+                },
+                "last_latency_ms": None if self.last_latency is None else 1000 * self.last_latency,
+            }
@@ -0,0 +1,89 @@
+import os
+
+
+def _failure_rates(spec):
+    """Parse "image_2_tz=0.05,finger_fast_search=0.01" into a dict."""
+    rates = {}
+    for item in filter(None, spec.split(",")):
+        name, rate = item.split("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+# Database: "firebase" for the Realtime Database, "sqlite" for a local database file
+# (DATABASE_PATH), "fake" for an in-memory stand-in.
+DATABASE_BACKEND = os.environ.get("DATABASE_BACKEND", "firebase")
+DATABASE_PATH = os.environ.get("DATABASE_PATH", "fingerprints.db")
+# With the sqlite backend, also copy every write to Firebase in the background.
+DATABASE_REPLICATE = os.environ.get("DATABASE_REPLICATE", "") not in ("", "0")
+REPLICATION_BATCH_SIZE = int(os.environ.get("REPLICATION_BATCH_SIZE", "200"))
+REPLICATION_INTERVAL = float(os.environ.get("REPLICATION_INTERVAL", "1.0"))
+DATABASE_URL = os.environ.get("DATABASE_URL", "https://fingerprint-project-10f1a-default-rtdb.firebaseio.com/")
+FIREBASE_CREDENTIALS = os.environ.get("FIREBASE_CREDENTIALS", "secret.json")
+CACHE_SNAPSHOT = os.environ.get("CACHE_SNAPSHOT")  # optional on-disk copy of the fingerprints mirror
+MATCH_LOG_PATH = os.environ.get("MATCH_LOG_PATH", "match_log.db")
+MATCH_LOG_BATCH_SIZE = int(os.environ.get("MATCH_LOG_BATCH_SIZE", "200"))
+MATCH_LOG_FLUSH_INTERVAL = float(os.environ.get("MATCH_LOG_FLUSH_INTERVAL", "0.5"))
+
+# Captured images, stored by content hash and served from /images/{hash}.
+IMAGE_STORE_DIR = os.environ.get("IMAGE_STORE_DIR", "images")
+IMAGE_FORMATS = tuple(filter(None, os.environ.get("IMAGE_FORMATS", "png,webp").split(",")))  # encoded after each capture
+IMAGE_STORE_MAX_MB = float(os.environ.get("IMAGE_STORE_MAX_MB", "512"))  # 0 disables the size limit
+IMAGE_STORE_MAX_AGE_DAYS = float(os.environ.get("IMAGE_STORE_MAX_AGE_DAYS", "0"))  # 0 keeps images indefinitely
+IMAGE_ENCODE_WORKERS = int(os.environ.get("IMAGE_ENCODE_WORKERS", "2"))
+
+# Sensor: "uart" for the real reader, "simulated" for the in-process simulator,
+# "simulated-uart" for the real driver talking to the simulator over a fake serial port.
+SENSOR_BACKEND = os.environ.get("SENSOR_BACKEND", "uart")
+SENSOR_PORT = os.environ.get("SENSOR_PORT", "/dev/ttyS0")
+# Every reader attached to this gateway, comma separated; the server serves them all.
+SENSOR_PORTS = [port for port in os.environ.get("SENSOR_PORTS", SENSOR_PORT).split(",") if port]
+SENSOR_BAUDRATE = int(os.environ.get("SENSOR_BAUDRATE", "57600"))
+# Switch the sensor to this baud rate after connecting (0 keeps SENSOR_BAUDRATE).
+SENSOR_MAX_BAUDRATE = int(os.environ.get("SENSOR_MAX_BAUDRATE", "115200"))
+CAPTURE_TIMEOUT = float(os.environ.get("CAPTURE_TIMEOUT", "30"))
+CAPTURE_POLL_INTERVAL = float(os.environ.get("CAPTURE_POLL_INTERVAL", "0.02"))
+SENSOR_HEALTH_INTERVAL = float(os.environ.get("SENSOR_HEALTH_INTERVAL", "10"))  # seconds between idle-reader checks
+
+# Capture: a request places the finger up to CAPTURE_ATTEMPTS times before giving up on
+# a messy image. Images that are uploaded anyway (saved, or ranked for enrollment) are
+# rejected below CAPTURE_MIN_QUALITY (0-1, see backend/capture.py) without being templated.
+CAPTURE_ATTEMPTS = int(os.environ.get("CAPTURE_ATTEMPTS", "3"))
+CAPTURE_MIN_QUALITY = float(os.environ.get("CAPTURE_MIN_QUALITY", "0.6"))
+# Enrollment merges ENROLL_CAPTURES (1 or 2) captures into its model. With more
+# ENROLL_CANDIDATES than that, every candidate is uploaded and the best ones are used;
+# ENROLL_CANDIDATES=ENROLL_CAPTURES skips the uploads.
+ENROLL_CAPTURES = int(os.environ.get("ENROLL_CAPTURES", "2"))
+ENROLL_CANDIDATES = int(os.environ.get("ENROLL_CANDIDATES", "3"))
+
+# Matching: the sensor's own search first, then (if MATCH_GALLERY_FILE is set) the
+# host minutiae gallery when the sensor misses or is less sure than SENSOR_MIN_CONFIDENCE.
+MATCH_GALLERY_FILE = os.environ.get("MATCH_GALLERY_FILE")
+SENSOR_MIN_CONFIDENCE = int(os.environ.get("SENSOR_MIN_CONFIDENCE", "0"))
+MATCH_THRESHOLD = float(os.environ.get("MATCH_THRESHOLD", "0.2"))  # minutiae similarity, 0-1
+# Search the gallery in the probe's pattern class bins first, then their neighbours (0 scans it all).
+MATCH_BINNING = os.environ.get("MATCH_BINNING", "1") not in ("", "0")
+
+# Serialized /aliases and /matches responses are reused until the fingerprints mirror
+# changes or they are this many seconds old.
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "30"))
+RESPONSE_CACHE_ENTRIES = int(os.environ.get("RESPONSE_CACHE_ENTRIES", "1024"))
+
+# GET /events: events kept for clients resuming with Last-Event-ID, events buffered per
+# client before a slow client is disconnected, and seconds between keep-alive comments.
+EVENTS_HISTORY = int(os.environ.get("EVENTS_HISTORY", "1000"))
+EVENTS_CLIENT_BUFFER = int(os.environ.get("EVENTS_CLIENT_BUFFER", "100"))
+EVENTS_KEEPALIVE = float(os.environ.get("EVENTS_KEEPALIVE", "15"))
+
+# Add a Server-Timing header with per-stage spans to every response and log them.
+TRACE_REQUESTS = os.environ.get("TRACE_REQUESTS", "") not in ("", "0")
+
+# Simulated sensor
+SIM_CAPTURE_LATENCY = float(os.environ.get("SIM_CAPTURE_LATENCY", "0.5"))
+SIM_BAUDRATE = int(os.environ.get("SIM_BAUDRATE", "0"))  # 0 disables UART delays
+SIM_FAILURES = _failure_rates(os.environ.get("SIM_FAILURES", ""))
+SIM_POPULATION = int(os.environ.get("SIM_POPULATION", "100"))
+SIM_IMAGE_DIR = os.environ.get("SIM_IMAGE_DIR")
+SIM_SMUDGE_RATE = float(os.environ.get("SIM_SMUDGE_RATE", "0"))  # fraction of captures that come out smudged
+SIM_SEED = os.environ.get("SIM_SEED")
+SIM_SENSORS = int(os.environ.get("SIM_SENSORS", "1"))  # number of simulated readers
@@ -0,0 +1,119 @@
+import itertools
+import time
+
+import config
+import metrics
+
+_push_counter = itertools.count()
+
+
+def push_id():
+    """Unique key that sorts by creation time, like Firebase push IDs."""
+    return "-%016x%06x" % (time.time_ns() // 1000, next(_push_counter) & 0xFFFFFF)
+
+
+class InstrumentedReference:
+    """Database reference whose reads and writes are timed into metrics.DATABASE_SECONDS."""
+
+    def __init__(self, ref):
+        self._ref = ref
+
+    def __getattr__(self, attr):
+        return getattr(self._ref, attr)
+
+    def _call(self, operation, *args):
+        try:
+            with metrics.timed(metrics.DATABASE_SECONDS, operation=operation):
+                return getattr(self._ref, operation)(*args)
+        except Exception:
+            metrics.DATABASE_ERRORS.inc(operation=operation)
+            raise
+
+    def child(self, path):
+        return InstrumentedReference(self._ref.child(path))
+
+    def get(self):
+        return self._call("get")
+
+    def set(self, value):
+        return self._call("set", value)
+
+    def update(self, value):
+        return self._call("update", value)
+
+    def push(self, value=""):
+        return InstrumentedReference(self._call("push", value))
+
+    def delete(self):
+        return self._call("delete")
+
+
+class InstrumentedDatabase:
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, attr):
+        return getattr(self._db, attr)
+
+    def reference(self, path="/"):
+        return InstrumentedReference(self._db.reference(path))
+
+    def close(self):
+        close = getattr(self._db, "close", None)
+        if close is not None:
+            close()
+
+
+def open_database(backend=config.DATABASE_BACKEND):
+    """Return an object whose reference(path) works like firebase_admin.db.reference.
+
+    Reads and writes through it are recorded in the database latency metrics.
+    """
+    return InstrumentedDatabase(_open_database(backend))
+
+
+def _open_firebase():
+    import firebase_admin
+    from firebase_admin import credentials, db
+
+    cred = credentials.Certificate(config.FIREBASE_CREDENTIALS)
+    firebase_admin.initialize_app(cred, {
+        "databaseURL": config.DATABASE_URL
+    })
+    return db
+
+
+def _open_sqlite(path, replicate):
+    from sqlite_db import SQLiteDatabase
+
+    database = SQLiteDatabase(path, replicate=replicate)
+    if replicate:
+        from replicator import Replicator
+
+        firebase = _open_firebase()
+        if database.is_empty():
+            # First start on this gateway: begin from what is already in Firebase.
+            try:
+                database.load(firebase.reference("fingerprints").get())
+            except Exception as e:
+                print(f"Could not load the fingerprints tree from Firebase, starting empty: {e}")
+        database.replicator = Replicator(
+            database,
+            flush=firebase.reference("/").update,
+            batch_size=config.REPLICATION_BATCH_SIZE,
+            flush_interval=config.REPLICATION_INTERVAL,
+        )
+        database.replicator.start()
+    return database
+
+
+def _open_database(backend):
+    if backend == "fake":
+        from fake_db import FakeDatabase
+
+        return FakeDatabase()
+    if backend == "sqlite":
+        return _open_sqlite(config.DATABASE_PATH, config.DATABASE_REPLICATE)
+    if backend == "firebase":
+        return _open_firebase()
+    raise ValueError(f"Unknown database backend '{backend}'")
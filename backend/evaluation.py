@@ -0,0 +1,303 @@
+"""Offline accuracy evaluation of the minutiae matcher on a directory of captures.
+
+    python evaluation.py run DATASET --out results.json --plot det.png
+    python evaluation.py simulate DATASET --fingers 100 --impressions 4
+
+DATASET holds one subdirectory per finger, each with that finger's
+captures: sensor uploads (256x144 bytes, two 4-bit pixels per byte) or
+raw 8-bit 256x288 images as /save-image stores them (also served from
+/images/{hash}?format=raw). `simulate` writes such a directory from the
+simulated sensor.
+
+Features are extracted on a process pool. Every pair of captures of the
+same finger is scored (genuine); pairs of different fingers (impostor)
+are all scored too, or a random sample of them when there are more than
+--max-impostors. Rows are scored in blocks by the pool and only score
+histograms of HISTOGRAM_BINS steps come back, so memory does not grow
+with the number of pairs. From the histograms come the DET curve (FAR
+and FRR at every threshold), the equal error rate, the FRR at fixed FARs
+and the error rates at MATCH_THRESHOLD, which a capture's best gallery
+score has to reach to match.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import config
+import features
+from sensor import IMAGE_HEIGHT, IMAGE_SIZE, IMAGE_WIDTH, pack_image, synthetic_image, unpack_image
+
+HISTOGRAM_BINS = 1000  # thresholds are multiples of 1 / HISTOGRAM_BINS
+TARGET_FARS = (1e-2, 1e-3, 1e-4)
+BLOCK = 64  # probe rows per task
+
+# Per-process state of pool workers: descriptors and finger indices of the whole dataset.
+_worker = {}
+
+
+def read_capture(path):
+    """A capture file as an IMAGE_HEIGHT x IMAGE_WIDTH uint8 array."""
+    data = np.fromfile(path, dtype=np.uint8)
+    if len(data) == IMAGE_SIZE:
+        return unpack_image(data)
+    if len(data) == 2 * IMAGE_SIZE:
+        return data.reshape(IMAGE_HEIGHT, IMAGE_WIDTH)
+    raise ValueError(f"{path} is {len(data)} bytes, not a {IMAGE_SIZE}-byte upload or a {2 * IMAGE_SIZE}-byte image.")
+
+
+def list_dataset(root):
+    """(paths, finger names, finger index of each path), fingers being the subdirectories of root."""
+    fingers = sorted(entry.name for entry in os.scandir(root) if entry.is_dir())
+    paths, owners = [], []
+    for index, finger in enumerate(fingers):
+        directory = os.path.join(root, finger)
+        for name in sorted(os.listdir(directory)):
+            if os.path.isfile(os.path.join(directory, name)):
+                paths.append(os.path.join(directory, name))
+                owners.append(index)
+    return paths, fingers, np.array(owners, dtype=np.int64)
+
+
+def _extract_file(path):
+    return features.extract(read_capture(path))
+
+
+def extract_all(pool, paths):
+    """Descriptors of every capture, as an (n, DESCRIPTOR_SIZE) uint8 array."""
+    chunksize = max(1, len(paths) // (8 * pool._max_workers))
+    return np.stack(list(pool.map(_extract_file, paths, chunksize=chunksize)))
+
+
+def _init_worker(descriptors, owners):
+    _worker["descriptors"] = descriptors
+    _worker["owners"] = owners
+
+
+def _histogram(scores):
+    bins = np.minimum((scores * HISTOGRAM_BINS).astype(np.int64), HISTOGRAM_BINS - 1)
+    return np.bincount(bins, minlength=HISTOGRAM_BINS)
+
+
+def _score_block(start, stop, impostor_rate, seed):
+    """Histograms of the genuine and impostor scores of rows [start, stop) against the rows after each.
+
+    Impostor pairs are kept with probability impostor_rate. Returns
+    (genuine histogram, impostor histogram, comparisons).
+    """
+    descriptors, owners = _worker["descriptors"], _worker["owners"]
+    rng = np.random.default_rng([seed, start])
+    genuine = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+    impostor = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+    comparisons = 0
+    for row in range(start, stop):
+        others = np.arange(row + 1, len(descriptors))
+        same = owners[others] == owners[row]
+        keep = same | (rng.random(len(others)) < impostor_rate)
+        others, same = others[keep], same[keep]
+        if len(others) == 0:
+            continue
+        scores = features.match_scores(descriptors[row], descriptors[others])
+        genuine += _histogram(scores[same])
+        impostor += _histogram(scores[~same])
+        comparisons += len(others)
+    return genuine, impostor, comparisons
+
+
+def score_histograms(pool, descriptors, owners, max_impostors=None, seed=0):
+    """Genuine and impostor score histograms over every pair (impostors sampled down to max_impostors).
+
+    Returns (genuine, impostor, comparisons, impostor_rate).
+    """
+    n = len(descriptors)
+    fingers = np.bincount(owners)
+    genuine_pairs = int((fingers * (fingers - 1) // 2).sum())
+    impostor_pairs = n * (n - 1) // 2 - genuine_pairs
+    impostor_rate = 1.0 if not max_impostors or impostor_pairs <= max_impostors else max_impostors / impostor_pairs
+    # Row i is scored against the n - i - 1 rows after it, so later blocks have less work.
+    futures = [
+        pool.submit(_score_block, start, min(start + BLOCK, n), impostor_rate, seed)
+        for start in range(0, n, BLOCK)
+    ]
+    genuine = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+    impostor = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+    comparisons = 0
+    for future in futures:
+        g, i, c = future.result()
+        genuine += g
+        impostor += i
+        comparisons += c
+    return genuine, impostor, comparisons, impostor_rate
+
+
+def det_curve(genuine, impostor):
+    """(thresholds, FAR, FRR): a pair matches when its score is at least the threshold."""
+    thresholds = np.arange(HISTOGRAM_BINS) / HISTOGRAM_BINS
+    # Scores at or above threshold k are the counts in bins k and up.
+    far = impostor[::-1].cumsum()[::-1] / max(impostor.sum(), 1)
+    frr = 1 - genuine[::-1].cumsum()[::-1] / max(genuine.sum(), 1)
+    return thresholds, far, frr
+
+
+def equal_error_rate(thresholds, far, frr):
+    """(EER, threshold) where FAR and FRR cross, interpolated between thresholds."""
+    k = int(np.argmax(frr >= far))  # FAR falls and FRR rises with the threshold
+    if k == 0:
+        return float((far[0] + frr[0]) / 2), float(thresholds[0])
+    before, after = far[k - 1] - frr[k - 1], far[k] - frr[k]
+    w = before / (before - after) if before != after else 0.0
+    eer = far[k - 1] + w * (far[k] - far[k - 1])
+    return float(eer), float(thresholds[k - 1] + w * (thresholds[k] - thresholds[k - 1]))
+
+
+def summarize(genuine, impostor, threshold):
+    thresholds, far, frr = det_curve(genuine, impostor)
+    eer, eer_threshold = equal_error_rate(thresholds, far, frr)
+    at_far = {}
+    for target in TARGET_FARS:
+        if target * impostor.sum() < 1:
+            at_far[f"{target:g}"] = None  # too few impostor pairs to tell
+            continue
+        k = int(np.argmax(far <= target))
+        at_far[f"{target:g}"] = {"threshold": float(thresholds[k]), "frr": float(frr[k]), "far": float(far[k])}
+    k = min(int(round(threshold * HISTOGRAM_BINS)), HISTOGRAM_BINS - 1)
+    return {
+        "genuine_pairs": int(genuine.sum()),
+        "impostor_pairs": int(impostor.sum()),
+        "eer": eer,
+        "eer_threshold": eer_threshold,
+        "at_far": at_far,
+        "at_threshold": {"threshold": threshold, "far": float(far[k]), "frr": float(frr[k])},
+        "det": {"threshold": thresholds.tolist(), "far": far.tolist(), "frr": frr.tolist()},
+    }
+
+
+def plot_det(summary, path, size=480):
+    """Draw the DET curve (FRR against FAR, both on log axes) to an image file."""
+    from PIL import Image, ImageDraw  # only needed for --plot
+
+    far, frr = np.array(summary["det"]["far"]), np.array(summary["det"]["frr"])
+    low = 10.0 ** np.floor(np.log10(max(min(far[far > 0].min(initial=1), frr[frr > 0].min(initial=1)), 1e-6)))
+    margin = 48
+    span = size - 2 * margin
+
+    def point(x, y):
+        scale = np.log10(low)
+        fx = (np.log10(max(x, low)) - scale) / -scale
+        fy = (np.log10(max(y, low)) - scale) / -scale
+        return margin + fx * span, size - margin - fy * span
+
+    image = Image.new("RGB", (size, size), "white")
+    draw = ImageDraw.Draw(image)
+    decade = low
+    while decade <= 1:
+        x, y = point(decade, decade)
+        draw.line([(x, margin), (x, size - margin)], fill="#ddd")
+        draw.line([(margin, y), (size - margin, y)], fill="#ddd")
+        draw.text((x - 12, size - margin + 6), f"{decade:g}", fill="black")
+        draw.text((4, y - 6), f"{decade:g}", fill="black")
+        decade *= 10
+    draw.rectangle([margin, margin, size - margin, size - margin], outline="black")
+    draw.line([point(a, b) for a, b in zip(far, frr)], fill="#1f77b4", width=2)
+    x, y = point(summary["eer"], summary["eer"])
+    draw.ellipse([x - 4, y - 4, x + 4, y + 4], outline="#d62728", width=2)
+    draw.text((margin, 8), f"DET curve, EER {summary['eer']:.2%}", fill="black")
+    draw.text((size // 2 - 10, size - 20), "FAR", fill="black")
+    draw.text((4, margin - 20), "FRR", fill="black")
+    image.save(path)
+
+
+def run(args):
+    paths, fingers, owners = list_dataset(args.dataset)
+    if len(paths) < 2:
+        raise SystemExit(f"{args.dataset} has fewer than two captures.")
+    print(f"{len(paths)} captures of {len(fingers)} fingers")
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(args.workers, mp_context=context) as pool:
+        started = time.perf_counter()
+        descriptors = extract_all(pool, paths)
+        extract_seconds = time.perf_counter() - started
+    no_minutiae = int((descriptors.reshape(len(paths), features.MAX_MINUTIAE, 4)[:, 0, 3] == 0).sum())
+    print(f"extracted in {extract_seconds:.1f}s ({len(paths) / extract_seconds:.1f} images/s), "
+          f"{no_minutiae} without minutiae")
+
+    with ProcessPoolExecutor(args.workers, mp_context=context, initializer=_init_worker,
+                             initargs=(descriptors, owners)) as pool:
+        started = time.perf_counter()
+        genuine, impostor, comparisons, rate = score_histograms(pool, descriptors, owners, args.max_impostors,
+                                                                args.seed)
+        score_seconds = time.perf_counter() - started
+    print(f"scored {comparisons} pairs in {score_seconds:.1f}s ({comparisons / score_seconds:,.0f} comparisons/s)"
+          + (f", impostor pairs sampled at {rate:.2%}" if rate < 1 else ""))
+
+    summary = summarize(genuine, impostor, args.threshold)
+    print(f"{summary['genuine_pairs']} genuine and {summary['impostor_pairs']} impostor pairs")
+    print(f"EER {summary['eer']:.2%} at threshold {summary['eer_threshold']:.3f}")
+    for target, point in summary["at_far"].items():
+        if point is None:
+            print(f"FAR <= {float(target):g}: needs more than {summary['impostor_pairs']} impostor pairs")
+            continue
+        print(f"FAR <= {float(target):g}: threshold {point['threshold']:.3f}, FRR {point['frr']:.2%}")
+    point = summary["at_threshold"]
+    print(f"threshold {point['threshold']:.3f}: FAR {point['far']:.4%}, FRR {point['frr']:.2%}")
+
+    summary.update({
+        "dataset": os.path.abspath(args.dataset),
+        "captures": len(paths),
+        "fingers": len(fingers),
+        "no_minutiae": no_minutiae,
+        "impostor_sample_rate": rate,
+        "extract_images_per_second": len(paths) / extract_seconds,
+        "comparisons_per_second": comparisons / score_seconds,
+        "workers": args.workers,
+    })
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(summary, f, indent=1)
+        print(f"wrote {args.out}")
+    if args.plot:
+        plot_det(summary, args.plot)
+        print(f"wrote {args.plot}")
+
+
+def simulate(args):
+    """Write simulated sensor uploads in the dataset layout."""
+    for finger in range(args.fingers):
+        directory = os.path.join(args.dataset, f"{finger:05d}")
+        os.makedirs(directory, exist_ok=True)
+        for impression in range(args.impressions):
+            with open(os.path.join(directory, f"{impression}.raw"), "wb") as f:
+                f.write(pack_image(synthetic_image(finger, impression)))
+    print(f"wrote {args.fingers * args.impressions} captures of {args.fingers} fingers to {args.dataset}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    evaluate = commands.add_parser("run", help="evaluate the matcher on a dataset")
+    evaluate.add_argument("dataset")
+    evaluate.add_argument("--workers", type=int, default=os.cpu_count())
+    evaluate.add_argument("--max-impostors", type=int, default=2_000_000,
+                          help="sample impostor pairs down to about this many (0 scores them all)")
+    evaluate.add_argument("--threshold", type=float, default=config.MATCH_THRESHOLD,
+                          help="report FAR/FRR at this threshold")
+    evaluate.add_argument("--out", help="write the summary and DET curve as JSON")
+    evaluate.add_argument("--plot", help="draw the DET curve to this image file (needs Pillow)")
+    evaluate.add_argument("--seed", type=int, default=0)
+    generate = commands.add_parser("simulate", help="write a dataset of simulated captures")
+    generate.add_argument("dataset")
+    generate.add_argument("--fingers", type=int, default=100)
+    generate.add_argument("--impressions", type=int, default=4)
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        simulate(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""In-process publish/subscribe of server events, streamed to clients over SSE.
+
+Every event gets an ID of the form "<boot>-<sequence>", where boot
+identifies this run of the server. The last `history` events are kept,
+so a client that reconnects with Last-Event-ID is sent what it missed.
+If the ID is from an earlier run, or too old to still be kept, the
+client gets a "reset" event instead and should refetch its data.
+
+Each subscriber buffers at most max_pending events. A subscriber that
+falls further behind is not allowed to hold up publishers or grow
+without bound: it gets what it has buffered and then its stream ends.
+The client reconnects with the last ID it saw and catches up from the
+history.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import deque
+
+
+class Event:
+    def __init__(self, event_id, sequence, event_type, data):
+        self.id = event_id
+        self.sequence = sequence
+        self.type = event_type
+        self.data = data
+
+    def encode(self):
+        """The event in text/event-stream format."""
+        data = json.dumps(self.data, separators=(",", ":"))
+        event_id = "" if self.id is None else f"id: {self.id}\n"
+        return f"{event_id}event: {self.type}\ndata: {data}\n\n"
+
+
+class Subscription:
+    """One client's view of the bus: its pending events and whether it overflowed."""
+
+    def __init__(self, types, max_pending):
+        self.types = types
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.overflowed = False
+        self._ready = asyncio.Event()
+
+    def push(self, event):
+        if self.types is not None and event.type not in self.types:
+            return
+        if len(self.pending) >= self.max_pending:
+            self.overflowed = True
+        else:
+            self.pending.append(event)
+        self._ready.set()
+
+    async def next(self, timeout=None):
+        """Next event, or None after timeout seconds without one or once overflowed and drained."""
+        if not self.pending and not self.overflowed:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except TimeoutError:
+                return None
+        return self.pending.popleft() if self.pending else None
+
+
+class EventBus:
+    """Fan-out of published events to every subscriber, with a replay history.
+
+    publish() and subscribe() must be called from the event loop.
+    """
+
+    def __init__(self, history=1000, max_pending=100):
+        self.boot = format(int(time.time()), "x")
+        self.max_pending = max_pending
+        self._history = deque(maxlen=history)
+        self._sequence = itertools.count(1)
+        self._subscribers = set()
+        self.published = 0
+        self.overflows = 0
+
+    def publish(self, event_type, data):
+        sequence = next(self._sequence)
+        event = Event(f"{self.boot}-{sequence}", sequence, event_type, data)
+        self._history.append(event)
+        self.published += 1
+        for subscription in self._subscribers:
+            overflowed = subscription.overflowed
+            subscription.push(event)
+            if subscription.overflowed and not overflowed:
+                self.overflows += 1
+        return event
+
+    def subscribe(self, last_event_id=None, types=None):
+        """Subscribe to events of the given types (default all).
+
+        With last_event_id, the events published since it are queued first,
+        or a "reset" event if they can no longer be replayed.
+        """
+        subscription = Subscription(None if types is None else frozenset(types), self.max_pending)
+        if last_event_id:
+            missed = self._since(last_event_id)
+            if missed is None:
+                subscription.pending.append(Event(None, None, "reset", {"reason": "history unavailable"}))
+            else:
+                for event in missed:
+                    subscription.push(event)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscribers.discard(subscription)
+
+    def _since(self, last_event_id):
+        boot, _, sequence = last_event_id.rpartition("-")
+        if boot != self.boot or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        oldest = self._history[0].sequence if self._history else sequence + 1
+        latest = self._history[-1].sequence if self._history else sequence
+        if not oldest - 1 <= sequence <= latest:
+            return None
+        return [event for event in self._history if event.sequence > sequence]
+
+    def stats(self):
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "overflows": self.overflows,
+            "history": len(self._history),
+        }
@@ -0,0 +1,128 @@
+import copy
+import threading
+
+from database import push_id
+
+
+def _split(path):
+    return [part for part in path.split("/") if part]
+
+
+class Event:
+    """Mirror of firebase_admin.db.Event."""
+
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class ListenerRegistration:
+    def __init__(self, database, listener):
+        self._database = database
+        self._listener = listener
+
+    def close(self):
+        with self._database.lock:
+            if self._listener in self._database.listeners:
+                self._database.listeners.remove(self._listener)
+
+
+class FakeDatabase:
+    """In-memory stand-in for the Firebase Realtime Database.
+
+    reference() returns objects with the same get/set/update/push/delete/
+    child/listen methods as firebase_admin.db.Reference, so code can run
+    against it without network access or credentials. Listeners are called
+    synchronously with put/patch events, like the Firebase streaming API.
+    """
+
+    def __init__(self, data=None):
+        self.root = copy.deepcopy(data) if data else {}
+        self.lock = threading.RLock()
+        self.listeners = []
+        self.reads = 0
+        self.writes = 0
+
+    def reference(self, path="/"):
+        return FakeReference(self, _split(path))
+
+    def _node(self, parts):
+        node = self.root
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def _write(self, parts, value):
+        self.writes += 1
+        if not parts:
+            self.root = value if isinstance(value, dict) else {}
+            return
+        node = self.root
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            node = node[part]
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+
+    def _notify(self, event_type, parts, data):
+        for listener_parts, callback in list(self.listeners):
+            if parts[:len(listener_parts)] == listener_parts:
+                relative = "/" + "/".join(parts[len(listener_parts):])
+                callback(Event(event_type, relative, copy.deepcopy(data)))
+            elif listener_parts[:len(parts)] == parts:
+                # A write above the listened-to node replaces it entirely.
+                callback(Event("put", "/", copy.deepcopy(self._node(listener_parts))))
+
+
+class FakeReference:
+    def __init__(self, database, parts):
+        self._database = database
+        self._parts = parts
+
+    @property
+    def key(self):
+        return self._parts[-1] if self._parts else None
+
+    @property
+    def path(self):
+        return "/" + "/".join(self._parts)
+
+    def child(self, path):
+        return FakeReference(self._database, self._parts + _split(path))
+
+    def get(self):
+        with self._database.lock:
+            self._database.reads += 1
+            return copy.deepcopy(self._database._node(self._parts))
+
+    def set(self, value):
+        with self._database.lock:
+            self._database._write(self._parts, copy.deepcopy(value))
+            self._database._notify("put", self._parts, value)
+
+    def update(self, value):
+        with self._database.lock:
+            for key, child in value.items():
+                self._database._write(self._parts + _split(key), copy.deepcopy(child))
+            self._database._notify("patch", self._parts, value)
+
+    def push(self, value=""):
+        ref = self.child(push_id())
+        ref.set(value)
+        return ref
+
+    def delete(self):
+        self.set(None)
+
+    def listen(self, callback):
+        with self._database.lock:
+            listener = (self._parts, callback)
+            self._database.listeners.append(listener)
+            callback(Event("put", "/", copy.deepcopy(self._database._node(self._parts))))
+        return ListenerRegistration(self._database, listener)
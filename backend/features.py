@@ -0,0 +1,339 @@
+"""Minutiae extraction and matching for raw sensor images.
+
+    image -> normalize -> orientation field -> Gabor enhancement
+          -> binarize -> thin -> crossing-number minutiae -> descriptor
+
+Every stage works on whole arrays. A descriptor is MAX_MINUTIAE rows of
+(x, y, angle, kind) uint8, DESCRIPTOR_SIZE bytes in total, so it fits a
+uint8 Gallery/MappedGallery row. Positions are stored at half resolution
+so a 288-pixel-high image fits in a byte; angles are ridge orientations in
+[0, pi) scaled to 0..255; kind is ENDING, BIFURCATION or 0 for an unused row.
+
+match_scores() aligns a probe against many descriptors at once with a
+Hough vote over rotation and translation, then counts the minutiae pairs
+that agree with the winning alignment.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from sensor import IMAGE_HEIGHT, IMAGE_WIDTH
+
+BLOCK = 8
+MAX_MINUTIAE = 64
+DESCRIPTOR_SIZE = MAX_MINUTIAE * 4
+ENDING = 1
+BIFURCATION = 2
+
+GABOR_ORIENTATIONS = 16
+# Multiples of the image's ridge frequency each block chooses between in enhance().
+FREQUENCY_SCALES = (0.8, 1.0, 1.25)
+MIN_MINUTIA_DISTANCE = 6
+MAX_ROTATION = 0.35
+MAX_TRANSLATION = 96
+DISTANCE_TOLERANCE = 8
+ANGLE_TOLERANCE = 0.3
+
+
+def _box_filter(a, radius):
+    """Sum over a (2r+1)x(2r+1) window, zero padded, via cumulative sums."""
+    padded = np.pad(a, ((radius + 1, radius), (radius + 1, radius)))
+    c = padded.cumsum(axis=0).cumsum(axis=1)
+    n = 2 * radius + 1
+    return c[n:, n:] - c[:-n, n:] - c[n:, :-n] + c[:-n, :-n]
+
+
+def _blocks(a):
+    h, w = a.shape
+    return a.reshape(h // BLOCK, BLOCK, w // BLOCK, BLOCK)
+
+
+def _upsample(a):
+    return np.repeat(np.repeat(a, BLOCK, axis=0), BLOCK, axis=1)
+
+
+def segment(image):
+    """Boolean foreground mask per BLOCK x BLOCK block, from local contrast."""
+    std = _blocks(image).std(axis=(1, 3))
+    mask = std > 0.4 * np.percentile(std, 90)
+    # Fill pinholes and drop isolated blocks: keep blocks with a mostly-foreground neighbourhood.
+    return _box_filter(mask.astype(np.float32), 1) >= 5
+
+
+def normalize(image, mask):
+    """Zero-mean, unit-variance image over the foreground; background is 0."""
+    pixels = _upsample(mask)
+    fg = image[pixels]
+    out = (image - fg.mean()) / (fg.std() + 1e-6)
+    out[~pixels] = 0
+    return out
+
+
+def orientation_field(image, mask):
+    """Per-block ridge orientation in [0, pi) and its coherence in [0, 1].
+
+    Uses the averaged squared gradient, smoothed over 3x3 blocks.
+    """
+    gy, gx = np.gradient(image)
+    gxx = _blocks(gx * gx - gy * gy).sum(axis=(1, 3))
+    gxy = _blocks(2 * gx * gy).sum(axis=(1, 3))
+    energy = _blocks(gx * gx + gy * gy).sum(axis=(1, 3))
+    gxx, gxy, energy = (_box_filter(a * mask, 1) for a in (gxx, gxy, energy))
+    # Gradients point across ridges; ridges run perpendicular to them.
+    theta = (0.5 * np.arctan2(gxy, gxx) + np.pi / 2) % np.pi
+    coherence = np.hypot(gxx, gxy) / (energy + 1e-6)
+    return theta, coherence
+
+
+def ridge_frequency(image, mask):
+    """Dominant ridge frequency (cycles/pixel) from the image power spectrum."""
+    spectrum = np.abs(np.fft.rfft2(image)) ** 2
+    fy = np.fft.fftfreq(image.shape[0])[:, None]
+    fx = np.fft.rfftfreq(image.shape[1])[None, :]
+    radius = np.hypot(fx, fy)
+    band = (radius > 1 / 16) & (radius < 1 / 4)
+    bins = np.round(radius[band] * 256).astype(np.int64)
+    # Mean rather than total power per ring, or the larger outer rings always win.
+    power = np.bincount(bins, weights=spectrum[band]) / np.maximum(np.bincount(bins), 1)
+    return np.argmax(power) / 256
+
+
+@lru_cache(maxsize=48)
+def _gabor_bank(frequency, shape):
+    """FFTs of GABOR_ORIENTATIONS even Gabor kernels, padded to shape.
+
+    ridge_frequency() only returns multiples of 1/256, so this is cached.
+    """
+    sigma = 0.5 / frequency
+    radius = int(np.ceil(2 * sigma))
+    y, x = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    angles = np.arange(GABOR_ORIENTATIONS) * np.pi / GABOR_ORIENTATIONS
+    # Distance across the ridge for a ridge running at each angle.
+    across = -x[None] * np.sin(angles)[:, None, None] + y[None] * np.cos(angles)[:, None, None]
+    kernels = np.exp(-(x * x + y * y)[None] / (2 * sigma * sigma)) * np.cos(2 * np.pi * frequency * across)
+    kernels -= kernels.mean(axis=(1, 2), keepdims=True)
+    # Unit energy, so responses at different frequencies can be compared.
+    kernels /= np.sqrt((kernels * kernels).sum(axis=(1, 2), keepdims=True))
+    # Single precision, so enhance() runs its inverse transforms in float32 at twice the speed.
+    padded = np.zeros((GABOR_ORIENTATIONS,) + shape, dtype=np.float32)
+    padded[:, :2 * radius + 1, :2 * radius + 1] = kernels
+    # Centre the kernels on the origin so filtering doesn't shift the image.
+    padded = np.roll(padded, (-radius, -radius), axis=(1, 2))
+    return np.fft.rfft2(padded)
+
+
+def enhance(image, theta, mask, frequency):
+    """Filter each pixel with the Gabor kernel matching its block's orientation.
+
+    Ridge spacing varies across a finger, so each block also picks whichever
+    of FREQUENCY_SCALES x frequency gives it the strongest response.
+    """
+    spectrum = np.fft.rfft2(image.astype(np.float32))[None]
+    index = _upsample(np.round(theta / np.pi * GABOR_ORIENTATIONS).astype(np.int64) % GABOR_ORIENTATIONS)[None]
+    candidates = np.stack([
+        np.take_along_axis(np.fft.irfft2(spectrum * _gabor_bank(round(frequency * scale * 256) / 256, image.shape),
+                                         s=image.shape), index, axis=0)[0]
+        for scale in FREQUENCY_SCALES
+    ])
+    energy = (candidates * candidates).reshape(len(FREQUENCY_SCALES), *_blocks(image).shape).sum(axis=(2, 4))
+    choice = _upsample(energy.argmax(axis=0))[None]
+    enhanced = np.take_along_axis(candidates, choice, axis=0)[0]
+    enhanced[~_upsample(mask)] = 0
+    return enhanced
+
+
+def _neighbours(skeleton):
+    """P2..P9 of every pixel, clockwise from north, as a (8, h, w) array."""
+    p = np.pad(skeleton, 1)
+    h, w = skeleton.shape
+    offsets = ((0, 1), (0, 2), (1, 2), (2, 2), (2, 1), (2, 0), (1, 0), (0, 0))
+    return np.stack([p[dy:dy + h, dx:dx + w] for dy, dx in offsets])
+
+
+def _thinning_tables():
+    """Zhang-Suen removal rule for each step, indexed by the 8-neighbour code.
+
+    The code has bit k set when neighbour P(k + 2) is a ridge pixel.
+    """
+    n = (np.arange(256)[None] >> np.arange(8)[:, None]) & 1
+    count = n.sum(axis=0)
+    transitions = ((n == 0) & (np.roll(n, -1, axis=0) == 1)).sum(axis=0)
+    p2, p4, p6, p8 = n[0], n[2], n[4], n[6]
+    candidate = (count >= 2) & (count <= 6) & (transitions == 1)
+    return (candidate & (p2 * p4 * p6 == 0) & (p4 * p6 * p8 == 0),
+            candidate & (p2 * p4 * p8 == 0) & (p2 * p6 * p8 == 0))
+
+
+_THINNING_TABLES = _thinning_tables()
+
+
+def thin(binary):
+    """Zhang-Suen thinning to one-pixel-wide ridges."""
+    skeleton = binary.copy()
+    while True:
+        changed = False
+        for table in _THINNING_TABLES:
+            n = _neighbours(skeleton.view(np.uint8))
+            code = n[0].copy()
+            for k in range(1, 8):
+                code |= n[k] << k
+            remove = skeleton & table[code]
+            if remove.any():
+                skeleton &= ~remove
+                changed = True
+        if not changed:
+            return skeleton
+
+
+def find_minutiae(skeleton, theta, coherence, mask):
+    """(x, y, angle, kind) float rows for ridge endings and bifurcations."""
+    n = _neighbours(skeleton).astype(np.int8)
+    crossings = np.abs(n - np.roll(n, -1, axis=0)).sum(axis=0) // 2
+    candidate = skeleton & ((crossings == 1) | (crossings == 3))
+    # Ridges are cut off at the edge of the print; ignore the outermost blocks.
+    inner = _box_filter(mask.astype(np.float32), 1) >= 9
+    candidate &= _upsample(inner)
+    ys, xs = np.nonzero(candidate)
+    if len(xs) == 0:
+        return np.empty((0, 4))
+
+    # Breaks and bridges show up as pairs of minutiae very close together.
+    d = np.hypot(xs[:, None] - xs[None], ys[:, None] - ys[None])
+    np.fill_diagonal(d, np.inf)
+    keep = d.min(axis=1) >= MIN_MINUTIA_DISTANCE
+    xs, ys = xs[keep], ys[keep]
+    by, bx = ys // BLOCK, xs // BLOCK
+    kind = np.where(crossings[ys, xs] == 1, ENDING, BIFURCATION)
+    minutiae = np.stack([xs, ys, theta[by, bx], kind], axis=1).astype(np.float64)
+
+    # Keep the ones in the most reliable parts of the orientation field.
+    order = np.argsort(-coherence[by, bx], kind="stable")[:MAX_MINUTIAE]
+    return minutiae[order]
+
+
+def encode(minutiae):
+    """Pack minutiae into a DESCRIPTOR_SIZE uint8 descriptor."""
+    descriptor = np.zeros((MAX_MINUTIAE, 4), dtype=np.uint8)
+    m = minutiae[:MAX_MINUTIAE]
+    descriptor[:len(m), 0] = np.clip(np.round(m[:, 0] / 2), 0, 255)
+    descriptor[:len(m), 1] = np.clip(np.round(m[:, 1] / 2), 0, 255)
+    descriptor[:len(m), 2] = np.round(m[:, 2] / np.pi * 256).astype(np.int64) % 256
+    descriptor[:len(m), 3] = m[:, 3]
+    return descriptor.reshape(DESCRIPTOR_SIZE)
+
+
+def decode(descriptor):
+    """Inverse of encode(): (x, y, angle, kind) float rows, unused rows dropped."""
+    d = np.asarray(descriptor, dtype=np.uint8).reshape(MAX_MINUTIAE, 4)
+    d = d[d[:, 3] != 0].astype(np.float64)
+    d[:, :2] *= 2
+    d[:, 2] *= np.pi / 256
+    return d
+
+
+def extract(image):
+    """Minutiae descriptor for a raw sensor image (bytes, list or array)."""
+    image = np.asarray(image, dtype=np.float32).reshape(IMAGE_HEIGHT, IMAGE_WIDTH)
+    mask = segment(image)
+    normalized = normalize(image, mask)
+    theta, coherence = orientation_field(normalized, mask)
+    enhanced = enhance(normalized, theta, mask, ridge_frequency(normalized, mask))
+    # Ridges are dark on the sensor, so they are the negative filter responses.
+    skeleton = thin((enhanced < 0) & _upsample(mask))
+    return encode(find_minutiae(skeleton, theta, coherence, mask))
+
+
+# Orientation differences are kept in descriptor angle units (pi/256 rad):
+# uint8 subtraction wraps them modulo pi for free, and viewed as int8 they
+# fall in [-pi/2, pi/2). These tables map such a difference to what the
+# matcher needs without any per-pair trigonometry.
+_ANGLE_UNIT = np.pi / 256
+_ANGLES = np.arange(256, dtype=np.uint8).view(np.int8).astype(np.float32)
+_COS = np.cos(_ANGLES * _ANGLE_UNIT).astype(np.float32)
+_SIN = np.sin(_ANGLES * _ANGLE_UNIT).astype(np.float32)
+
+
+def match_scores(probe, descriptors, chunk=512):
+    """Similarity in [0, 1] between probe and each row of descriptors.
+
+    For every candidate, each pairing of a probe minutia with a candidate
+    minutia votes for the rotation and translation that would align them.
+    The most-voted alignment is applied and the minutiae that then agree in
+    position and orientation are counted; the score is
+    matched^2 / (probe_count * candidate_count).
+
+    Only about a fifth of the pairings imply a rotation within
+    MAX_ROTATION, so those are picked out first, with uint8 arithmetic,
+    and everything after that works on the short list of them.
+    """
+    probe = np.asarray(probe, dtype=np.uint8).reshape(MAX_MINUTIAE, 4)
+    probe = probe[probe[:, 3] != 0]
+    descriptors = np.asarray(descriptors, dtype=np.uint8).reshape(-1, MAX_MINUTIAE, 4)
+    scores = np.zeros(len(descriptors), dtype=np.float32)
+    if len(probe) == 0:
+        return scores
+    n = len(probe)
+    # Rotate about the image centre so small angle errors don't throw off the translation.
+    cx, cy = IMAGE_WIDTH / 2, IMAGE_HEIGHT / 2
+    px = 2 * probe[:, 0].astype(np.float32) - cx
+    py = 2 * probe[:, 1].astype(np.float32) - cy
+    width = 2 * DISTANCE_TOLERANCE
+    nt = 2 * MAX_TRANSLATION // width
+    max_rotation = MAX_ROTATION / _ANGLE_UNIT
+    angle_tolerance = ANGLE_TOLERANCE / _ANGLE_UNIT
+    na = int(np.ceil(2 * max_rotation / angle_tolerance))
+    angle_bins = np.where(np.abs(_ANGLES) < max_rotation,
+                          np.floor((_ANGLES + max_rotation) / angle_tolerance), -1).astype(np.int32)
+    # |rotation| < max_rotation, as one uint8 add and compare: rotation + reach <= 2 * reach.
+    reach = np.uint8(np.ceil(max_rotation) - 1)
+    n_bins = nt * nt * na
+
+    for start in range(0, len(descriptors), chunk):
+        block = descriptors[start:start + chunk]
+        counts = (block[:, :, 3] != 0).sum(axis=1)
+        # encode() fills rows from the front, so trailing columns are all padding.
+        m = max(counts.max(), 1)
+        block = block[:, :m]
+        k = len(block)
+
+        # Pairs (candidate c, probe minutia i, candidate minutia j) whose rotation is in range.
+        rotation = block[:, None, :, 2] - probe[None, :, 2, None]
+        in_range = ((rotation + reach) <= 2 * reach) & (block[:, None, :, 3] != 0)
+        pairs = np.flatnonzero(in_range).astype(np.int32)
+        c, i, j = pairs // (n * m), pairs // m % n, pairs % m
+        rotation = rotation.reshape(-1)[pairs]
+
+        # Alignment implied by each pair.
+        cos, sin = _COS[rotation], _SIN[rotation]
+        tx = 2 * block[c, j, 0].astype(np.float32) - cx - (cos * px[i] - sin * py[i])
+        ty = 2 * block[c, j, 1].astype(np.float32) - cy - (sin * px[i] + cos * py[i])
+        bin_x = np.floor((tx + MAX_TRANSLATION) / width).astype(np.int32)
+        bin_y = np.floor((ty + MAX_TRANSLATION) / width).astype(np.int32)
+        voting = (bin_x >= 0) & (bin_x < nt) & (bin_y >= 0) & (bin_y < nt)
+        c, i, j, tx, ty, rotation = c[voting], i[voting], j[voting], tx[voting], ty[voting], rotation[voting]
+        flat = ((c * na + angle_bins[rotation]) * nt + bin_y[voting]) * nt + bin_x[voting]
+        votes = np.bincount(flat, minlength=k * n_bins).reshape(k, n_bins)
+        best = votes.argmax(axis=1) + np.arange(k) * n_bins
+        # Refine the winning bin to the mean alignment of the pairs that voted for it.
+        rotation = rotation.view(np.int8).astype(np.float32)
+        winners = flat == best[c]
+        n_winners = np.maximum(np.bincount(c[winners], minlength=k), 1)
+        best_a, best_x, best_y = (np.bincount(c[winners], weights=a[winners], minlength=k) / n_winners
+                                  for a in (rotation, tx, ty))
+
+        # Pairs consistent with the winning alignment, counted one-to-one.
+        agree = ((np.abs(rotation - best_a[c]) <= angle_tolerance)
+                 & (np.abs(tx - best_x[c]) <= DISTANCE_TOLERANCE)
+                 & (np.abs(ty - best_y[c]) <= DISTANCE_TOLERANCE))
+        probe_matched = np.zeros((k, n), dtype=bool)
+        probe_matched[c[agree], i[agree]] = True
+        candidate_matched = np.zeros((k, m), dtype=bool)
+        candidate_matched[c[agree], j[agree]] = True
+        matched = np.minimum(probe_matched.sum(axis=1), candidate_matched.sum(axis=1))
+        scores[start:start + k] = matched ** 2 / (n * np.maximum(counts, 1))
+    return scores
+
+
+def match(probe, candidate):
+    """Similarity in [0, 1] between two descriptors."""
+    return float(match_scores(probe, candidate)[0])
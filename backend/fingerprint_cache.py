@@ -0,0 +1,155 @@
+import copy
+import json
+import os
+import threading
+
+from match_index import MatchIndex
+
+
+def _split(path):
+    return [part for part in path.split("/") if part]
+
+
+def _normalize(fingerprints):
+    """Firebase returns integer-keyed nodes as lists; key everything by string ID."""
+    if isinstance(fingerprints, list):
+        return {str(i): data for i, data in enumerate(fingerprints) if data}
+    return dict(fingerprints or {})
+
+
+class FingerprintCache:
+    """Local mirror of the database's fingerprints tree.
+
+    The mirror is filled from the first listener event and then kept fresh by
+    the put/patch events that follow, so reads never go to the network.
+    Writes go to the database first and are then applied locally, so a
+    request sees its own write even before the listener echoes it back.
+    If snapshot_path is set the mirror is saved there on close() and loaded
+    on start(), so a restart can serve reads before the first sync arrives.
+    A MatchIndex is kept in step with the mirror for match history queries,
+    and version counts the changes applied to the mirror.
+    """
+
+    def __init__(self, ref, snapshot_path=None, sync_timeout=30):
+        self._ref = ref
+        self._snapshot_path = snapshot_path
+        self._sync_timeout = sync_timeout
+        self._lock = threading.RLock()
+        self._synced = threading.Event()
+        self._fingerprints = {}
+        self._index = MatchIndex()
+        self._listener = None
+        self.version = 0
+
+    def start(self):
+        if self._snapshot_path and os.path.exists(self._snapshot_path):
+            with open(self._snapshot_path) as f:
+                self._fingerprints = json.load(f)
+            self._index.rebuild(self._fingerprints)
+            self._synced.set()
+        self._listener = self._ref.listen(self._on_event)
+        if not self._synced.wait(self._sync_timeout):
+            raise RuntimeError("Timed out waiting for the fingerprints tree to sync.")
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        if self._snapshot_path:
+            self.save()
+
+    def save(self):
+        """Write the mirror to snapshot_path atomically."""
+        with self._lock:
+            data = json.dumps(self._fingerprints)
+        tmp_path = self._snapshot_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self._snapshot_path)
+
+    def _on_event(self, event):
+        parts = _split(event.path)
+        if event.event_type == "put":
+            self._apply(parts, event.data)
+        elif event.event_type == "patch":
+            for key, value in event.data.items():
+                self._apply(parts + _split(key), value)
+        self._synced.set()
+
+    def _apply(self, parts, value):
+        with self._lock:
+            self.version += 1
+            if not parts:
+                self._fingerprints = _normalize(value)
+                self._index.rebuild(self._fingerprints)
+                return
+            node = self._fingerprints
+            for part in parts[:-1]:
+                if not isinstance(node.get(part), dict):
+                    if value is None:
+                        return
+                    node[part] = {}
+                node = node[part]
+            if value is None:
+                node.pop(parts[-1], None)
+            else:
+                node[parts[-1]] = value
+            self._reindex(parts, value)
+
+    def _reindex(self, parts, value):
+        fingerprint_id = parts[0]
+        if len(parts) == 3 and parts[1] == "matches" and isinstance(value, dict) and "timestamp" in value:
+            # A single pushed match: insert it instead of re-sorting the history.
+            if self._index.add_match(fingerprint_id, parts[2], value["timestamp"]):
+                return
+        self._index.index_fingerprint(fingerprint_id, self._fingerprints.get(fingerprint_id))
+
+    def set(self, fingerprint_id, value):
+        self._ref.child(str(fingerprint_id)).set(value)
+        self._apply([str(fingerprint_id)], copy.deepcopy(value))
+
+    def delete(self, fingerprint_id):
+        self._ref.child(str(fingerprint_id)).delete()
+        self._apply([str(fingerprint_id)], None)
+
+    def update(self, values):
+        """Write several paths below the fingerprints node in one request; None deletes."""
+        self._ref.update({str(path): value for path, value in values.items()})
+        for path, value in values.items():
+            self._apply(_split(str(path)), copy.deepcopy(value))
+
+    def add_match(self, fingerprint_id, match_id, match):
+        """Show a match locally before MatchLog has written it to the database."""
+        self._apply([str(fingerprint_id), "matches", match_id], copy.deepcopy(match))
+
+    def get(self, fingerprint_id):
+        with self._lock:
+            return copy.deepcopy(self._fingerprints.get(str(fingerprint_id)))
+
+    def __contains__(self, fingerprint_id):
+        with self._lock:
+            return str(fingerprint_id) in self._fingerprints
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+    def aliases(self):
+        """All enrolled fingerprint IDs and their aliases, ordered by ID."""
+        with self._lock:
+            return [
+                {"id": int(fingerprint_id), "alias": data.get("alias", "Unknown")}
+                for fingerprint_id, data in sorted(self._fingerprints.items(), key=lambda item: int(item[0]))
+            ]
+
+    def matches(self, alias, since=None, until=None, limit=None, cursor=None):
+        """Recorded matches for fingerprints enrolled under alias, oldest first.
+
+        Returns (matches, next_cursor); see MatchIndex.query for the filters.
+        """
+        with self._lock:
+            page, next_cursor = self._index.query(alias, since, until, limit, cursor)
+        matches = [
+            {"fingerprint_id": fingerprint_id, "match_id": match_id, "timestamp": timestamp}
+            for timestamp, fingerprint_id, match_id in page
+        ]
+        return matches, next_cursor
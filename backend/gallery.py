@@ -0,0 +1,241 @@
+import numpy as np
+
+UNBINNED = 255  # bin of rows enrolled without one; every binned search includes them
+
+
+class Gallery:
+    """Enrolled feature vectors for host-side 1:N search.
+
+    Vectors live in one preallocated matrix (float32 by default, or uint8 for
+    pixel/byte features) that doubles when full, so enrolling is an O(dim)
+    row write instead of a model refit. Removing a
+    label only marks its row dead (a tombstone); once more than half the rows
+    are dead they are compacted away. Search computes squared Euclidean
+    distances to every live row with a single matrix-vector product, or goes
+    through an IVFIndex once build_index() has been called. Each row also
+    has a bin (see pattern_class.py) that searches can be restricted to.
+    """
+
+    def __init__(self, dim, capacity=1024, dtype=np.float32):
+        self.dim = dim
+        self._features = np.empty((capacity, dim), dtype=dtype)
+        self._norms = np.empty(capacity, dtype=np.float32)
+        self._labels = np.zeros(capacity, dtype=np.int64)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._bins = np.full(capacity, UNBINNED, dtype=np.uint8)
+        self._size = 0
+        self._rows = {}
+        self.index = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, label):
+        return label in self._rows
+
+    def labels(self):
+        return sorted(self._rows)
+
+    def features(self, label):
+        return self._features[self._rows[label]].copy()
+
+    def bin(self, label):
+        return int(self._bins[self._rows[label]])
+
+    def rows(self, bins=None):
+        """Indices of the live rows, only those in bins (or UNBINNED) if given."""
+        alive = self._alive[:self._size]
+        if bins is not None:
+            alive = alive & np.isin(self._bins[:self._size], [*bins, UNBINNED])
+        return np.flatnonzero(alive)
+
+    def entries(self, bins=None):
+        """(labels, features) of the live rows (in bins, if given), for matchers that don't use distances()."""
+        live = self.rows(bins)
+        return self._labels[live], self._features[live]
+
+    def _grow(self):
+        capacity = max(2 * len(self._features), 1)
+        for name in ("_features", "_norms", "_labels", "_alive", "_bins"):
+            old = getattr(self, name)
+            new = np.full((capacity,) + old.shape[1:], UNBINNED if name == "_bins" else 0, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def add(self, label, features, bin=UNBINNED):
+        """Enroll features under label (in the given bin), replacing any previous entry."""
+        features = np.asarray(features).reshape(self.dim).astype(self._features.dtype)
+        if self._size == len(self._features):
+            self._grow()
+        row = self._size
+        self._features[row] = features
+        self._norms[row] = np.dot(features, features.astype(np.float32))
+        self._labels[row] = label
+        self._bins[row] = bin
+        self._alive[row] = True
+        self._size += 1
+        self._commit()
+        # Only retire the previous entry once the new one is in place.
+        previous = self._rows.get(label)
+        self._rows[label] = row
+        if self.index is not None:
+            self.index.add(row)
+        if previous is not None:
+            self._tombstone(previous)
+
+    def remove(self, label):
+        """Drop label from the gallery; returns False if it was not enrolled."""
+        row = self._rows.pop(label, None)
+        if row is None:
+            return False
+        self._tombstone(row)
+        return True
+
+    def _tombstone(self, row):
+        self._alive[row] = False
+        self._commit()
+        if self._size > 64 and len(self._rows) < self._size // 2:
+            self.compact()
+
+    def _commit(self):
+        """Called after every change; subclasses that persist the matrix sync it here."""
+
+    def compact(self):
+        """Move live rows to the front, discarding tombstones."""
+        live = np.flatnonzero(self._alive[:self._size])
+        n = len(live)
+        self._features[:n] = self._features[live]
+        self._norms[:n] = self._norms[live]
+        self._labels[:n] = self._labels[live]
+        self._bins[:n] = self._bins[live]
+        self._alive[:n] = True
+        self._alive[n:self._size] = False
+        self._size = n
+        self._rows = {int(label): row for row, label in enumerate(self._labels[:n])}
+        if self.index is not None:
+            self.index.rebuild()
+
+    def _dot(self, rows, probe, block=1024):
+        if self._features.dtype == np.float32:
+            return self._features[rows] @ probe
+        # Convert small blocks at a time so non-float matrices never need a float copy.
+        if isinstance(rows, slice):
+            rows = range(*rows.indices(self._size))
+        out = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), block):
+            out[start:start + block] = self._features[rows[start:start + block]].astype(np.float32) @ probe
+        return out
+
+    def distances(self, probe, rows=None):
+        """Squared Euclidean distance from probe to the given rows (default: all used rows).
+
+        Dead rows come back as +inf.
+        """
+        probe = np.asarray(probe, dtype=np.float32).reshape(self.dim)
+        if rows is None:
+            rows = slice(0, self._size)
+        d = self._norms[rows] - 2 * self._dot(rows, probe) + probe @ probe
+        np.maximum(d, 0, out=d)
+        d[~self._alive[rows]] = np.inf
+        return d
+
+    def search(self, probe, k=1):
+        """Return (labels, distances) of the k nearest enrolled vectors, nearest first.
+
+        distances are Euclidean, like KNeighborsClassifier.kneighbors.
+        """
+        if self.index is not None:
+            rows, d = self.index.search(probe, k)
+        else:
+            d = self.distances(probe)
+            rows = np.arange(self._size)
+        keep = np.isfinite(d)
+        rows, d = rows[keep], d[keep]
+        k = min(k, len(d))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        nearest = np.argpartition(d, k - 1)[:k]
+        nearest = nearest[np.argsort(d[nearest])]
+        return self._labels[rows[nearest]], np.sqrt(d[nearest])
+
+    def build_index(self, nlist=None, nprobe=8):
+        """Switch search() to an approximate IVF index (worthwhile from ~100k entries)."""
+        self.index = IVFIndex(self, nlist=nlist, nprobe=nprobe)
+        self.index.rebuild()
+        return self.index
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest neighbour index over a Gallery.
+
+    Rows are bucketed by their nearest k-means centroid; a query computes
+    exact distances only for the rows in its nprobe closest buckets. New rows
+    are assigned to the existing centroids; the centroids are retrained when
+    the gallery has doubled since the last rebuild.
+    """
+
+    def __init__(self, gallery, nlist=None, nprobe=8, iterations=10, seed=0):
+        self.gallery = gallery
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self._rng = np.random.default_rng(seed)
+        self.centroids = None
+        self._lists = []
+        self._pending = []
+        self._trained_size = 0
+
+    def rebuild(self):
+        g = self.gallery
+        live = np.flatnonzero(g._alive[:g._size])
+        nlist = self.nlist or max(1, int(np.sqrt(len(live))))
+        nlist = min(nlist, max(len(live), 1))
+        sample = live if len(live) <= 256 * nlist else self._rng.choice(live, 256 * nlist, replace=False)
+        vectors = g._features[sample].astype(np.float32)
+        if len(vectors):
+            centroids = vectors[self._rng.choice(len(vectors), nlist, replace=False)].copy()
+        else:
+            centroids = np.zeros((1, g.dim), dtype=np.float32)
+        for _ in range(self.iterations):
+            assignment = self._nearest(vectors, centroids, 1)[:, 0]
+            counts = np.bincount(assignment, minlength=len(centroids))
+            starts = np.cumsum(counts) - counts
+            filled = counts > 0
+            sums = np.add.reduceat(vectors[np.argsort(assignment, kind="stable")], starts[filled], axis=0)
+            centroids[filled] = sums / counts[filled, None]
+        self.centroids = centroids.astype(np.float32)
+        assignment = self._nearest(g._features[live], self.centroids, 1)[:, 0] if len(live) else np.empty(0, int)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(len(self.centroids) + 1))
+        self._lists = [live[order[bounds[i]:bounds[i + 1]]] for i in range(len(self.centroids))]
+        self._pending = [[] for _ in self._lists]
+        self._trained_size = max(len(live), 1)
+
+    @staticmethod
+    def _nearest(vectors, centroids, n, block=8192):
+        """Indices of the n nearest centroids for each vector, in blocks to bound memory."""
+        n = min(n, centroids.shape[0])
+        norms = (centroids * centroids).sum(axis=1)
+        out = np.empty((len(vectors), n), dtype=np.int64)
+        for start in range(0, len(vectors), block):
+            d = norms - 2 * (vectors[start:start + block].astype(np.float32) @ centroids.T)
+            out[start:start + block] = np.argpartition(d, n - 1, axis=1)[:, :n]
+        return out
+
+    def add(self, row):
+        if len(self.gallery) > 2 * self._trained_size:
+            self.rebuild()
+            return
+        bucket = self._nearest(self.gallery._features[row][None, :], self.centroids, 1)[0, 0]
+        self._pending[bucket].append(row)
+
+    def search(self, probe, k):
+        """Return (rows, squared distances) of candidates from the nprobe nearest buckets."""
+        probe = np.asarray(probe, dtype=np.float32).reshape(1, self.gallery.dim)
+        buckets = self._nearest(probe, self.centroids, self.nprobe)[0]
+        for b in buckets:
+            if self._pending[b]:
+                self._lists[b] = np.concatenate([self._lists[b], self._pending[b]]).astype(np.int64)
+                self._pending[b] = []
+        rows = np.concatenate([self._lists[b] for b in buckets])
+        return rows, self.gallery.distances(probe, rows)
@@ -0,0 +1,203 @@
+"""Memory-mapped on-disk gallery.
+
+File layout (version 2, little-endian), every section 64-byte aligned:
+
+    header    magic "FPGALLRY", version u32, dim u32, capacity u64, count u64
+    labels    capacity x int64
+    norms     capacity x float32   squared norm of each feature row
+    alive     capacity x uint8     0 once the row has been deleted
+    bins      capacity x uint8     pattern class bin of each row (see pattern_class.py)
+    features  capacity x dim uint8
+
+Version 1 files have no bins section; they are read as if every row were
+UNBINNED, and MappedGallery rewrites them as version 2 when it opens them.
+
+Only the first `count` rows are valid. Appending writes the next free row,
+flushes it to disk and only then bumps and flushes `count`, so a crash
+part-way leaves the file as it was.
+Deleting clears one alive byte. Growing past capacity and compacting write
+a new file and atomically rename it over the old one.
+
+    python gallery_file.py info fingerprint_gallery.bin
+    python gallery_file.py compact fingerprint_gallery.bin
+"""
+import argparse
+import os
+
+import numpy as np
+
+from gallery import UNBINNED, Gallery
+
+MAGIC = b"FPGALLRY"
+VERSION = 2
+HEADER = np.dtype([
+    ("magic", "S8"), ("version", "<u4"), ("dim", "<u4"), ("capacity", "<u8"), ("count", "<u8"),
+])
+
+
+def _align(offset):
+    return (offset + 63) // 64 * 64
+
+
+def _layout(dim, capacity, version=VERSION):
+    """Byte offsets of each section (bins is None before version 2) and the total file size."""
+    labels = _align(HEADER.itemsize)
+    norms = _align(labels + 8 * capacity)
+    alive = _align(norms + 4 * capacity)
+    bins = _align(alive + capacity) if version >= 2 else None
+    features = _align(alive + capacity) if bins is None else _align(bins + capacity)
+    return labels, norms, alive, bins, features, features + dim * capacity
+
+
+def _fsync_dir(path):
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def read_header(path):
+    """The header record of a gallery file."""
+    header = np.fromfile(path, dtype=HEADER, count=1)
+    if len(header) != 1 or header["magic"][0] != MAGIC:
+        raise ValueError(f"{path} is not a gallery file.")
+    if header["version"][0] not in (1, VERSION):
+        raise ValueError(f"Unsupported gallery file version {header['version'][0]}.")
+    return header[0]
+
+
+def map_gallery_file(path, mode="r+"):
+    """Map path and return (mmap, header, labels, norms, alive, bins, features) views.
+
+    For a version 1 file, bins is an in-memory array of UNBINNED.
+    """
+    header = read_header(path)
+    dim, capacity = int(header["dim"]), int(header["capacity"])
+    labels_at, norms_at, alive_at, bins_at, features_at, size = _layout(dim, capacity, int(header["version"]))
+    mm = np.memmap(path, dtype=np.uint8, mode=mode, shape=(size,))
+    return (
+        mm,
+        mm[:HEADER.itemsize].view(HEADER),
+        mm[labels_at:labels_at + 8 * capacity].view("<i8"),
+        mm[norms_at:norms_at + 4 * capacity].view("<f4"),
+        mm[alive_at:alive_at + capacity].view(np.bool_),
+        np.full(capacity, UNBINNED, dtype=np.uint8) if bins_at is None else mm[bins_at:bins_at + capacity],
+        mm[features_at:size].reshape(capacity, dim),
+    )
+
+
+def write_gallery_file(path, dim, capacity, labels, norms, features, bins=None):
+    """Atomically (re)write path holding the given live rows (UNBINNED unless bins are given)."""
+    count = len(labels)
+    if bins is None:
+        bins = np.full(count, UNBINNED, dtype=np.uint8)
+    labels_at, norms_at, alive_at, bins_at, features_at, size = _layout(dim, capacity)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.truncate(size)
+        header = np.zeros(1, dtype=HEADER)
+        header[0] = (MAGIC, VERSION, dim, capacity, count)
+        f.write(header.tobytes())
+        for offset, array in ((labels_at, np.asarray(labels, dtype="<i8")),
+                              (norms_at, np.asarray(norms, dtype="<f4")),
+                              (alive_at, np.ones(count, dtype=np.uint8)),
+                              (bins_at, np.asarray(bins, dtype=np.uint8)),
+                              (features_at, np.asarray(features, dtype=np.uint8))):
+            f.seek(offset)
+            f.write(array.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+
+
+class MappedGallery(Gallery):
+    """Gallery whose arrays are np.memmap views of a gallery file.
+
+    Opening maps the file instead of reading it, so startup time does not
+    depend on gallery size, and every add/remove is written straight through
+    to disk. Features are stored as uint8.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = None
+        self._map()
+
+    @classmethod
+    def open(cls, path, dim=None, capacity=1024):
+        """Open path, creating an empty gallery of the given dim if it doesn't exist."""
+        if not os.path.exists(path):
+            if dim is None:
+                raise FileNotFoundError(path)
+            write_gallery_file(path, dim, capacity, [], [], np.empty((0, dim)))
+        gallery = cls(path)
+        if int(gallery._header["version"][0]) < VERSION:
+            gallery._rewrite(len(gallery._features))
+        if dim is not None and gallery.dim != dim:
+            raise ValueError(f"{path} holds {gallery.dim}-dimensional features, expected {dim}.")
+        return gallery
+
+    def _map(self):
+        (self._mmap, self._header, self._labels, self._norms,
+         self._alive, self._bins, self._features) = map_gallery_file(self.path)
+        self.dim = self._features.shape[1]
+        self._size = int(self._header["count"][0])
+
+        live = np.flatnonzero(self._alive[:self._size])
+        self._rows = dict(zip(self._labels[live].tolist(), live.tolist()))
+        if len(self._rows) < len(live):
+            # A crash between writing a replacement and retiring the old row:
+            # the later row wins.
+            self._alive[np.setdiff1d(live, list(self._rows.values()))] = False
+            self._mmap.flush()
+
+    def _commit(self):
+        # The row must be on disk before a count covering it is: one flush
+        # can write the header page first.
+        self._mmap.flush()
+        if int(self._header["count"][0]) != self._size:
+            self._header["count"] = self._size
+            self._mmap.flush()
+
+    def _rewrite(self, capacity):
+        live = np.flatnonzero(self._alive[:self._size])
+        write_gallery_file(self.path, self.dim, capacity, self._labels[live], self._norms[live], self._features[live],
+                           self._bins[live])
+        del self._mmap, self._header, self._labels, self._norms, self._alive, self._bins, self._features
+        self._map()
+        if self.index is not None:
+            self.index.rebuild()
+
+    def _grow(self):
+        self._rewrite(max(2 * len(self._features), 1024))
+
+    def compact(self):
+        """Rewrite the file without deleted rows."""
+        self._rewrite(max(2 * len(self._rows), 1024))
+
+    def close(self):
+        self._mmap.flush()
+        del self._mmap
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or compact a gallery file.")
+    parser.add_argument("command", choices=["info", "compact"])
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    gallery = MappedGallery.open(args.path)
+    size_before = os.path.getsize(args.path)
+    if args.command == "compact":
+        gallery.compact()
+    binned = int((gallery._bins[gallery.rows()] != UNBINNED).sum())
+    print(f"{args.path}: dim={gallery.dim} entries={len(gallery)} binned={binned} rows={gallery._size} "
+          f"capacity={len(gallery._features)} bytes={os.path.getsize(args.path)}"
+          + (f" (was {size_before})" if args.command == "compact" else ""))
+    gallery.close()
+
+
+if __name__ == "__main__":
+    main()
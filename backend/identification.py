@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import numpy as np
+
+import features
+from gallery import UNBINNED
+from gallery_file import map_gallery_file, read_header
+
+# Per-process state of pool workers: the path they serve, its inode and the mapped sections.
+_worker = {}
+
+
+def _init_worker(path):
+    _worker["path"] = path
+    _worker["inode"] = None
+
+
+def _sections():
+    """Read-only views of the gallery file, remapped if it has been rewritten."""
+    inode = os.stat(_worker["path"]).st_ino
+    if inode != _worker["inode"]:
+        _worker["sections"] = map_gallery_file(_worker["path"], mode="r")
+        _worker["inode"] = inode
+    return _worker["sections"]
+
+
+def _ping():
+    return os.getpid()
+
+
+def _search_shard(probe, start, stop, k, bins=None):
+    """Top-k (labels, scores, rows compared) among the live rows in [start, stop), in bins if given."""
+    _, header, labels, _, alive, row_bins, descriptors = _sections()
+    stop = min(stop, int(header["count"][0]))
+    live = alive[start:stop]
+    if bins is not None:
+        live = live & np.isin(row_bins[start:stop], [*bins, UNBINNED])
+    rows = start + np.flatnonzero(live)
+    scores = features.match_scores(probe, descriptors[rows])
+    k = min(k, len(rows))
+    if k == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), len(rows)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return np.asarray(labels[rows[best]]), scores[best], len(rows)
+
+
+class IdentificationEngine:
+    """1:N identification over a gallery file, fanned out to a process pool.
+
+    Each worker memory-maps the gallery file read-only, so the descriptor
+    matrix is shared through the page cache and a query only sends the
+    probe and a row range to each worker. The rows are split into shards
+    (by default one per worker), every shard returns its own top k and the
+    results are merged. Enrollments written through MappedGallery are seen
+    by the workers on their next query; a rewritten file (grow or compact)
+    is remapped.
+
+    identify() waits at most budget seconds. Shards that have not answered
+    by then are left out of the result, which is then marked incomplete.
+    With bins, only rows in those pattern class bins (and UNBINNED rows)
+    are compared; last_compared is how many rows the last query compared.
+    """
+
+    def __init__(self, path, workers=None, shards=None, budget=0.5, mp_context="spawn"):
+        self.path = path
+        self.workers = workers or os.cpu_count()
+        self.shards = shards or self.workers
+        self.budget = budget
+        self._pool = ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context(mp_context),
+            initializer=_init_worker,
+            initargs=(path,),
+        )
+        self.queries = 0
+        self.incomplete = 0
+        self.last_latency = None
+        self.last_compared = 0
+
+    def start(self):
+        """Start every worker now rather than on the first query."""
+        wait([self._pool.submit(_ping) for _ in range(self.workers)])
+
+    def close(self):
+        self._pool.shutdown(cancel_futures=True)
+
+    def identify(self, probe, k=1, budget=None, bins=None):
+        """Return (labels, scores, complete) of the k best matches, best first."""
+        started = time.perf_counter()
+        budget = self.budget if budget is None else budget
+        probe = np.asarray(probe, dtype=np.uint8)
+        count = int(read_header(self.path)["count"])
+        bounds = np.linspace(0, count, self.shards + 1).astype(int)
+        futures = [
+            self._pool.submit(_search_shard, probe, start, stop, k, bins)
+            for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start
+        ]
+        done, pending = wait(futures, timeout=budget)
+        for future in pending:
+            future.cancel()
+
+        results = [future.result() for future in done]
+        labels = np.concatenate([r[0] for r in results] or [np.empty(0, dtype=np.int64)])
+        scores = np.concatenate([r[1] for r in results] or [np.empty(0, dtype=np.float32)])
+        best = np.argsort(-scores, kind="stable")[:k]
+
+        self.queries += 1
+        self.incomplete += bool(pending)
+        self.last_compared = sum(r[2] for r in results)
+        self.last_latency = time.perf_counter() - started
+        return labels[best], scores[best], not pending
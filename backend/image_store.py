@@ -0,0 +1,239 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from sensor import IMAGE_HEIGHT, IMAGE_WIDTH
+
+# Content types of the formats an image can be served in; "raw" is the stored capture.
+MEDIA_TYPES = {
+    "raw": "application/octet-stream",
+    "png": "image/png",
+    "webp": "image/webp",
+}
+_DIGEST = re.compile(r"[0-9a-f]{64}")
+
+
+def _write_atomic(path, data):
+    """Write data to path through a temporary file, so readers never see a partial file."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def encode_image(raw, fmt):
+    """Encode raw IMAGE_HEIGHT x IMAGE_WIDTH 8-bit pixels as PNG or lossless WebP."""
+    from PIL import Image  # only needed once the first image is encoded
+
+    image = Image.fromarray(np.frombuffer(raw, dtype=np.uint8).reshape(IMAGE_HEIGHT, IMAGE_WIDTH))
+    out = io.BytesIO()
+    if fmt == "webp":
+        image.save(out, format="WEBP", lossless=True)
+    else:
+        image.save(out, format="PNG", optimize=False)
+    return out.getvalue()
+
+
+class ImageStore:
+    """Content-addressed store for captured fingerprint images.
+
+    put() names a capture by the SHA-256 of its raw pixels, writes it under
+    root/<first two hex digits>/<digest>.raw and returns the digest once the
+    file is on disk. Encoding to the formats in `formats` happens afterwards
+    on a small thread pool (Pillow releases the GIL while compressing), and
+    get() waits for a pending encode or starts one for a format that was
+    not pre-encoded. Storing the same pixels twice keeps one copy.
+
+    Retention: after each put the oldest captures (with their encodings)
+    are removed until the store is under max_bytes and nothing is older
+    than max_age seconds. Either limit may be None.
+    """
+
+    def __init__(self, root, formats=("png", "webp"), max_bytes=None, max_age=None, workers=2):
+        self.root = root
+        self.formats = tuple(formats)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-store")
+        self._lock = threading.Lock()
+        self._pending = {}
+        # digest -> [stored_at, bytes on disk], oldest first.
+        self._index = OrderedDict()
+        self.total_bytes = 0
+        self.stored = 0
+        self.evicted = 0
+        self.encode_failures = 0
+        os.makedirs(root, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        entries = {}
+        for directory in os.scandir(self.root):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if entry.name.endswith(".tmp"):
+                    os.unlink(entry.path)  # left over from an interrupted write
+                    continue
+                digest, _, ext = entry.name.partition(".")
+                if not _DIGEST.fullmatch(digest):
+                    continue
+                stat = entry.stat()
+                record = entries.setdefault(digest, [0.0, 0])
+                record[1] += stat.st_size
+                if ext == "raw":
+                    record[0] = stat.st_mtime
+        for digest, record in sorted(entries.items(), key=lambda item: item[1][0]):
+            self._index[digest] = record
+            self.total_bytes += record[1]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def path(self, digest, fmt="raw"):
+        return os.path.join(self.root, digest[:2], f"{digest}.{fmt}")
+
+    def _disk_size(self, digest):
+        """Bytes the capture and its encodings take on disk."""
+        size = 0
+        for fmt in MEDIA_TYPES:
+            try:
+                size += os.path.getsize(self.path(digest, fmt))
+            except FileNotFoundError:
+                pass
+        return size
+
+    def put(self, image):
+        """Persist a capture (uint8 array or its bytes) and return its digest."""
+        raw = np.ascontiguousarray(image, dtype=np.uint8).tobytes()
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self.path(digest)
+        with self._lock:
+            known = digest in self._index
+        if known and os.path.exists(path):
+            os.utime(path)
+            with self._lock:
+                if digest in self._index:
+                    self._index[digest][0] = time.time()
+                    self._index.move_to_end(digest)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_atomic(path, raw)
+            # An indexed capture whose file went missing already has a size
+            # recorded; replace it with what is on disk now.
+            size = self._disk_size(digest) if known else len(raw)
+            with self._lock:
+                record = self._index.setdefault(digest, [0.0, 0])
+                record[0] = time.time()
+                self.total_bytes += size - record[1]
+                record[1] = size
+                self._index.move_to_end(digest)
+                self.stored += 1
+        for fmt in self.formats:
+            self._encode_async(digest, fmt)
+        self._executor.submit(self.enforce_retention)
+        return digest
+
+    def _encode_async(self, digest, fmt):
+        with self._lock:
+            future = self._pending.get((digest, fmt))
+            if future is None and not os.path.exists(self.path(digest, fmt)):
+                future = self._pending[digest, fmt] = self._executor.submit(self._encode, digest, fmt)
+        return future
+
+    def _encode(self, digest, fmt):
+        try:
+            with open(self.path(digest), "rb") as f:
+                data = encode_image(f.read(), fmt)
+            target = self.path(digest, fmt)
+            _write_atomic(target, data)
+            with self._lock:
+                if digest in self._index:
+                    self._index[digest][1] += len(data)
+                    self.total_bytes += len(data)
+                    return
+            os.unlink(target)  # evicted while we were encoding
+        except FileNotFoundError:
+            with self._lock:
+                indexed = digest in self._index
+            if indexed:  # otherwise it was evicted before we got to it
+                self.encode_failures += 1
+                print(f"Failed to encode image {digest} as {fmt}: its raw file is missing")
+        except Exception as e:
+            self.encode_failures += 1
+            print(f"Failed to encode image {digest} as {fmt}: {e!r}")
+        finally:
+            with self._lock:
+                self._pending.pop((digest, fmt), None)
+
+    def get(self, digest, fmt="raw", timeout=None):
+        """Path of the image in fmt, or None if the store doesn't have it (or failed to encode it).
+
+        Raises TimeoutError if the encode is still running after timeout seconds.
+        """
+        if not _DIGEST.fullmatch(digest) or fmt not in MEDIA_TYPES:
+            return None
+        with self._lock:
+            if digest not in self._index:
+                return None
+        if fmt != "raw":
+            future = self._encode_async(digest, fmt)
+            if future is not None:
+                try:
+                    future.result(timeout)
+                except futures.TimeoutError:
+                    raise TimeoutError(f"Image {digest} is still being encoded as {fmt}.") from None
+                except Exception:
+                    pass  # reported by _encode; the missing file is handled below
+        path = self.path(digest, fmt)
+        return path if os.path.exists(path) else None
+
+    def enforce_retention(self):
+        """Remove the oldest captures until both limits hold; returns how many were removed."""
+        cutoff = None if self.max_age is None else time.time() - self.max_age
+        removed = 0
+        while True:
+            with self._lock:
+                if not self._index:
+                    break
+                digest, (stored_at, size) = next(iter(self._index.items()))
+                over_size = self.max_bytes is not None and self.total_bytes > self.max_bytes
+                expired = cutoff is not None and stored_at < cutoff
+                if not (over_size or expired) or (len(self._index) == 1 and not expired):
+                    break
+                del self._index[digest]
+                self.total_bytes -= size
+                self.evicted += 1
+            for fmt in MEDIA_TYPES:
+                try:
+                    os.unlink(self.path(digest, fmt))
+                except FileNotFoundError:
+                    pass
+            removed += 1
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "images": len(self._index),
+                "bytes": self.total_bytes,
+                "pending_encodes": len(self._pending),
+                "stored": self.stored,
+                "evicted": self.evicted,
+                "encode_failures": self.encode_failures,
+            }
@@ -0,0 +1,118 @@
+import base64
+import bisect
+import heapq
+import json
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, fingerprint_id, match_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor.")
+    return str(timestamp), str(fingerprint_id), str(match_id)
+
+
+def _stream(fingerprint_id, matches, start):
+    for i in range(start, len(matches)):
+        timestamp, match_id = matches[i]
+        yield timestamp, fingerprint_id, match_id
+
+
+class MatchIndex:
+    """Secondary indexes over the fingerprints tree for match history queries.
+
+    Keeps alias -> fingerprint IDs, and per fingerprint its matches as a list
+    of (timestamp, match_id) sorted by time. Timestamps are stored as
+    "%Y-%m-%d %H:%M:%S", which sorts chronologically as a string. A query
+    bisects each of the alias' lists to its start position and merges them,
+    so a page costs O(k log n + page) for an alias with k fingerprints.
+    Not thread-safe; FingerprintCache calls it under its own lock.
+    """
+
+    def __init__(self):
+        self._aliases = {}
+        self._by_alias = {}
+        self._matches = {}
+
+    def clear(self):
+        self._aliases.clear()
+        self._by_alias.clear()
+        self._matches.clear()
+
+    def rebuild(self, fingerprints):
+        self.clear()
+        for fingerprint_id, data in fingerprints.items():
+            self.index_fingerprint(fingerprint_id, data)
+
+    def index_fingerprint(self, fingerprint_id, data):
+        """(Re)index one fingerprint from its full record; None removes it."""
+        self.remove_fingerprint(fingerprint_id)
+        if not isinstance(data, dict):
+            return
+        alias = data.get("alias")
+        self._aliases[fingerprint_id] = alias
+        self._by_alias.setdefault(alias, set()).add(fingerprint_id)
+        self._matches[fingerprint_id] = sorted(
+            (match_data["timestamp"], match_id)
+            for match_id, match_data in (data.get("matches") or {}).items()
+            if isinstance(match_data, dict) and "timestamp" in match_data
+        )
+
+    def remove_fingerprint(self, fingerprint_id):
+        alias = self._aliases.pop(fingerprint_id, None)
+        ids = self._by_alias.get(alias)
+        if ids is not None:
+            ids.discard(fingerprint_id)
+            if not ids:
+                del self._by_alias[alias]
+        self._matches.pop(fingerprint_id, None)
+
+    def add_match(self, fingerprint_id, match_id, timestamp):
+        """Insert one match; returns False if the fingerprint isn't indexed yet."""
+        matches = self._matches.get(fingerprint_id)
+        if matches is None:
+            return False
+        entry = (timestamp, match_id)
+        if not matches or matches[-1] < entry:
+            matches.append(entry)
+        else:
+            i = bisect.bisect_left(matches, entry)
+            if i == len(matches) or matches[i] != entry:
+                matches.insert(i, entry)
+        return True
+
+    def query(self, alias, since=None, until=None, limit=None, cursor=None):
+        """Return (matches, next_cursor) for alias, oldest first.
+
+        since is inclusive and until exclusive; both compare against the
+        timestamp string, so a prefix such as "2024-05-01" works. cursor is
+        the next_cursor of a previous page.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        streams = []
+        for fingerprint_id in sorted(self._by_alias.get(alias, ())):
+            matches = self._matches.get(fingerprint_id) or []
+            start = bisect.bisect_left(matches, (since,)) if since else 0
+            if after is not None:
+                timestamp, after_id, after_match = after
+                if fingerprint_id < after_id:
+                    position = bisect.bisect_right(matches, (timestamp, "\uffff"))
+                elif fingerprint_id == after_id:
+                    position = bisect.bisect_right(matches, (timestamp, after_match))
+                else:
+                    position = bisect.bisect_left(matches, (timestamp,))
+                start = max(start, position)
+            streams.append(_stream(fingerprint_id, matches, start))
+
+        page = []
+        for key in heapq.merge(*streams):
+            if until is not None and key[0] >= until:
+                break
+            if limit is not None and len(page) == limit:
+                return page, encode_cursor(page[-1])
+            page.append(key)
+        return page, None
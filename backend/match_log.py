@@ -0,0 +1,161 @@
+import json
+import sqlite3
+import threading
+import time
+
+from database import push_id
+
+
+class MatchLog:
+    """Durable outbox for match events.
+
+    append() commits the event to a local SQLite database in WAL mode and
+    returns as soon as it is on disk. A background thread reads the oldest
+    batch_size events, writes them to the database with one multi-path
+    update through flush(updates), and deletes them once that succeeds.
+    Failed flushes are retried with exponential backoff; events stay on disk
+    meanwhile, and at most one batch is held in memory.
+
+    Writing an event re-creates its fingerprint's node, so events of deleted
+    fingerprints must not be flushed: discard() drops them when a fingerprint
+    is deleted, and with exists(fingerprint_id) given, events of fingerprints
+    it no longer knows are dropped at flush time too.
+    """
+
+    def __init__(self, path, flush, batch_size=200, flush_interval=0.5, max_backoff=60, exists=None):
+        self.flush = flush
+        self.exists = exists
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS match_events ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, fingerprint_id TEXT NOT NULL, "
+            "match_id TEXT NOT NULL, data TEXT NOT NULL, queued_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+        # Held for a whole flush, so discard() can wait out one already under way.
+        self._flushing = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.depth = self._conn.execute("SELECT COUNT(*) FROM match_events").fetchone()[0]
+        self.appended = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+        self.last_flush_latency = None
+        self.max_flush_latency = 0.0
+        self.last_error = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="match-log", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop the flusher after one last attempt to drain the queue."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._conn.close()
+
+    def append(self, fingerprint_id, match):
+        """Durably queue a match event and return the key it will be stored under."""
+        match_id = push_id()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO match_events (fingerprint_id, match_id, data, queued_at) VALUES (?, ?, ?, ?)",
+                (str(fingerprint_id), match_id, json.dumps(match), time.time()),
+            )
+            self.depth += 1
+            self.appended += 1
+        if self.depth >= self.batch_size:
+            self._wake.set()
+        return match_id
+
+    def discard(self, fingerprint_id):
+        """Drop the queued events of a deleted fingerprint; returns how many there were.
+
+        Waits for a flush already under way, so nothing of the fingerprint is
+        written after this returns.
+        """
+        with self._flushing, self._lock:
+            dropped = self._conn.execute(
+                "DELETE FROM match_events WHERE fingerprint_id = ?", (str(fingerprint_id),)
+            ).rowcount
+            self.depth -= dropped
+        self.dropped += dropped
+        return dropped
+
+    def flush_once(self):
+        """Write the oldest batch to the database; returns how many events it took off the queue."""
+        with self._flushing:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT seq, fingerprint_id, match_id, data FROM match_events ORDER BY seq LIMIT ?",
+                    (self.batch_size,),
+                ).fetchall()
+            if not rows:
+                return 0
+            updates = {
+                f"{fingerprint_id}/matches/{match_id}": json.loads(data)
+                for _, fingerprint_id, match_id, data in rows
+                if self.exists is None or self.exists(fingerprint_id)
+            }
+            latency = None
+            if updates:
+                started = time.perf_counter()
+                self.flush(updates)
+                latency = time.perf_counter() - started
+            with self._lock:
+                self._conn.execute("DELETE FROM match_events WHERE seq <= ?", (rows[-1][0],))
+                self.depth -= len(rows)
+        self.flushed += len(updates)
+        self.dropped += len(rows) - len(updates)
+        if latency is not None:
+            self.last_flush_latency = latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+        return len(rows)
+
+    def _run(self):
+        backoff = self.flush_interval
+        while True:
+            stopping = self._stopping.is_set()
+            try:
+                while self.flush_once() == self.batch_size:
+                    pass
+                backoff = self.flush_interval
+                self.last_error = None
+            except Exception as e:
+                self.failed_flushes += 1
+                self.last_error = str(e)
+                print(f"Failed to flush match events, retrying in {backoff:.1f}s: {e}")
+                if not stopping:
+                    self._stopping.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+            if stopping:
+                return
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+
+    def oldest_age(self):
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(queued_at) FROM match_events").fetchone()
+        return time.time() - row[0] if row[0] is not None else 0.0
+
+    def stats(self):
+        return {
+            "queue_depth": self.depth,
+            "oldest_event_age": self.oldest_age(),
+            "appended": self.appended,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_latency": self.last_flush_latency,
+            "max_flush_latency": self.max_flush_latency,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,235 @@
+"""Prometheus-style metrics and per-request trace spans.
+
+Metrics live in module-level registries and are rendered in the Prometheus
+text format by render(). timed() observes a block's duration in a
+histogram and, while a trace is active (start_trace()), also records it as
+a span of that trace; spans recorded on other threads are kept as long as
+the thread runs in a copy of the request's context.
+"""
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+
+import adafruit_fingerprint
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# adafruit_fingerprint return codes by value, for labelling results.
+CODE_NAMES = {
+    value: name for name, value in vars(adafruit_fingerprint).items()
+    if name.isupper() and not name.startswith("_") and isinstance(value, int)
+}
+
+_registry = []
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items(), key=lambda item: tuple(map(str, item[0])))
+            lines += self._render_items(items)
+        return "\n".join(lines)
+
+    def _render_items(self, items):
+        return [f"{self.name}{_label_text(self.labels, key)} {value}" for key, value in items]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """Histogram of durations in seconds; span names its trace spans."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS, span=None):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.span = span or name
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                counts[0][index] += 1
+            counts[1] += 1
+            counts[2] += value
+
+    def _render_items(self, items):
+        lines = []
+        names = self.labels + ("le",)
+        for key, (buckets, count, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, buckets):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_label_text(names, key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_label_text(names, key + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {count}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {total}")
+        return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+@contextlib.contextmanager
+def timed(histogram, **labels):
+    """Observe the duration of the block in histogram and add it to the current trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed, **labels)
+        trace = _trace.get()
+        if trace is not None:
+            name = ".".join([histogram.span, *map(str, labels.values())])
+            trace.append((name, started, elapsed))
+
+
+def start_trace():
+    """Begin collecting spans in this context; returns the list they are added to."""
+    trace = []
+    _trace.set(trace)
+    return trace
+
+
+def server_timing(trace):
+    """Server-Timing header value for a trace, with repeated spans summed."""
+    totals = {}
+    for name, _, elapsed in trace:
+        count, total = totals.get(name, (0, 0.0))
+        totals[name] = (count + 1, total + elapsed)
+    return ", ".join(f'{name};dur={1000 * total:.1f};desc="x{count}"' for name, (count, total) in totals.items())
+
+
+SENSOR_COMMAND_SECONDS = Histogram(
+    "fingerprint_sensor_command_seconds", "Time taken by sensor commands, including UART transfer.",
+    labels=("sensor", "command"), span="sensor",
+)
+SENSOR_RESULTS = Counter(
+    "fingerprint_sensor_results_total", "Sensor command results by return code.",
+    labels=("sensor", "command", "code"),
+)
+SENSOR_ERRORS = Counter(
+    "fingerprint_sensor_errors_total", "Sensor commands that raised (UART errors, timeouts).",
+    labels=("sensor", "command"),
+)
+CAPTURE_WAIT_SECONDS = Histogram(
+    "fingerprint_capture_wait_seconds", "Time from the start of a capture until the sensor took an image.",
+    labels=("sensor",), buckets=DEFAULT_BUCKETS + (60,), span="capture",
+)
+CAPTURE_ATTEMPTS = Counter(
+    "fingerprint_capture_attempts_total",
+    "Finger placements by outcome (OK, low_quality, not_removed or the failure code).",
+    labels=("sensor", "outcome"),
+)
+DATABASE_SECONDS = Histogram(
+    "fingerprint_database_seconds", "Latency of database reads and writes.",
+    labels=("operation",), span="database",
+)
+DATABASE_ERRORS = Counter(
+    "fingerprint_database_errors_total", "Database operations that raised.", labels=("operation",),
+)
+MATCH_STAGE_SECONDS = Histogram(
+    "fingerprint_match_stage_seconds", "Time spent in each stage of the match cascade.",
+    labels=("stage",), span="match",
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "fingerprint_http_request_seconds", "HTTP request latency by route.",
+    labels=("method", "route", "status"), buckets=DEFAULT_BUCKETS + (60,), span="http",
+)
+MATCH_LOG_DEPTH = Gauge("fingerprint_match_log_depth", "Match events waiting to be written to the database.")
+REPLICATION_DEPTH = Gauge("fingerprint_replication_depth", "Local database writes waiting to be copied to Firebase.")
+IMAGE_STORE_BYTES = Gauge("fingerprint_image_store_bytes", "Disk used by the image store.")
+EVENT_SUBSCRIBERS = Gauge("fingerprint_event_subscribers", "Clients connected to GET /events.")
+SENSOR_HEALTHY = Gauge("fingerprint_sensor_healthy", "1 if the reader passed its last health check.", labels=("sensor",))
+SENSOR_BUSY = Gauge("fingerprint_sensor_busy", "1 while the reader is held by a request.", labels=("sensor",))
+
+
+# Driver methods that talk to the sensor and are worth timing.
+SENSOR_COMMANDS = frozenset({
+    "get_image", "image_2_tz", "create_model", "store_model", "delete_model", "load_model",
+    "finger_search", "finger_fast_search", "get_fpdata", "send_fpdata", "read_templates",
+    "count_templates", "read_sysparam", "set_sysparam", "empty_library", "verify_password", "set_led",
+})
+
+
+class InstrumentedSensor:
+    """Wraps a sensor driver so every command is timed and its result code counted.
+
+    Everything else (attributes, place_finger() on simulators...) passes
+    through to the wrapped driver.
+    """
+
+    def __init__(self, finger, name="sensor"):
+        object.__setattr__(self, "finger", finger)
+        object.__setattr__(self, "name", name)
+
+    def __getattr__(self, attr):
+        value = getattr(self.finger, attr)
+        if attr not in SENSOR_COMMANDS or not callable(value):
+            return value
+
+        def command(*args, **kwargs):
+            try:
+                with timed(SENSOR_COMMAND_SECONDS, sensor=self.name, command=attr):
+                    result = value(*args, **kwargs)
+            except Exception:
+                SENSOR_ERRORS.inc(sensor=self.name, command=attr)
+                raise
+            if isinstance(result, int) and not isinstance(result, bool):
+                SENSOR_RESULTS.inc(sensor=self.name, command=attr, code=CODE_NAMES.get(result, result))
+            return result
+
+        object.__setattr__(self, attr, command)
+        return command
+
+    def __setattr__(self, attr, value):
+        setattr(self.finger, attr, value)
@@ -0,0 +1,133 @@
+"""Coarse classification of prints into bins, to cut down 1:N searches.
+
+A print's bin combines three things that survive re-placing the finger:
+
+    pattern      arch, loop or whorl, from the singular points of the
+                 orientation field: the Poincare index around every 2x2
+                 cell of blocks adds up to 1/2 per core, so no core is an
+                 arch, one a loop and two (or a full turn) a whorl
+    frequency    dominant ridge frequency, in FREQUENCY_LEVELS levels
+    orientation  dominant ridge orientation, in ORIENTATION_LEVELS levels
+                 of 180 / ORIENTATION_LEVELS degrees
+
+An enrolled print is stored under one bin. A probe searches its own bin
+and, where its frequency or orientation is within a margin of a level
+edge, the bin on the other side too; if that finds nothing, the
+neighbouring bins (one step away in pattern, frequency or orientation)
+are searched next. Gallery rows enrolled without a bin (UNBINNED) are
+searched by every probe.
+"""
+import itertools
+
+import numpy as np
+
+import features
+from sensor import IMAGE_HEIGHT, IMAGE_WIDTH
+
+PATTERNS = ("arch", "loop", "whorl")
+FREQUENCY_EDGES = (0.11, 0.13)  # cycles/pixel between the frequency levels
+FREQUENCY_LEVELS = len(FREQUENCY_EDGES) + 1
+FREQUENCY_MARGIN = 1.5 / 256  # ridge_frequency() steps in 1/256
+ORIENTATION_LEVELS = 4
+ORIENTATION_MARGIN = np.radians(10)
+SMOOTHING = 1  # orientation field smoothing radius, in blocks, before finding singular points
+
+
+def _wrap(angle):
+    """Orientation difference folded into [-pi/2, pi/2)."""
+    return (angle + np.pi / 2) % np.pi - np.pi / 2
+
+
+def poincare_index(theta, valid):
+    """Poincare index (in turns) around each 2x2 cell of blocks; 0 where any block is not valid."""
+    corners = (theta[:-1, :-1], theta[:-1, 1:], theta[1:, 1:], theta[1:, :-1])
+    total = sum(_wrap(b - a) for a, b in zip(corners, corners[1:] + corners[:1]))
+    index = np.round(total / np.pi) / 2
+    inside = valid[:-1, :-1] & valid[:-1, 1:] & valid[1:, 1:] & valid[1:, :-1]
+    return np.where(inside, index, 0)
+
+
+def classify(image):
+    """{"pattern", "cores", "deltas", "frequency", "orientation"} of a raw sensor image.
+
+    cores and deltas count singular points; frequency is in cycles/pixel and
+    orientation in radians [0, pi).
+    """
+    image = np.asarray(image, dtype=np.float32).reshape(IMAGE_HEIGHT, IMAGE_WIDTH)
+    mask = features.segment(image)
+    normalized = features.normalize(image, mask)
+    theta, coherence = features.orientation_field(normalized, mask)
+    weight = coherence * mask
+    cos = features._box_filter(np.cos(2 * theta) * weight, SMOOTHING)
+    sin = features._box_filter(np.sin(2 * theta) * weight, SMOOTHING)
+    smoothed = (0.5 * np.arctan2(sin, cos)) % np.pi
+    # Singular points on the edge of the print are artefacts of the cut-off ridges.
+    inner = features._box_filter(mask.astype(np.float32), 1) >= 9
+    index = poincare_index(smoothed, inner)
+    cores = int(round(2 * index[index > 0].sum()))
+    deltas = int(round(-2 * index[index < 0].sum()))
+    return {
+        "pattern": PATTERNS[min(cores, 2)],
+        "cores": cores,
+        "deltas": deltas,
+        "frequency": float(features.ridge_frequency(normalized, mask)),
+        "orientation": float(0.5 * np.arctan2((np.sin(2 * theta) * weight).sum(),
+                                              (np.cos(2 * theta) * weight).sum()) % np.pi),
+    }
+
+
+def bin_code(pattern, frequency_level, orientation_level):
+    return (pattern * FREQUENCY_LEVELS + frequency_level) * ORIENTATION_LEVELS + orientation_level
+
+
+def _frequency_levels(frequency, margin=0):
+    return sorted({int(np.searchsorted(FREQUENCY_EDGES, frequency + d)) for d in (-margin, 0, margin)})
+
+
+def _orientation_levels(orientation, margin=0):
+    width = np.pi / ORIENTATION_LEVELS
+    # Level 0 is centred on horizontal ridges.
+    return sorted({int((orientation + d + width / 2) // width) % ORIENTATION_LEVELS for d in (-margin, 0, margin)})
+
+
+def enroll_bin(signature):
+    """The bin a print with this classify() signature is stored under."""
+    return bin_code(PATTERNS.index(signature["pattern"]),
+                    _frequency_levels(signature["frequency"])[0],
+                    _orientation_levels(signature["orientation"])[0])
+
+
+def probe_bins(signature):
+    """Bins a probe with this signature searches first."""
+    pattern = PATTERNS.index(signature["pattern"])
+    return [
+        bin_code(pattern, f, o)
+        for f, o in itertools.product(_frequency_levels(signature["frequency"], FREQUENCY_MARGIN),
+                                      _orientation_levels(signature["orientation"], ORIENTATION_MARGIN))
+    ]
+
+
+def neighbour_bins(bins):
+    """Bins one step away from any of bins (in pattern, frequency or orientation), excluding bins."""
+    out = set()
+    for code in bins:
+        rest, o = divmod(code, ORIENTATION_LEVELS)
+        p, f = divmod(rest, FREQUENCY_LEVELS)
+        if 0 < p:
+            out.add(bin_code(p - 1, f, o))
+        if p < len(PATTERNS) - 1:
+            out.add(bin_code(p + 1, f, o))
+        if 0 < f:
+            out.add(bin_code(p, f - 1, o))
+        if f < FREQUENCY_LEVELS - 1:
+            out.add(bin_code(p, f + 1, o))
+        out.add(bin_code(p, f, (o - 1) % ORIENTATION_LEVELS))
+        out.add(bin_code(p, f, (o + 1) % ORIENTATION_LEVELS))
+    return sorted(out - set(bins))
+
+
+def describe(code):
+    """Readable name of a bin, e.g. "loop f1 o2"."""
+    rest, o = divmod(code, ORIENTATION_LEVELS)
+    p, f = divmod(rest, FREQUENCY_LEVELS)
+    return f"{PATTERNS[p]} f{f} o{o}"
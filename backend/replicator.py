@@ -0,0 +1,93 @@
+import threading
+import time
+
+
+def _overlaps(path, other):
+    return path != other and (path.startswith(other + "/") or other.startswith(path + "/"))
+
+
+class Replicator:
+    """Sends the writes queued in a SQLiteDatabase's outbox to Firebase.
+
+    A background thread reads the oldest batch_size writes, merges them into
+    one multi-path update through flush(updates) and drops them from the
+    outbox once that succeeds. A multi-path update may not contain a path
+    and one of its ancestors, so a batch ends before the first write that
+    would overlap one already in it. While Firebase is unreachable the
+    writes wait on disk and flushes are retried with exponential backoff,
+    so the gateway keeps working offline and catches up when it is back.
+    """
+
+    def __init__(self, database, flush, batch_size=200, flush_interval=1.0, max_backoff=60):
+        self.database = database
+        self.flush = flush
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self._stopping = threading.Event()
+        self._thread = None
+        self.replicated = 0
+        self.failed_flushes = 0
+        self.last_flush = None
+        self.last_flush_latency = None
+        self.last_error = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="replicator", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop the thread after one last attempt to drain the outbox."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def flush_once(self):
+        """Replicate the oldest batch; returns how many queued writes it covered."""
+        rows = self.database.outbox(self.batch_size)
+        if not rows:
+            return 0
+        updates = {}
+        for count, (seq, path, value) in enumerate(rows):
+            if any(_overlaps(path, other) for other in updates):
+                rows = rows[:count]
+                break
+            updates[path] = value
+        started = time.perf_counter()
+        self.flush(updates)
+        self.last_flush_latency = time.perf_counter() - started
+        self.database.acknowledge(rows[-1][0])
+        self.replicated += len(rows)
+        self.last_flush = time.time()
+        return len(rows)
+
+    def _run(self):
+        backoff = self.flush_interval
+        while True:
+            stopping = self._stopping.is_set()
+            try:
+                while self.flush_once():
+                    pass
+                backoff = self.flush_interval
+                self.last_error = None
+            except Exception as e:
+                self.failed_flushes += 1
+                self.last_error = str(e)
+                print(f"Failed to replicate to Firebase, retrying in {backoff:.1f}s: {e}")
+                if not stopping:
+                    self._stopping.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+            if stopping:
+                return
+            if self.last_error is None:
+                self._stopping.wait(self.flush_interval)
+
+    def stats(self):
+        return {
+            "queue_depth": self.database.outbox_depth(),
+            "replicated": self.replicated,
+            "failed_flushes": self.failed_flushes,
+            "last_flush": self.last_flush,
+            "last_flush_latency": self.last_flush_latency,
+            "last_error": self.last_error,
+        }
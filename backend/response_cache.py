@@ -0,0 +1,103 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:  # optional, serializes large histories several times faster
+    orjson = None
+
+
+def dumps(payload):
+    """JSON-encode payload as bytes, the same as FastAPI's default JSONResponse would."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value covers etag (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+class CachedResponse:
+    """A serialized JSON body with its ETag, and its gzip once a client has asked for it."""
+
+    def __init__(self, body, version, min_gzip_size):
+        self.body = body
+        self.version = version
+        self.created = time.monotonic()
+        self.etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self._min_gzip_size = min_gzip_size
+        self._gzipped = None
+
+    def encoded(self, accept_encoding=""):
+        """(body, content encoding or None) to send to a client with this Accept-Encoding."""
+        if len(self.body) < self._min_gzip_size or "gzip" not in accept_encoding:
+            return self.body, None
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6)
+        return self._gzipped, "gzip"
+
+
+class ResponseCache:
+    """Serialized responses of read-only endpoints, keyed by path and query string.
+
+    An entry is served until it is ttl seconds old or the version of the
+    data it was built from changes (FingerprintCache.version moves on
+    every write and every listener event), whichever comes first, so
+    enroll, delete and match invalidate it without having to know which
+    keys they touched. At most max_entries are kept, least recently used
+    first out.
+    """
+
+    def __init__(self, ttl=30, max_entries=1024, min_gzip_size=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.min_gzip_size = min_gzip_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version or time.monotonic() - entry.created > self.ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, version, payload):
+        """Serialize payload, cache it under key and return the entry."""
+        entry = CachedResponse(dumps(payload), version, self.min_gzip_size)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(len(entry.body) for entry in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
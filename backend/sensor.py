@@ -0,0 +1,418 @@
+import os
+import random
+import time
+
+import adafruit_fingerprint
+import numpy as np
+
+import config
+
+IMAGE_WIDTH = 256
+IMAGE_HEIGHT = 288
+IMAGE_SIZE = IMAGE_WIDTH * IMAGE_HEIGHT // 2  # uploaded at 4 bits per pixel
+TEMPLATE_SIZE = 512
+DATA_PACKET_SIZE = 128
+PACKET_OVERHEAD = 11  # start code, address, type, length and checksum
+
+FAILURE_CODES = {
+    "get_image": [adafruit_fingerprint.IMAGEFAIL],
+    "image_2_tz": [adafruit_fingerprint.IMAGEMESS, adafruit_fingerprint.FEATUREFAIL],
+    "create_model": [adafruit_fingerprint.ENROLLMISMATCH],
+    "store_model": [adafruit_fingerprint.FLASHERR],
+    "finger_fast_search": [adafruit_fingerprint.NOTFOUND],
+}
+
+led = None  # the board's status LED, shared by every reader; see open_led()
+
+
+def pack_image(image):
+    """Pack a uint8 image into the sensor's upload format: two 4-bit pixels per byte, high nibble first."""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = np.frombuffer(image, dtype=np.uint8)
+    image = np.asarray(image, dtype=np.uint8).reshape(-1, 2)
+    return ((image[:, 0] & 0xF0) | (image[:, 1] >> 4)).tobytes()
+
+
+def unpack_image(data, out=None):
+    """Expand an uploaded image (IMAGE_SIZE packed bytes) into a uint8 IMAGE_HEIGHT x IMAGE_WIDTH array.
+
+    data may be bytes, a bytearray/memoryview or any uint8 array whose rows
+    hold consecutive runs of packed bytes (e.g. data packet payloads).
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = np.frombuffer(data, dtype=np.uint8)
+    packed = np.asarray(data, dtype=np.uint8)
+    packed = packed.reshape(-1, packed.shape[-1]) if packed.ndim > 1 else packed.reshape(1, -1)
+    if out is None:
+        out = np.empty((IMAGE_HEIGHT, IMAGE_WIDTH), dtype=np.uint8)
+    pixels = out.reshape(len(packed), 2 * packed.shape[1])
+    np.right_shift(packed, 4, out=pixels[:, 0::2])
+    np.bitwise_and(packed, 0x0F, out=pixels[:, 1::2])
+    pixels *= 17  # 0..15 -> 0..255
+    return out
+
+
+def synthetic_image(finger, impression=0):
+    """Render a 288x256 grayscale ridge pattern for a simulated finger.
+
+    The same finger always has the same pattern class (arch, loop or whorl),
+    core position, ridge frequency and minutiae; each impression adds a small
+    shift and rotation, pressure change and sensor noise.
+    """
+    rng = np.random.default_rng([finger, 0])
+    pattern = ("arch", "loop", "loop", "whorl")[rng.integers(4)]
+    period = rng.uniform(7.0, 10.0)
+    core_y = IMAGE_HEIGHT * rng.uniform(0.35, 0.55)
+    core_x = IMAGE_WIDTH * rng.uniform(0.4, 0.6)
+    angle = rng.uniform(-0.4, 0.4)
+    warp = rng.normal(0, 1, (3, 4))
+    # Minutiae are phase vortices: each one adds or ends a ridge around it.
+    minutiae = rng.uniform(-110, 110, 60) + 1j * rng.uniform(-120, 120, 60)
+    polarity = rng.choice([-1, 1], 60)
+
+    impression_rng = np.random.default_rng([finger, impression + 1])
+    shift_y, shift_x = (0, 0) if impression == 0 else impression_rng.uniform(-5, 5, 2)
+    if impression:
+        angle += impression_rng.uniform(-0.08, 0.08)
+
+    y, x = np.mgrid[0:IMAGE_HEIGHT, 0:IMAGE_WIDTH].astype(np.float32)
+    z = ((x - core_x - shift_x) + 1j * (y - core_y - shift_y)) * np.exp(-1j * angle)
+    if pattern == "arch":
+        lift = 0.5 * IMAGE_HEIGHT * np.exp(-((z.real / 60.0) ** 2))
+        phase = (z.imag + lift) / period
+    elif pattern == "loop":
+        # Hairpin ridges: distance to a ray running down from the core.
+        phase = np.where(z.imag > 0, np.hypot(z.real, period), np.hypot(np.abs(z), period)) / period
+        phase += 0.3 * np.clip(z.imag, 0, None) / period
+    else:
+        phase = np.abs(z.real * 0.8 + 1j * z.imag) / period
+    for a, b, c, d in warp:
+        phase += 0.15 * a * np.sin(x * b / 40 + y * c / 40 + d)
+    for position, sign in zip(minutiae, polarity):
+        phase += sign * np.angle(z - position) / (2 * np.pi)
+
+    contrast = 90 * impression_rng.uniform(0.8, 1.0)
+    image = 128 + contrast * np.cos(2 * np.pi * phase)
+    image += impression_rng.normal(0, 12, image.shape)
+    outside = ((x - IMAGE_WIDTH / 2) / (IMAGE_WIDTH * 0.48)) ** 2 + ((y - IMAGE_HEIGHT / 2) / (IMAGE_HEIGHT * 0.55)) ** 2 > 1
+    image[outside] = 255
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def smudge_image(image, seed=None):
+    """A smudged version of image: ridges washed out over a blob and contrast lowered.
+
+    Models a wet, dry or smeared finger, whose capture images but templates
+    poorly.
+    """
+    rng = np.random.default_rng(seed)
+    image = np.asarray(image, dtype=np.uint8).reshape(IMAGE_HEIGHT, IMAGE_WIDTH)
+    pixels = image.astype(np.float32)
+    # 9x9 box blur via cumulative sums.
+    padded = np.pad(pixels, 5, mode="edge").cumsum(axis=0).cumsum(axis=1)
+    blurred = (padded[9:-1, 9:-1] - padded[:-10, 9:-1] - padded[9:-1, :-10] + padded[:-10, :-10]) / 81
+    y, x = np.mgrid[0:IMAGE_HEIGHT, 0:IMAGE_WIDTH]
+    cy, cx = rng.uniform(0.3, 0.7) * IMAGE_HEIGHT, rng.uniform(0.3, 0.7) * IMAGE_WIDTH
+    weight = 0.9 * np.clip(1.5 - np.hypot(y - cy, x - cx) / rng.uniform(80, 130), 0, 1)
+    out = pixels * (1 - weight) + blurred * weight
+    out = 128 + rng.uniform(0.5, 0.8) * (out - 128)
+    out[image == 255] = 255
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+
+class SimulatedFingerprint:
+    """In-process stand-in for adafruit_fingerprint.Adafruit_Fingerprint.
+
+    Exposes the same methods, attributes and return codes, so anything written
+    against the real sensor can run without hardware. A finger is "placed"
+    capture_latency seconds after the first get_image() of a capture; unless
+    place_finger() chose one, it is drawn at random from `population`
+    fingers. It then stays on the sensor, and every get_image() images the
+    same press again, until the host polls for the lift: a get_image() right
+    after one that saw the finger, with no other command in between, finds
+    it gone. place_finger() also lifts it.
+
+    failure_rates maps a method name to the probability that it fails with
+    one of its FAILURE_CODES. With a baudrate set, every command and data
+    transfer sleeps for as long as its frames would take on a real UART.
+    image_dir, if given, is a directory of .raw captures (either uploads as
+    sent by the sensor or unpacked 288x256 uint8 images) used as the image
+    library instead of synthetic ridge patterns.
+
+    A smudge_rate fraction of captures are smudged (smudge_image()): their
+    image_2_tz() fails with IMAGEMESS half of the time and otherwise gives
+    a template that matches nothing.
+    """
+
+    def __init__(self, capture_latency=0.5, baudrate=0, failure_rates=None,
+                 population=100, image_dir=None, library_size=127, seed=None, smudge_rate=0):
+        self.capture_latency = capture_latency
+        self.baudrate = baudrate
+        self.failure_rates = dict(failure_rates or {})
+        self.smudge_rate = smudge_rate
+        self.population = population
+        self.library_size = library_size
+        self.data_packet_size = 2  # 128 byte data packets, as on the real module
+        self.finger_id = None
+        self.confidence = None
+        self.templates = []
+        self.template_count = None
+        self.next_finger = None
+        self._rng = random.Random(seed)
+        self._library = {}
+        self._char_buffers = {1: None, 2: None}
+        self._image = None
+        self._impressions = 0
+        self._smudged = False
+        self._uploaded_image = (None, None)
+        self._pressed_at = None
+        self._pressed = False
+        self._commands = 0
+        self._imaged_at = None
+        self._image_files = []
+        if image_dir:
+            self._image_files = sorted(
+                os.path.join(image_dir, name) for name in os.listdir(image_dir) if name.endswith(".raw")
+            )
+
+    def _transfer(self, *frame_sizes):
+        """Sleep for the time the given UART frames take on the wire."""
+        self._commands += 1
+        if self.baudrate:
+            time.sleep(sum(frame_sizes) * 10 / self.baudrate)
+
+    def _transfer_data(self, size):
+        packets = -(-size // DATA_PACKET_SIZE)
+        self._transfer(12, size + packets * PACKET_OVERHEAD)
+
+    def _fails(self, method):
+        rate = self.failure_rates.get(method, 0)
+        if rate and self._rng.random() < rate:
+            return self._rng.choice(FAILURE_CODES[method])
+        return None
+
+    def _finger_template(self, finger):
+        return random.Random(f"template-{finger}").randbytes(TEMPLATE_SIZE)
+
+    def _finger_image(self, finger, impression, smudged=False):
+        """The finger's image in upload format."""
+        if self._image_files:
+            with open(self._image_files[finger % len(self._image_files)], "rb") as f:
+                data = f.read()
+            data = data[:IMAGE_SIZE] if len(data) < 2 * IMAGE_SIZE else pack_image(data[:2 * IMAGE_SIZE])
+            return pack_image(smudge_image(unpack_image(data), [finger, impression])) if smudged else data
+        image = synthetic_image(finger, impression)
+        return pack_image(smudge_image(image, [finger, impression]) if smudged else image)
+
+    def place_finger(self, finger):
+        """Choose which finger the next captures will see (None for random).
+
+        Whatever finger is on the sensor is lifted first.
+        """
+        self.next_finger = finger
+        self._pressed = False
+
+    def get_image(self):
+        self._transfer(12, 12)
+        if self._pressed and self._imaged_at == self._commands - 1:
+            # Polled again straight away: the host is waiting for the lift.
+            self._pressed = False
+            return adafruit_fingerprint.NOFINGER
+        if not self._pressed:
+            now = time.monotonic()
+            if self._pressed_at is None:
+                self._pressed_at = now
+            if now - self._pressed_at < self.capture_latency:
+                return adafruit_fingerprint.NOFINGER
+            self._pressed_at = None
+            self._pressed = True
+            finger = self.next_finger
+            if finger is None:
+                finger = self._rng.randrange(self.population)
+            self._image = finger
+            self._impressions += 1
+            self._smudged = bool(self.smudge_rate) and self._rng.random() < self.smudge_rate
+        self._imaged_at = self._commands
+        code = self._fails("get_image")
+        return adafruit_fingerprint.OK if code is None else code
+
+    def image_2_tz(self, slot=1):
+        self._transfer(13, 12)
+        if self._image is None:
+            return adafruit_fingerprint.INVALIDIMAGE
+        code = self._fails("image_2_tz")
+        if code is not None:
+            return code
+        if self._smudged:
+            if self._rng.random() < 0.5:
+                return adafruit_fingerprint.IMAGEMESS
+            self._char_buffers[slot] = random.Random(f"smudge-{self._image}-{self._impressions}").randbytes(TEMPLATE_SIZE)
+            return adafruit_fingerprint.OK
+        self._char_buffers[slot] = self._finger_template(self._image)
+        return adafruit_fingerprint.OK
+
+    def create_model(self):
+        self._transfer(12, 12)
+        if self._char_buffers[1] != self._char_buffers[2]:
+            return adafruit_fingerprint.ENROLLMISMATCH
+        return self._fails("create_model") or adafruit_fingerprint.OK
+
+    def store_model(self, location, slot=1):
+        self._transfer(15, 12)
+        if not 0 <= location < self.library_size:
+            return adafruit_fingerprint.BADLOCATION
+        if self._char_buffers[slot] is None:
+            return adafruit_fingerprint.FLASHERR
+        code = self._fails("store_model")
+        if code is not None:
+            return code
+        self._library[location] = self._char_buffers[slot]
+        return adafruit_fingerprint.OK
+
+    def delete_model(self, location):
+        self._transfer(16, 12)
+        if not 0 <= location < self.library_size:
+            return adafruit_fingerprint.BADLOCATION
+        self._library.pop(location, None)
+        return adafruit_fingerprint.OK
+
+    def load_model(self, location, slot=1):
+        self._transfer(15, 12)
+        if location not in self._library:
+            return adafruit_fingerprint.BADLOCATION
+        self._char_buffers[slot] = self._library[location]
+        return adafruit_fingerprint.OK
+
+    def upload(self, sensorbuffer="char", slot=1):
+        """Contents of the image or a char buffer as bytes, without UART timing."""
+        self._commands += 1
+        if sensorbuffer == "image":
+            key = (self._image, self._impressions, self._smudged)
+            if self._uploaded_image[0] != key:
+                self._uploaded_image = (key, self._finger_image(*key))
+            return self._uploaded_image[1]
+        if sensorbuffer == "char":
+            return self._char_buffers[slot] or bytes(TEMPLATE_SIZE)
+        raise RuntimeError("Unknown sensor buffer type")
+
+    def get_fpdata(self, sensorbuffer="char", slot=1):
+        data = self.upload(sensorbuffer, slot)
+        self._transfer(12 if sensorbuffer == "image" else 13)
+        self._transfer_data(len(data))
+        return list(data)
+
+    def send_fpdata(self, data, sensorbuffer="char", slot=1):
+        """Download a template into a char buffer (image downloads are not simulated)."""
+        if sensorbuffer != "char":
+            raise RuntimeError("Unknown sensor buffer type")
+        self._transfer(13, 12)
+        self._transfer_data(len(data))
+        self._char_buffers[slot] = bytes(data)
+        return True
+
+    def read_templates(self):
+        self._transfer(13, 44)
+        self.templates = sorted(self._library)
+        return adafruit_fingerprint.OK
+
+    def count_templates(self):
+        self._transfer(12, 14)
+        self.template_count = len(self._library)
+        return adafruit_fingerprint.OK
+
+    def finger_search(self):
+        return self.finger_fast_search()
+
+    def finger_fast_search(self):
+        self._transfer(12, 28, 17, 16)  # read_sysparam, then the search itself
+        self.finger_id, self.confidence = 0, 0
+        probe = self._char_buffers[1]
+        if self._fails("finger_fast_search") is not None:
+            return adafruit_fingerprint.NOTFOUND
+        for location, template in sorted(self._library.items()):
+            if template == probe:
+                self.finger_id = location
+                self.confidence = self._rng.randint(50, 250)
+                return adafruit_fingerprint.OK
+        return adafruit_fingerprint.NOTFOUND
+
+    def empty_library(self):
+        self._transfer(12, 12)
+        self._library.clear()
+        return adafruit_fingerprint.OK
+
+    def close_uart(self):
+        pass
+
+
+def open_led():
+    """The status LED on board pin D13, claimed on first use.
+
+    The pin can only be claimed once, however many readers are opened.
+    """
+    global led
+    if led is None:
+        from digitalio import DigitalInOut, Direction
+        import board
+
+        led = DigitalInOut(board.D13)
+        led.direction = Direction.OUTPUT
+    return led
+
+
+def open_sensor(backend=config.SENSOR_BACKEND, port=config.SENSOR_PORT, index=0):
+    """Open the fingerprint sensor selected by SENSOR_BACKEND.
+
+    port is the serial port of a real reader; index tells simulated readers
+    apart, so that with SIM_SEED set each still gets its own random stream.
+    """
+    seed = f"{config.SIM_SEED}-{index}" if config.SIM_SEED and index else config.SIM_SEED
+    if backend == "simulated":
+        return SimulatedFingerprint(
+            capture_latency=config.SIM_CAPTURE_LATENCY,
+            baudrate=config.SIM_BAUDRATE,
+            failure_rates=config.SIM_FAILURES,
+            population=config.SIM_POPULATION,
+            image_dir=config.SIM_IMAGE_DIR,
+            seed=seed,
+            smudge_rate=config.SIM_SMUDGE_RATE,
+        )
+    if backend == "simulated-uart":
+        # The real driver talking the packet protocol to the simulator.
+        from uart import SimulatedUART, connect, raise_baudrate
+
+        simulator = SimulatedFingerprint(
+            capture_latency=config.SIM_CAPTURE_LATENCY,
+            failure_rates=config.SIM_FAILURES,
+            population=config.SIM_POPULATION,
+            image_dir=config.SIM_IMAGE_DIR,
+            seed=seed,
+            smudge_rate=config.SIM_SMUDGE_RATE,
+        )
+        port = SimulatedUART(simulator, baudrate=config.SENSOR_BAUDRATE, timing=bool(config.SIM_BAUDRATE))
+        finger = connect(port)
+        if config.SENSOR_MAX_BAUDRATE:
+            raise_baudrate(finger, port, config.SENSOR_MAX_BAUDRATE)
+        return finger
+    if backend == "uart":
+        import serial
+        from uart import connect, raise_baudrate
+
+        open_led()
+        port = serial.Serial(port, baudrate=config.SENSOR_BAUDRATE, timeout=1)
+        finger = connect(port)
+        if config.SENSOR_MAX_BAUDRATE:
+            raise_baudrate(finger, port, config.SENSOR_MAX_BAUDRATE)
+        return finger
+    raise ValueError(f"Unknown sensor backend '{backend}'")
+
+
+def open_sensors(backend=config.SENSOR_BACKEND):
+    """Open every configured reader; returns {name: finger}.
+
+    Real readers are named after their serial port (SENSOR_PORTS), simulated
+    ones "sim0", "sim1"... (SIM_SENSORS of them).
+    """
+    if backend == "uart":
+        return {port: open_sensor(backend, port=port) for port in config.SENSOR_PORTS}
+    return {f"sim{index}": open_sensor(backend, index=index) for index in range(config.SIM_SENSORS)}
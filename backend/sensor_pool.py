@@ -0,0 +1,138 @@
+import asyncio
+import contextlib
+import time
+
+import adafruit_fingerprint
+
+from metrics import InstrumentedSensor
+from sensor_worker import SensorWorker
+
+
+class SensorPool:
+    """Every reader attached to the gateway, each behind its own SensorWorker.
+
+    acquire(device) hands out the named reader, or with device=None the
+    least used healthy reader that is free, waiting until one is. A reader
+    belongs to one holder at a time, and since every worker has its own
+    command thread, holders of different readers run in parallel.
+
+    check_health() pings each idle reader; readers that fail it are not
+    handed out for device=None until a later check passes, but can still
+    be asked for by name.
+    """
+
+    def __init__(self, workers):
+        self.workers = {worker.name: worker for worker in workers}
+        self.healthy = dict.fromkeys(self.workers, True)
+        self.last_check = dict.fromkeys(self.workers)
+        self._busy = set()
+        self._changed = asyncio.Condition()
+        self._health_task = None
+
+    @classmethod
+    def open(cls, fingers, **kwargs):
+        """Pool of SensorWorkers for {name: finger}; kwargs go to every worker.
+
+        Each finger is wrapped in an InstrumentedSensor, so its commands show up in the metrics.
+        """
+        return cls([
+            SensorWorker(InstrumentedSensor(finger, name), name=name, **kwargs) for name, finger in fingers.items()
+        ])
+
+    def __len__(self):
+        return len(self.workers)
+
+    def _pick(self, device):
+        if device is not None:
+            return None if device in self._busy else device
+        free = [name for name in self.workers if name not in self._busy and self.healthy[name]]
+        return min(free, key=lambda name: self.workers[name].sessions, default=None)
+
+    async def acquire(self, device=None, timeout=None):
+        """Wait for a reader and return its worker; raises TimeoutError after timeout seconds."""
+        if device is not None and device not in self.workers:
+            raise KeyError(device)
+        async with self._changed:
+            await asyncio.wait_for(self._changed.wait_for(lambda: self._pick(device) is not None), timeout)
+            name = self._pick(device)
+            self._busy.add(name)
+        worker = self.workers[name]
+        worker.sessions += 1
+        return worker
+
+    async def release(self, worker):
+        async with self._changed:
+            self._busy.discard(worker.name)
+            self._changed.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def session(self, device=None, timeout=None):
+        worker = await self.acquire(device, timeout)
+        try:
+            yield worker
+        finally:
+            await self.release(worker)
+
+    async def broadcast(self, fn, *args, devices=None, timeout=None):
+        """Run fn(finger, *args) on each reader in devices (default all) at once.
+
+        Returns {name: result}, with the exception as the result for readers that failed.
+        """
+
+        async def run(name):
+            async with self.session(name, timeout) as worker:
+                return await worker.call(fn, *args)
+
+        names = list(self.workers if devices is None else devices)
+        results = await asyncio.gather(*(run(name) for name in names), return_exceptions=True)
+        return dict(zip(names, results))
+
+    async def check_health(self, timeout=5):
+        """Ping every idle reader once; returns {name: healthy}."""
+
+        async def check(name):
+            try:
+                async with self.session(name, timeout) as worker:
+                    code = await asyncio.wait_for(worker.call(lambda finger: finger.count_templates()), timeout)
+                healthy = code == adafruit_fingerprint.OK
+            except Exception as e:
+                self.workers[name].last_error = repr(e)
+                healthy = False
+            self.healthy[name] = healthy
+            self.last_check[name] = time.time()
+            async with self._changed:
+                self._changed.notify_all()
+
+        await asyncio.gather(*(check(name) for name in self.workers if name not in self._busy))
+        return dict(self.healthy)
+
+    async def _run_health_checks(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await self.check_health()
+
+    def start(self, health_interval=10):
+        """Start periodic health checks; call from the running event loop."""
+        if health_interval:
+            self._health_task = asyncio.get_running_loop().create_task(self._run_health_checks(health_interval))
+
+    def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+        for worker in self.workers.values():
+            worker.close()
+
+    def stats(self):
+        return {
+            name: {
+                "healthy": self.healthy[name],
+                "busy": name in self._busy,
+                "sessions": worker.sessions,
+                "commands": worker.commands,
+                "errors": worker.errors,
+                "busy_seconds": round(worker.busy_seconds, 3),
+                "last_error": worker.last_error,
+                "last_check": self.last_check[name],
+            }
+            for name, worker in self.workers.items()
+        }
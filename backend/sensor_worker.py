@@ -0,0 +1,205 @@
+import asyncio
+import contextlib
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import adafruit_fingerprint
+
+import capture
+import metrics
+from uart import ImageReader
+
+
+class SensorWorker:
+    """Single owner of a fingerprint sensor.
+
+    Every command runs on one dedicated thread, so UART frames from different
+    requests can never interleave, and callers await the result instead of
+    blocking a request thread. Multi-step sequences (capture, template,
+    search...) hold session() so another request cannot overwrite the
+    sensor's image or char buffers halfway through.
+    """
+
+    def __init__(self, finger, poll_interval=0.02, max_poll_interval=0.25, name="sensor"):
+        self.finger = finger
+        self.name = name
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._lock = asyncio.Lock()
+        self._reader = None
+        self.sessions = 0
+        self.commands = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.last_error = None
+        self.last_image = None
+
+    async def call(self, fn, *args, **kwargs):
+        """Run fn(finger, *args, **kwargs) on the sensor thread."""
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the caller's context so trace spans reach the request's trace.
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, context.run, self._run, fn, args, kwargs)
+
+    def _run(self, fn, args, kwargs):
+        started = time.perf_counter()
+        self.commands += 1
+        try:
+            return fn(self.finger, *args, **kwargs)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = repr(e)
+            raise
+        finally:
+            self.busy_seconds += time.perf_counter() - started
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        """Hold exclusive use of the sensor across several commands."""
+        async with self._lock:
+            self.sessions += 1
+            yield self
+
+    async def _poll(self, done, timeout, message):
+        """Call get_image() with backoff until done(code); returns that code.
+
+        Raises TimeoutError(message) after timeout seconds.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        delay = self.poll_interval
+        while True:
+            code = await self.call(lambda finger: finger.get_image())
+            if done(code):
+                return code
+            if deadline is not None and loop.time() + delay > deadline:
+                raise TimeoutError(message)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+
+    async def capture(self, timeout=None):
+        """Wait for a finger and take an image, polling with backoff.
+
+        Returns the get_image() code, or raises TimeoutError if no finger
+        was placed within timeout seconds.
+        """
+        with metrics.timed(metrics.CAPTURE_WAIT_SECONDS, sensor=self.name):
+            return await self._poll(lambda code: code != adafruit_fingerprint.NOFINGER, timeout,
+                                    "No finger placed on the sensor.")
+
+    async def wait_for_lift(self, timeout=None):
+        """Wait until the finger is off the sensor, so the next capture is a new placement.
+
+        Without this, get_image() just images the same press again. Raises
+        TimeoutError if the finger is still there after timeout seconds.
+        """
+        try:
+            await self._poll(lambda code: code == adafruit_fingerprint.NOFINGER, timeout,
+                             "Remove your finger from the sensor.")
+        except TimeoutError:
+            metrics.CAPTURE_ATTEMPTS.inc(sensor=self.name, outcome="not_removed")
+            raise
+
+    async def capture_template(self, slot=1, timeout=None, attempts=1, min_quality=None):
+        """Capture and template into slot, placing the finger up to attempts times.
+
+        Messy images (capture.RETRY_CODES) are retried rather than returned.
+        With min_quality set, every image is uploaded and scored first and
+        rejected below min_quality (see capture.grade()); slot=None skips
+        templating. Before each retry the finger has to be lifted (see
+        wait_for_lift()). Returns (code, image, quality) of the last attempt.
+        """
+        reader = None if min_quality is None else self._image_reader()
+        for attempt in range(attempts):
+            if attempt:
+                await self.wait_for_lift(timeout)
+            code = await self.capture(timeout)
+            image = quality = None
+            if code == adafruit_fingerprint.OK:
+                code, image, quality = await self.call(capture.grade, slot, reader, min_quality or 0)
+            if quality is not None and quality["score"] < (min_quality or 0):
+                outcome = "low_quality"
+            else:
+                outcome = metrics.CODE_NAMES.get(code, code)
+            metrics.CAPTURE_ATTEMPTS.inc(sensor=self.name, outcome=outcome)
+            if code not in capture.RETRY_CODES:
+                break
+        return code, image, quality
+
+    async def enroll(self, captures=2, candidates=2, timeout=None, attempts=1, min_quality=None):
+        """Build a model in char buffer 1 from the best captures of candidates placements.
+
+        With more candidates than captures, each candidate's image is
+        uploaded, rejected below min_quality and ranked by quality, its
+        template kept on the host, and the best ones are loaded back for
+        create_model(); a candidate that fails every attempt is skipped as
+        long as enough others succeed. Otherwise the captures are templated
+        straight into buffers 1 and 2, with no image uploads. The finger is
+        lifted and placed again between captures. Returns the
+        code of the step that failed (the last failed candidate's when too
+        few succeed), or OK. last_image is the best candidate's image, or
+        None when no images were uploaded.
+        """
+        self.last_image = None
+        if candidates <= captures:
+            for slot in range(1, captures + 1):
+                if slot > 1:
+                    await self.wait_for_lift(timeout)
+                code, _, _ = await self.capture_template(slot, timeout, attempts)
+                if code != adafruit_fingerprint.OK:
+                    return code
+            return adafruit_fingerprint.OK if captures == 1 else await self.create_model()
+
+        scored = []
+        failure = adafruit_fingerprint.IMAGEFAIL
+        for candidate in range(candidates):
+            if candidate:
+                await self.wait_for_lift(timeout)
+            code, image, quality = await self.capture_template(1, timeout, attempts, min_quality or 0)
+            if code == adafruit_fingerprint.OK:
+                scored.append((quality["score"], await self.call(capture.read_char_buffer, 1), image))
+            else:
+                failure = code
+        if len(scored) < captures:
+            # Never OK: the model would be built from fewer impressions than asked for.
+            return failure
+        scored.sort(key=lambda candidate: candidate[0], reverse=True)
+        self.last_image = scored[0][2]
+        return await self.call(capture.build_model, [template for _, template, _ in scored[:captures]])
+
+    async def template(self, slot=1):
+        return await self.call(lambda finger: finger.image_2_tz(slot))
+
+    async def create_model(self):
+        return await self.call(lambda finger: finger.create_model())
+
+    async def search(self):
+        """Search the sensor library; returns (code, finger_id, confidence)."""
+
+        def search(finger):
+            code = finger.finger_fast_search()
+            return code, finger.finger_id, finger.confidence
+
+        return await self.call(search)
+
+    async def store(self, location, slot=1):
+        return await self.call(lambda finger: finger.store_model(location, slot))
+
+    async def delete(self, location):
+        return await self.call(lambda finger: finger.delete_model(location))
+
+    async def image(self):
+        """Upload the sensor's image buffer as a uint8 IMAGE_HEIGHT x IMAGE_WIDTH array."""
+
+        reader = self._image_reader()
+        return await self.call(lambda finger: reader.read())
+
+    def _image_reader(self):
+        if self._reader is None:
+            self._reader = ImageReader(self.finger)
+        return self._reader
+
+    def close(self):
+        self._executor.shutdown(wait=True)
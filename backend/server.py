@@ -1,190 +1,599 @@
+import contextlib
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union
-from fastapi import FastAPI, HTTPException
-import firebase_admin
-from firebase_admin import credentials, db
+from fastapi import APIRouter, FastAPI, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-from digitalio import DigitalInOut, Direction
-import board
 import adafruit_fingerprint
-import serial
 from datetime import datetime
-import pytz
 
-gui_endpoint = "http://localhost:3000"
-database_url = "https://fingerprint-project-10f1a-default-rtdb.firebaseio.com/"
-
-
-app = FastAPI()
+import config
+from cascade import CascadeMatcher
+from database import open_database
+from events import EventBus
+import features
+from fingerprint_cache import FingerprintCache
+from image_store import MEDIA_TYPES, ImageStore
+from match_log import MatchLog
+import metrics
+import pattern_class
+from response_cache import ResponseCache, etag_matches
+from sensor import open_sensors
+from sensor_pool import SensorPool
+import template_sync
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[gui_endpoint],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-cred = credentials.Certificate("secret.json")
-firebase_admin.initialize_app(cred, {
-    "databaseURL": database_url
-})
+gui_endpoint = "http://localhost:3000"
 
-led = DigitalInOut(board.D13)
-led.direction = Direction.OUTPUT
-uart = serial.Serial("/dev/ttyS0", baudrate=57600, timeout=1)
-finger = adafruit_fingerprint.Adafruit_Fingerprint(uart)
+router = APIRouter()
+
+# Opened by open_resources() when the app starts, so importing this module touches no hardware.
+db = None
+fingerprints = None
+match_log = None
+images = None
+sensors = None
+gallery = None
+gallery_lock = threading.Lock()
+gallery_engine = None
+matcher = None
+responses = ResponseCache(ttl=config.RESPONSE_CACHE_TTL, max_entries=config.RESPONSE_CACHE_ENTRIES)
+events = EventBus(history=config.EVENTS_HISTORY, max_pending=config.EVENTS_CLIENT_BUFFER)
+
+
+def _open_fingerprints():
+    database = open_database()
+    cache = FingerprintCache(database.reference("fingerprints"), snapshot_path=config.CACHE_SNAPSHOT)
+    cache.start()
+    return database, cache
+
+
+def open_resources():
+    """Connect to the database and the readers and start the background workers.
+
+    The database (with the first load of the fingerprints mirror) and the
+    readers can each take seconds to come up, so they are opened in
+    parallel. Does nothing if the resources are already open.
+    """
+    global db, fingerprints, match_log, images, sensors, gallery, gallery_engine, matcher
+    if db is not None:
+        return
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        opening_database = pool.submit(_open_fingerprints)
+        opening_sensors = pool.submit(open_sensors)
+        db, fingerprints = opening_database.result()
+        sensors = SensorPool.open(opening_sensors.result(), poll_interval=config.CAPTURE_POLL_INTERVAL)
+    match_log = MatchLog(
+        config.MATCH_LOG_PATH,
+        flush=db.reference("fingerprints").update,
+        batch_size=config.MATCH_LOG_BATCH_SIZE,
+        flush_interval=config.MATCH_LOG_FLUSH_INTERVAL,
+        exists=lambda fingerprint_id: fingerprint_id in fingerprints,
+    )
+    match_log.start()
+    images = ImageStore(
+        config.IMAGE_STORE_DIR,
+        formats=config.IMAGE_FORMATS,
+        max_bytes=int(config.IMAGE_STORE_MAX_MB * 2**20) or None,
+        max_age=config.IMAGE_STORE_MAX_AGE_DAYS * 86400 or None,
+        workers=config.IMAGE_ENCODE_WORKERS,
+    )
+    if config.MATCH_GALLERY_FILE:
+        from gallery_file import MappedGallery
+        from identification import IdentificationEngine
+
+        gallery = MappedGallery.open(config.MATCH_GALLERY_FILE, dim=features.DESCRIPTOR_SIZE)
+        gallery_engine = IdentificationEngine(config.MATCH_GALLERY_FILE)
+    matcher = CascadeMatcher(
+        identify=gallery_engine and gallery_engine.identify,
+        min_confidence=config.SENSOR_MIN_CONFIDENCE,
+        threshold=config.MATCH_THRESHOLD,
+        binning=config.MATCH_BINNING,
+        known=fingerprints.__contains__,
+    )
+
+
+def close_resources():
+    global db, gallery, gallery_engine
+    if db is None:
+        return
+    sensors.close()
+    if gallery_engine is not None:
+        gallery_engine.close()
+        gallery_engine = None
+        gallery.close()
+        gallery = None
+    match_log.close()
+    fingerprints.close()
+    images.close()
+    db.close()
+    db = None
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await run_in_threadpool(open_resources)
+    sensors.start(config.SENSOR_HEALTH_INTERVAL)
+    try:
+        yield
+    finally:
+        close_resources()
+
+async def observe_request(request: Request, call_next):
+    """Time every request by route and, with TRACE_REQUESTS, report its spans."""
+    trace = metrics.start_trace() if config.TRACE_REQUESTS else None
+    started = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+    route = request.scope.get("route")
+    metrics.HTTP_REQUEST_SECONDS.observe(
+        elapsed, method=request.method, route=route.path if route else "unmatched", status=response.status_code,
+    )
+    if trace:
+        timing = metrics.server_timing(trace)
+        response.headers["Server-Timing"] = timing
+        print(f"{request.method} {request.url.path} {1000 * elapsed:.1f} ms: {timing}")
+    return response
 
 class EnrollRequest(BaseModel):
     id: int
     alias: str
 
-@app.post("/enroll")
-def enroll_fingerprint(request: EnrollRequest):
-    """Enroll a new fingerprint."""
+@contextlib.asynccontextmanager
+async def use_sensor(device=None):
+    """Hold the named reader, or any free one, for the rest of a request."""
+    try:
+        sensor = await sensors.acquire(device, timeout=config.CAPTURE_TIMEOUT)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No sensor named '{device}'.")
+    except TimeoutError:
+        raise HTTPException(status_code=503, detail="No sensor became free in time.")
+    try:
+        yield sensor
+    finally:
+        await sensors.release(sensor)
+
+def failed_capture(code, action):
+    detail = f"Failed to {action} fingerprint ({metrics.CODE_NAMES.get(code, code)})."
+    return HTTPException(status_code=400, detail=detail)
+
+async def capture_template(sensor, slot=1, min_quality=None):
+    """Capture a finger on the sensor and template it into slot; see SensorWorker.capture_template."""
+    try:
+        code, image, quality = await sensor.capture_template(
+            slot, timeout=config.CAPTURE_TIMEOUT, attempts=config.CAPTURE_ATTEMPTS, min_quality=min_quality,
+        )
+    except TimeoutError as e:
+        raise HTTPException(status_code=408, detail=str(e))
+    if code != adafruit_fingerprint.OK:
+        raise failed_capture(code, "capture" if slot is None else "template")
+    return image, quality
+
+def add_to_gallery(fingerprint_id, image):
+    """Enroll the print's minutiae in the host gallery under the ID it was stored under on the sensor."""
+    descriptor = features.extract(image)
+    bin = pattern_class.enroll_bin(pattern_class.classify(image))
+    with gallery_lock:
+        gallery.add(fingerprint_id, descriptor, bin)
+
+def remove_from_gallery(fingerprint_id):
+    with gallery_lock:
+        gallery.remove(fingerprint_id)
+
+
+@router.post("/enroll")
+async def enroll_fingerprint(request: EnrollRequest, device: Union[str, None] = None):
+    """Enroll a new fingerprint.
+
+    The finger is captured ENROLL_CAPTURES times on the given reader (or
+    any free one), or the best ENROLL_CAPTURES of ENROLL_CANDIDATES
+    captures are used, and the model is then copied to every other
+    reader, so any of them can match it. Readers the copy failed on are listed in "unreplicated";
+    /templates/reconcile copies the template over later. With a gallery
+    file, the print's minutiae are added to it under the same ID.
+    """
     print("Place your finger on the sensor to enroll...")
-    while finger.get_image() != adafruit_fingerprint.OK:
-        pass
-    if finger.image_2_tz(1) != adafruit_fingerprint.OK:
-        raise HTTPException(status_code=400, detail="Failed to template fingerprint.")
-    if finger.store_model(request.id) != adafruit_fingerprint.OK:
-        raise HTTPException(status_code=400, detail="Failed to store fingerprint in sensor.")
-
-    ref = db.reference(f"fingerprints/{request.id}")
-    ref.set({
+    template = image = None
+    async with use_sensor(device) as sensor:
+        try:
+            code = await sensor.enroll(
+                captures=config.ENROLL_CAPTURES,
+                candidates=config.ENROLL_CANDIDATES,
+                timeout=config.CAPTURE_TIMEOUT,
+                attempts=config.CAPTURE_ATTEMPTS,
+                min_quality=config.CAPTURE_MIN_QUALITY,
+            )
+        except TimeoutError as e:
+            raise HTTPException(status_code=408, detail=str(e))
+        if code != adafruit_fingerprint.OK:
+            raise failed_capture(code, "enroll")
+        if await sensor.store(request.id) != adafruit_fingerprint.OK:
+            raise HTTPException(status_code=400, detail="Failed to store fingerprint in sensor.")
+        if len(sensors) > 1:
+            template = await sensor.call(template_sync.read_template, request.id)
+        if gallery is not None:
+            # The best candidate's image, or the last capture's if none were uploaded.
+            image = sensor.last_image if sensor.last_image is not None else await sensor.image()
+
+    unreplicated = []
+    if template is not None:
+        others = [name for name in sensors.workers if name != sensor.name]
+        results = await sensors.broadcast(template_sync.write_template, request.id, template,
+                                          devices=others, timeout=config.CAPTURE_TIMEOUT)
+        unreplicated = sorted(name for name, result in results.items() if isinstance(result, Exception))
+    if image is not None:
+        await run_in_threadpool(add_to_gallery, request.id, image)
+
+    await run_in_threadpool(fingerprints.set, request.id, {
         "id": request.id,
         "alias": request.alias
     })
-    return {"message": "Fingerprint enrolled", "id": request.id, "alias": request.alias}
+    events.publish("enroll", {"id": request.id, "alias": request.alias, "sensor": sensor.name})
+    return {"message": "Fingerprint enrolled", "id": request.id, "alias": request.alias,
+            "sensor": sensor.name, "unreplicated": unreplicated}
 
 
-@app.post("/match")
-def match_fingerprint():
-    """Match a fingerprint."""
+@router.post("/match")
+async def match_fingerprint(device: Union[str, None] = None):
+    """Match a fingerprint on the given reader, or any free one."""
     print("Place your finger on the sensor to match...")
-    while finger.get_image() != adafruit_fingerprint.OK:
-        pass
-    if finger.image_2_tz(1) != adafruit_fingerprint.OK:
-        raise HTTPException(status_code=400, detail="Failed to template fingerprint.")
-    if finger.finger_fast_search() != adafruit_fingerprint.OK:
-        raise HTTPException(status_code=404, detail="No match found.")
-
-    matched_id = finger.finger_id
-    ref = db.reference(f"fingerprints/{matched_id}")
-    
-    alias = ref.get().get("alias", "Unknown")
+    async with use_sensor(device) as sensor:
+        await capture_template(sensor, 1)
+        result = await sensor.call(matcher.match)
+        if result is None:
+            raise HTTPException(status_code=404, detail="No match found.")
+    stage, matched_id, confidence = result
+
+    alias = (fingerprints.get(matched_id) or {}).get("alias", "Unknown")
     
     timestamp = datetime.now()
     human_readable_timestamp = timestamp.strftime("%Y-%m-%d %H:%M:%S")
 
-    matches_ref = ref.child("matches")
-    matches_ref.push({
+    match = {
         "timestamp": human_readable_timestamp
+    }
+    match_id = await run_in_threadpool(match_log.append, matched_id, match)
+    fingerprints.add_match(matched_id, match_id, match)
+    events.publish("match", {
+        "fingerprint_id": matched_id,
+        "match_id": match_id,
+        "alias": alias,
+        "timestamp": human_readable_timestamp,
+        "confidence": confidence,
+        "matched_by": stage,
+        "sensor": sensor.name,
     })
 
     return {
         "message": "Fingerprint matched",
         "id": matched_id,
         "alias": alias,
-        "confidence": finger.confidence,
+        "confidence": confidence,
+        "matched_by": stage,
+        "sensor": sensor.name,
         "timestamp": human_readable_timestamp
     }
 
 
-@app.post("/delete/{fingerprint_id}")
-def delete_fingerprint(fingerprint_id: int):
-    """Delete a fingerprint."""
-    if finger.delete_model(fingerprint_id) != adafruit_fingerprint.OK:
-        raise HTTPException(status_code=400, detail="Failed to delete fingerprint from sensor.")
+@router.post("/delete/{fingerprint_id}")
+async def delete_fingerprint(fingerprint_id: int):
+    """Delete a fingerprint from every reader.
 
-    ref = db.reference(f"fingerprints/{fingerprint_id}")
-    ref.delete()
-    return {"message": f"Fingerprint {fingerprint_id} deleted."}
+    Readers the delete failed on are listed in "undeleted"; their template is
+    an orphan once the database entry is gone, which
+    /templates/reconcile?delete_orphans=true removes later. Fails with 400,
+    changing nothing else, if no reader deleted it.
+    """
+    results = await sensors.broadcast(lambda finger: finger.delete_model(fingerprint_id),
+                                      timeout=config.CAPTURE_TIMEOUT)
+    undeleted = sorted(name for name, result in results.items() if result != adafruit_fingerprint.OK)
+    if len(undeleted) == len(results):
+        raise HTTPException(status_code=400, detail="Failed to delete fingerprint from sensor.")
 
-@app.post("/save-image")
-def save_fingerprint_image():
-    """Save a fingerprint image."""
+    if gallery is not None:
+        await run_in_threadpool(remove_from_gallery, fingerprint_id)
+    # Queued matches would re-create the fingerprint's node once flushed.
+    await run_in_threadpool(match_log.discard, fingerprint_id)
+    await run_in_threadpool(fingerprints.delete, fingerprint_id)
+    events.publish("delete", {"id": fingerprint_id})
+    return {"message": f"Fingerprint {fingerprint_id} deleted.", "undeleted": undeleted}
+
+@router.post("/save-image")
+async def save_fingerprint_image(device: Union[str, None] = None):
+    """Capture a fingerprint image and store it.
+
+    Captures scoring below CAPTURE_MIN_QUALITY are retaken. Returns once
+    the raw pixels are on disk; PNG/WebP versions are encoded in the
+    background and served from /images/{hash}.
+    """
     print("Place your finger on the sensor to capture the image...")
-    while finger.get_image() != adafruit_fingerprint.OK:
-        pass
-    image_data = finger.get_fpdata(sensorbuffer="image")
-    with open("fingerprint_image.raw", "wb") as f:
-        f.write(bytearray(image_data))
-    return {"message": "Fingerprint image saved as 'fingerprint_image.raw'"}
-
-@app.get("/matches/{alias}")
-def get_matches(alias: str):
-    """Retrieve all matches for a specific alias."""
-    ref = db.reference("fingerprints")
-    fingerprints = ref.get()
-
-    if not fingerprints:
+    async with use_sensor(device) as sensor:
+        image_data, quality = await capture_template(sensor, None, min_quality=config.CAPTURE_MIN_QUALITY)
+    digest = await run_in_threadpool(images.put, image_data)
+    return {"message": "Fingerprint image saved", "hash": digest, "url": f"/images/{digest}", "quality": quality}
+
+@router.get("/images/{digest}")
+async def get_image(digest: str, request: Request, format: str = "png"):
+    """Serve a stored image as png, webp or raw (8-bit pixels, 288 rows of 256).
+
+    The content never changes for a given hash and format, so the ETag is
+    derived from them, If-None-Match gets a 304, and Range requests are
+    answered with partial content.
+    """
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{format}'.")
+    try:
+        path = await run_in_threadpool(images.get, digest, format, config.CAPTURE_TIMEOUT)
+    except TimeoutError:
+        raise HTTPException(status_code=503, detail=f"Image '{digest}' is still being encoded.",
+                            headers={"Retry-After": "5"})
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"No image with hash '{digest}'.")
+
+    etag = f'"{digest}.{format}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=MEDIA_TYPES[format], headers=headers)
+
+@router.get("/images")
+def get_image_store_stats():
+    """Size and activity of the image store."""
+    return images.stats()
+
+@router.get("/templates/export")
+async def export_templates(device: Union[str, None] = None):
+    """Stream every template on a reader, with its alias, as a template file.
+
+    See backend/template_sync.py for the format. The reader is held until
+    the last template has been sent.
+    """
+    if device is not None and device not in sensors.workers:
+        raise HTTPException(status_code=404, detail=f"No sensor named '{device}'.")
+    aliases = {entry["id"]: entry["alias"] for entry in fingerprints.aliases()}
+
+    async def stream():
+        async with use_sensor(device) as sensor:
+            chunks = await sensor.call(template_sync.export_chunks, aliases)
+            while (chunk := await sensor.call(lambda finger: next(chunks, None))) is not None:
+                yield chunk
+
+    return StreamingResponse(stream(), media_type="application/octet-stream",
+                             headers={"Content-Disposition": 'attachment; filename="templates.bin"'})
+
+@router.post("/templates/import")
+async def import_templates(request: Request, device: Union[str, None] = None):
+    """Store every template of an uploaded template file on a reader (default all of them).
+
+    Records with an alias are written to the database in one update; the
+    match history of existing entries is kept.
+    """
+    if device is not None and device not in sensors.workers:
+        raise HTTPException(status_code=404, detail=f"No sensor named '{device}'.")
+    body = await request.body()
+    try:
+        imported = {location: alias for location, alias, _ in template_sync.read_records(io.BytesIO(body))}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    results = await sensors.broadcast(lambda finger: template_sync.import_templates(finger, io.BytesIO(body)),
+                                      devices=None if device is None else [device])
+    failed = {name: repr(result) for name, result in results.items() if isinstance(result, Exception)}
+    if len(failed) == len(results):
+        raise HTTPException(status_code=502, detail=failed)
+
+    updates = {f"{location}/id": location for location in imported}
+    updates.update({f"{location}/alias": alias for location, alias in imported.items() if alias})
+    if updates:
+        await run_in_threadpool(fingerprints.update, updates)
+    return {"message": f"Imported {len(imported)} templates.", "ids": sorted(imported), "failed": failed}
+
+@router.post("/templates/reconcile")
+async def reconcile_templates(dry_run: bool = False, delete_orphans: bool = False, prune_missing: bool = False,
+                              force: bool = False):
+    """Diff every reader's templates against the database and fix the drift.
+
+    Templates with no database entry are reported, and deleted from the
+    reader only with delete_orphans; with an empty database that also
+    needs force, as it would wipe every reader. A template missing from
+    some readers is copied over from one that has it; entries whose
+    template is gone from every reader are only reported unless
+    prune_missing is set.
+    """
+    if delete_orphans and not dry_run and not force and len(fingerprints) == 0:
+        raise HTTPException(status_code=409, detail="The database is empty; deleting orphans would wipe every "
+                                                    "reader. Check DATABASE_BACKEND or pass force=true.")
+    reports = await sensors.broadcast(template_sync.reconcile, fingerprints, delete_orphans, False, dry_run, force)
+    failed = {name: repr(report) for name, report in reports.items() if isinstance(report, Exception)}
+    if failed:
+        raise HTTPException(status_code=502, detail=failed)
+
+    missing = {name: set(report["missing"]) for name, report in reports.items()}
+    missing_everywhere = set.intersection(*missing.values())
+    copied = {}
+    for fingerprint_id in sorted(set.union(*missing.values()) - missing_everywhere):
+        targets = [name for name in missing if fingerprint_id in missing[name]]
+        source = next(name for name in missing if fingerprint_id not in missing[name])
+        if dry_run:
+            continue
+        async with use_sensor(source) as sensor:
+            template = await sensor.call(template_sync.read_template, fingerprint_id)
+        results = await sensors.broadcast(template_sync.write_template, fingerprint_id, template, devices=targets)
+        for name, result in results.items():
+            if not isinstance(result, Exception):
+                copied.setdefault(name, []).append(fingerprint_id)
+
+    pruned = []
+    if prune_missing and missing_everywhere and not dry_run:
+        await run_in_threadpool(fingerprints.update, {fingerprint_id: None for fingerprint_id in missing_everywhere})
+        pruned = sorted(missing_everywhere)
+    return {
+        "sensors": reports,
+        "copied": copied,
+        "missing_everywhere": sorted(missing_everywhere),
+        "deleted_from_database": pruned,
+    }
+
+def cached_json(request, build):
+    """Serve the payload build() returns through the response cache.
+
+    Clients revalidate with If-None-Match (answered with a 304 while the
+    data is unchanged), and bodies over 1 KiB go out gzipped to clients
+    that accept it.
+    """
+    key = request.url.path + "?" + request.url.query
+    version = fingerprints.version
+    entry = responses.get(key, version)
+    if entry is None:
+        entry = responses.put(key, version, build())
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    body, encoding = entry.encoded(request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
+
+@router.get("/matches/{alias}")
+def get_matches(
+    request: Request,
+    alias: str,
+    since: Union[str, None] = None,
+    until: Union[str, None] = None,
+    limit: Union[int, None] = Query(default=None, ge=1, le=1000),
+    cursor: Union[str, None] = None,
+):
+    """Retrieve matches for a specific alias, oldest first.
+
+    since (inclusive) and until (exclusive) filter on the "YYYY-MM-DD HH:MM:SS"
+    timestamp and may be prefixes such as "2024-05-01". When limit is set the
+    response carries a next_cursor to pass back for the following page.
+    """
+    if not len(fingerprints):
         raise HTTPException(status_code=404, detail="No fingerprints found in the database.")
 
-    matches = []
-
-    if isinstance(fingerprints, list):  # Handle list format
-        for fingerprint_id, data in enumerate(fingerprints):
-            if data and data.get("alias") == alias and "matches" in data:
-                match_entries = data["matches"]
-                for match_id, match_data in match_entries.items():
-                    matches.append({
-                        "fingerprint_id": fingerprint_id,
-                        "match_id": match_id,
-                        "timestamp": match_data["timestamp"]
-                    })
-
-    elif isinstance(fingerprints, dict):  # Handle dictionary format
-        for fingerprint_id, data in fingerprints.items():
-            if data.get("alias") == alias and "matches" in data:
-                match_entries = data["matches"]
-                for match_id, match_data in match_entries.items():
-                    matches.append({
-                        "fingerprint_id": fingerprint_id,
-                        "match_id": match_id,
-                        "timestamp": match_data["timestamp"]
-                    })
-
-    if not matches:
-        raise HTTPException(status_code=404, detail=f"No matches found for alias '{alias}'.")
+    def build():
+        try:
+            matches, next_cursor = fingerprints.matches(alias, since, until, limit, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-    return {
-        "alias": alias,
-        "matches": matches
-    }
+        if not matches:
+            raise HTTPException(status_code=404, detail=f"No matches found for alias '{alias}'.")
 
-@app.get("/aliases")
-def get_aliases():
-    """Retrieve all fingerprint IDs and their aliases."""
-    ref = db.reference("fingerprints")
-    fingerprints = ref.get()
+        return {
+            "alias": alias,
+            "matches": matches,
+            "next_cursor": next_cursor
+        }
+
+    return cached_json(request, build)
 
-    if not fingerprints:
+@router.get("/aliases")
+def get_aliases(request: Request):
+    """Retrieve all fingerprint IDs and their aliases."""
+    if not len(fingerprints):
         raise HTTPException(status_code=404, detail="No fingerprints found in the database.")
 
-    aliases = []
+    return cached_json(request, lambda: {"aliases": fingerprints.aliases()})
+
+
+@router.get("/events")
+async def stream_events(request: Request, types: Union[str, None] = None, last_event_id: Union[str, None] = None):
+    """Stream enroll, match and delete events as server-sent events.
+
+    types limits the stream to a comma-separated list of event types.
+    Reconnecting clients (EventSource sends Last-Event-ID by itself) get
+    the events they missed first; see backend/events.py for when the
+    server ends a stream and how resuming works.
+    """
+    last_event_id = request.headers.get("last-event-id") or last_event_id
+    types = None if types is None else [t for t in types.split(",") if t]
+
+    async def stream():
+        subscription = events.subscribe(last_event_id, types)
+        try:
+            yield "retry: 2000\n\n"
+            while True:
+                event = await subscription.next(timeout=config.EVENTS_KEEPALIVE)
+                if event is not None:
+                    yield event.encode()
+                elif subscription.overflowed:
+                    break
+                else:
+                    yield ": keep-alive\n\n"
+        finally:
+            events.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.get("/match-log")
+def get_match_log_stats():
+    """Queue depth and flush latency of the match event log."""
+    return match_log.stats()
+
+@router.get("/database")
+def get_database_stats():
+    """Which database backend is in use and, for sqlite, its size and replication queue."""
+    return {"backend": config.DATABASE_BACKEND, **(db.stats() if hasattr(db, "stats") else {})}
 
-    if isinstance(fingerprints, list):  # Handle list format
-        for fingerprint_id, data in enumerate(fingerprints):
-            if data:  # Skip empty entries in the list
-                alias = data.get("alias", "Unknown")
-                aliases.append({
-                    "id": fingerprint_id,
-                    "alias": alias
-                })
 
-    elif isinstance(fingerprints, dict):  # Handle dictionary format
-        for fingerprint_id, data in fingerprints.items():
-            alias = data.get("alias", "Unknown")
-            aliases.append({
-                "id": int(fingerprint_id),
-                "alias": alias
-            })
+@router.get("/response-cache")
+def get_response_cache_stats():
+    """Size and hit rate of the /aliases and /matches response cache."""
+    return responses.stats()
 
-    return {"aliases": aliases}
 
+@router.get("/match-stats")
+def get_match_stats():
+    """Per-stage latency and hit rates of the sensor/gallery match cascade."""
+    return matcher.stats()
 
-@app.get("/")
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """All metrics in the Prometheus text format."""
+    metrics.MATCH_LOG_DEPTH.set(match_log.depth)
+    metrics.IMAGE_STORE_BYTES.set(images.total_bytes)
+    if getattr(db, "replicator", None) is not None:
+        metrics.REPLICATION_DEPTH.set(db.outbox_depth())
+    metrics.EVENT_SUBSCRIBERS.set(events.stats()["subscribers"])
+    for name, stats in sensors.stats().items():
+        metrics.SENSOR_HEALTHY.set(int(stats["healthy"]), sensor=name)
+        metrics.SENSOR_BUSY.set(int(stats["busy"]), sensor=name)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/sensors")
+def get_sensors():
+    """Health and activity of every reader in the pool."""
+    return sensors.stats()
+
+
+@router.get("/")
 def read_root():
     return {"Hello": "World"}
+
+
+def create_app():
+    """The FastAPI app; its resources are opened on startup and closed on shutdown."""
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[gui_endpoint],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.middleware("http")(observe_request)
+    app.include_router(router)
+    return app
+
+
+app = create_app()
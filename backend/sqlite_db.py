@@ -0,0 +1,327 @@
+import contextlib
+import copy
+import json
+import sqlite3
+import threading
+
+from database import push_id
+from fake_db import Event, ListenerRegistration
+
+ROOT = "fingerprints"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    id TEXT PRIMARY KEY,
+    alias TEXT,
+    fields TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS fingerprints_alias ON fingerprints (alias);
+CREATE TABLE IF NOT EXISTS matches (
+    fingerprint_id TEXT NOT NULL,
+    match_id TEXT NOT NULL,
+    timestamp TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (fingerprint_id, match_id)
+);
+CREATE INDEX IF NOT EXISTS matches_timestamp ON matches (timestamp);
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+"""
+
+
+def _split(path):
+    return [part for part in path.split("/") if part]
+
+
+def _normalize(fingerprints):
+    """Firebase returns integer-keyed nodes as lists; key everything by string ID."""
+    if isinstance(fingerprints, list):
+        return {str(i): data for i, data in enumerate(fingerprints) if data}
+    return {str(key): data for key, data in (fingerprints or {}).items() if data is not None}
+
+
+def _lookup(node, parts):
+    for part in parts:
+        if not isinstance(node, dict) or part not in node:
+            return None
+        node = node[part]
+    return node
+
+
+def _replace(node, parts, value):
+    """node with the value at parts replaced (None deletes); empty objects become None."""
+    if not parts:
+        return value
+    node = dict(node) if isinstance(node, dict) else {}
+    child = _replace(node.get(parts[0]), parts[1:], value)
+    if child is None or child == {}:
+        node.pop(parts[0], None)
+    else:
+        node[parts[0]] = child
+    return node or None
+
+
+class SQLiteDatabase:
+    """The fingerprints tree in a local SQLite database, behind the Firebase reference API.
+
+    reference("fingerprints/...") returns objects with the same get/set/
+    update/push/delete/child/listen methods as firebase_admin.db.Reference,
+    so the server runs on it unchanged, at local-disk latency and without a
+    network. The tree is kept in tables rather than as one document:
+
+        fingerprints  one row per enrolled ID, with its alias and other fields
+        matches       one row per recorded match, so pushing a match is one insert
+
+    The database is in WAL mode and every write is one transaction.
+    Listeners are called after the write, with the put/patch events Firebase
+    would send. With replicate=True, each write is also queued in an outbox
+    table in the same transaction, for a Replicator (set as .replicator,
+    closed with the database) to send to Firebase.
+    """
+
+    def __init__(self, path, replicate=False):
+        self.path = path
+        self.replicate = replicate
+        self.lock = threading.RLock()
+        self.listeners = []
+        self.reads = 0
+        self.writes = 0
+        self.replicator = None
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def reference(self, path="/"):
+        parts = _split(path)
+        if parts[:1] != [ROOT]:
+            raise ValueError(f"The SQLite database only stores the '{ROOT}' tree, not '{path}'.")
+        return SQLiteReference(self, parts)
+
+    def close(self):
+        if self.replicator is not None:
+            self.replicator.close()
+        with self.lock:
+            self._conn.close()
+
+    def is_empty(self):
+        with self.lock:
+            return not any(
+                self._conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() for table in ("fingerprints", "matches")
+            )
+
+    def load(self, fingerprints):
+        """Replace the tree with fingerprints, without queueing it for replication."""
+        with self.lock, self._transaction():
+            self._put([], copy.deepcopy(fingerprints))
+
+    # Reads
+
+    def _fields(self, fingerprint_id):
+        row = self._conn.execute("SELECT alias, fields FROM fingerprints WHERE id = ?", (fingerprint_id,)).fetchone()
+        if row is None:
+            return {}
+        fields = json.loads(row[1])
+        if row[0] is not None:
+            fields["alias"] = row[0]
+        return fields
+
+    def _matches(self, fingerprint_id):
+        rows = self._conn.execute(
+            "SELECT match_id, data FROM matches WHERE fingerprint_id = ? ORDER BY match_id", (fingerprint_id,)
+        )
+        return {match_id: json.loads(data) for match_id, data in rows}
+
+    def _tree(self):
+        tree = {}
+        for fingerprint_id, alias, fields in self._conn.execute("SELECT id, alias, fields FROM fingerprints"):
+            node = tree[fingerprint_id] = json.loads(fields)
+            if alias is not None:
+                node["alias"] = alias
+        rows = self._conn.execute("SELECT fingerprint_id, match_id, data FROM matches ORDER BY fingerprint_id, match_id")
+        for fingerprint_id, match_id, data in rows:
+            tree.setdefault(fingerprint_id, {}).setdefault("matches", {})[match_id] = json.loads(data)
+        return tree or None
+
+    def _node(self, parts):
+        """Value at parts (below the fingerprints node), read from the tables."""
+        if not parts:
+            return self._tree()
+        fingerprint_id, rest = parts[0], parts[1:]
+        if rest[:1] == ["matches"]:
+            if len(rest) == 1:
+                return self._matches(fingerprint_id) or None
+            row = self._conn.execute(
+                "SELECT data FROM matches WHERE fingerprint_id = ? AND match_id = ?", (fingerprint_id, rest[1])
+            ).fetchone()
+            return None if row is None else _lookup(json.loads(row[0]), rest[2:])
+        node = self._fields(fingerprint_id)
+        if not rest:
+            matches = self._matches(fingerprint_id)
+            if matches:
+                node["matches"] = matches
+            return node or None
+        return _lookup(node, rest)
+
+    # Writes
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _store_fields(self, fingerprint_id, fields):
+        fields = dict(fields or {})
+        alias = fields.pop("alias", None)
+        if not isinstance(alias, str) and alias is not None:
+            fields["alias"], alias = alias, None
+        if alias is None and not fields:
+            self._conn.execute("DELETE FROM fingerprints WHERE id = ?", (fingerprint_id,))
+        else:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fingerprints (id, alias, fields) VALUES (?, ?, ?)",
+                (fingerprint_id, alias, json.dumps(fields)),
+            )
+
+    def _store_match(self, fingerprint_id, match_id, match):
+        if match is None:
+            self._conn.execute(
+                "DELETE FROM matches WHERE fingerprint_id = ? AND match_id = ?", (fingerprint_id, match_id)
+            )
+        else:
+            timestamp = match.get("timestamp") if isinstance(match, dict) else None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO matches (fingerprint_id, match_id, timestamp, data) VALUES (?, ?, ?, ?)",
+                (fingerprint_id, match_id, timestamp, json.dumps(match)),
+            )
+
+    def _put(self, parts, value):
+        """Write value at parts (below the fingerprints node); None deletes."""
+        if not parts:
+            self._conn.execute("DELETE FROM fingerprints")
+            self._conn.execute("DELETE FROM matches")
+            for fingerprint_id, node in _normalize(value).items():
+                self._put([fingerprint_id], node)
+            return
+        fingerprint_id, rest = parts[0], parts[1:]
+        if not rest:
+            node = dict(value) if isinstance(value, dict) else {}
+            self._conn.execute("DELETE FROM matches WHERE fingerprint_id = ?", (fingerprint_id,))
+            for match_id, match in (node.pop("matches", None) or {}).items():
+                self._store_match(fingerprint_id, match_id, match)
+            self._store_fields(fingerprint_id, node)
+        elif rest == ["matches"]:
+            self._conn.execute("DELETE FROM matches WHERE fingerprint_id = ?", (fingerprint_id,))
+            for match_id, match in (value or {}).items():
+                self._store_match(fingerprint_id, match_id, match)
+        elif rest[0] == "matches":
+            match = self._node(parts[:3]) if len(rest) > 2 else None
+            self._store_match(fingerprint_id, rest[1], _replace(match, rest[2:], value))
+        else:
+            self._store_fields(fingerprint_id, _replace(self._fields(fingerprint_id), rest, value))
+
+    def _write(self, parts, values):
+        """Apply {relative path: value} at parts in one transaction and queue it for replication."""
+        with self.lock, self._transaction():
+            for path, value in values.items():
+                self._put(parts[1:] + _split(path), copy.deepcopy(value))
+                if self.replicate:
+                    self._conn.execute(
+                        "INSERT INTO outbox (path, data) VALUES (?, ?)",
+                        ("/".join(parts + _split(path)), json.dumps(value)),
+                    )
+            self.writes += 1
+
+    def _notify(self, event_type, parts, data):
+        for listener_parts, callback in list(self.listeners):
+            if parts[:len(listener_parts)] == listener_parts:
+                relative = "/" + "/".join(parts[len(listener_parts):])
+                callback(Event(event_type, relative, copy.deepcopy(data)))
+            elif listener_parts[:len(parts)] == parts:
+                # A write above the listened-to node replaces it entirely.
+                callback(Event("put", "/", self._node(listener_parts[1:])))
+
+    # Replication
+
+    def outbox(self, limit):
+        """The oldest queued writes, as [(seq, path, value)]."""
+        with self.lock:
+            rows = self._conn.execute("SELECT seq, path, data FROM outbox ORDER BY seq LIMIT ?", (limit,)).fetchall()
+        return [(seq, path, json.loads(data)) for seq, path, data in rows]
+
+    def acknowledge(self, seq):
+        """Drop the queued writes up to and including seq, once they are replicated."""
+        with self.lock:
+            self._conn.execute("DELETE FROM outbox WHERE seq <= ?", (seq,))
+
+    def outbox_depth(self):
+        with self.lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def stats(self):
+        with self.lock:
+            fingerprints = self._conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+            matches = self._conn.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+        return {
+            "path": self.path,
+            "fingerprints": fingerprints,
+            "matches": matches,
+            "reads": self.reads,
+            "writes": self.writes,
+            "replication": None if self.replicator is None else self.replicator.stats(),
+        }
+
+
+class SQLiteReference:
+    def __init__(self, database, parts):
+        self._database = database
+        self._parts = parts
+
+    @property
+    def key(self):
+        return self._parts[-1]
+
+    @property
+    def path(self):
+        return "/" + "/".join(self._parts)
+
+    def child(self, path):
+        return SQLiteReference(self._database, self._parts + _split(path))
+
+    def get(self):
+        with self._database.lock:
+            self._database.reads += 1
+            return self._database._node(self._parts[1:])
+
+    def set(self, value):
+        with self._database.lock:
+            self._database._write(self._parts, {"": value})
+            self._database._notify("put", self._parts, value)
+
+    def update(self, value):
+        with self._database.lock:
+            self._database._write(self._parts, value)
+            self._database._notify("patch", self._parts, value)
+
+    def push(self, value=""):
+        ref = self.child(push_id())
+        ref.set(value)
+        return ref
+
+    def delete(self):
+        self.set(None)
+
+    def listen(self, callback):
+        with self._database.lock:
+            listener = (self._parts, callback)
+            self._database.listeners.append(listener)
+            callback(Event("put", "/", self._database._node(self._parts[1:])))
+        return ListenerRegistration(self._database, listener)
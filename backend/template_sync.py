@@ -0,0 +1,147 @@
+"""Bulk transfer of templates between the sensor's flash and a file.
+
+A template file is
+
+    "FPT1" | template size (2) | record count (4)
+
+followed by that many records of
+
+    location (2) | alias length (1) | alias (UTF-8) | template
+
+with all integers big-endian. Templates move through char buffer 1 with
+the sensor's LoadChar/UpChar and DownChar/Store commands, one record at
+a time, so neither side ever holds more than one template in flight.
+"""
+import struct
+
+import adafruit_fingerprint
+
+MAGIC = b"FPT1"
+HEADER = struct.Struct(">4sHI")
+RECORD = struct.Struct(">HB")
+
+
+def file_header(template_size, count):
+    return HEADER.pack(MAGIC, template_size, count)
+
+
+def encode_record(location, template, alias=""):
+    alias = alias.encode()[:255]
+    return RECORD.pack(location, len(alias)) + alias + bytes(template)
+
+
+def read_records(f):
+    """Yield (location, alias, template) from a template file opened for binary reading."""
+    magic, template_size, count = HEADER.unpack(_read(f, HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("Not a template file.")
+    for _ in range(count):
+        location, alias_length = RECORD.unpack(_read(f, RECORD.size))
+        alias = _read(f, alias_length).decode()
+        yield location, alias, _read(f, template_size)
+
+
+def _read(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Template file is truncated.")
+    return data
+
+
+def read_template(finger, location):
+    """Template stored at location, as bytes."""
+    code = finger.load_model(location, 1)
+    if code != adafruit_fingerprint.OK:
+        raise RuntimeError(f"Failed to load template {location} (code {code})")
+    return bytes(finger.get_fpdata(sensorbuffer="char", slot=1))
+
+
+def write_template(finger, location, template):
+    """Store template at location, replacing whatever was there."""
+    finger.send_fpdata(list(template), sensorbuffer="char", slot=1)
+    code = finger.store_model(location, 1)
+    if code != adafruit_fingerprint.OK:
+        raise RuntimeError(f"Failed to store template {location} (code {code})")
+
+
+def sensor_locations(finger):
+    if finger.read_templates() != adafruit_fingerprint.OK:
+        raise RuntimeError("Failed to read template locations")
+    return list(finger.templates)
+
+
+def export_chunks(finger, aliases=None):
+    """Yield a template file for every template on the sensor, one record at a time.
+
+    aliases maps location to alias and is stored alongside each template.
+    Every next() talks to the sensor, so iterate on the thread that owns it.
+    """
+    aliases = aliases or {}
+    locations = sensor_locations(finger)
+    # The header needs the template size, which only the sensor knows.
+    first = read_template(finger, locations[0]) if locations else b""
+    yield file_header(len(first), len(locations))
+    for i, location in enumerate(locations):
+        template = first if i == 0 else read_template(finger, location)
+        yield encode_record(location, template, aliases.get(location, ""))
+
+
+def export_templates(finger, f, aliases=None):
+    """Write every template on the sensor to f; returns how many were written."""
+    chunks = export_chunks(finger, aliases)
+    f.write(next(chunks))
+    count = 0
+    for chunk in chunks:
+        f.write(chunk)
+        count += 1
+    return count
+
+
+def import_templates(finger, f):
+    """Store every template in f on the sensor; returns {location: alias}.
+
+    The whole file is parsed first, so a truncated file changes nothing.
+    """
+    imported = {}
+    for location, alias, template in list(read_records(f)):
+        write_template(finger, location, template)
+        imported[location] = alias
+    return imported
+
+
+def reconcile(finger, fingerprints, delete_orphans=False, prune_missing=False, dry_run=False, force=False):
+    """Bring the sensor's flash and the fingerprints database back in step.
+
+    Orphans are templates on the sensor with no database entry; nothing
+    can ever resolve their alias, so with delete_orphans they are deleted
+    from the sensor. An empty database more likely means the wrong or an
+    unsynced database than a sensor full of orphans, so deleting against
+    one raises ValueError unless force is set.
+    Missing are database entries whose template is gone from the sensor;
+    they keep their match history and are only removed with prune_missing.
+    Both sides are read once and the database fixes go out as one update.
+    """
+    on_sensor = set(sensor_locations(finger))
+    in_database = {entry["id"] for entry in fingerprints.aliases()}
+    if delete_orphans and not dry_run and not in_database and on_sensor and not force:
+        raise ValueError("The database is empty; refusing to delete every template on the sensor without force.")
+    orphans = sorted(on_sensor - in_database)
+    missing = sorted(in_database - on_sensor)
+    report = {
+        "sensor": len(on_sensor),
+        "database": len(in_database),
+        "orphans": orphans,
+        "missing": missing,
+        "deleted_from_sensor": [],
+        "deleted_from_database": [],
+    }
+    if dry_run:
+        return report
+    if delete_orphans:
+        for location in orphans:
+            if finger.delete_model(location) == adafruit_fingerprint.OK:
+                report["deleted_from_sensor"].append(location)
+    if prune_missing and missing:
+        fingerprints.update({fingerprint_id: None for fingerprint_id in missing})
+        report["deleted_from_database"] = missing
+    return report
@@ -0,0 +1,291 @@
+"""Packet-level access to the sensor's serial port.
+
+The R30x packet format is
+
+    EF 01 | address (4) | type (1) | length (2) | payload | checksum (2)
+
+where length counts the payload and checksum, and checksum is the 16-bit
+sum of the type, length and payload bytes. An image upload (UpImage) is
+one acknowledgement followed by IMAGE_SIZE bytes of 4-bit pixels split
+into fixed-size data packets, the last one marked as an end packet.
+"""
+import struct
+import time
+
+import adafruit_fingerprint
+import numpy as np
+
+import metrics
+from sensor import IMAGE_SIZE, TEMPLATE_SIZE, unpack_image
+
+START_CODE = b"\xef\x01"
+ADDRESS = b"\xff\xff\xff\xff"
+COMMAND_PACKET = 0x01
+DATA_PACKET = 0x02
+ACK_PACKET = 0x07
+END_DATA_PACKET = 0x08
+HEADER_SIZE = 9  # start code, address, type, length
+UPLOAD_IMAGE = 0x0A
+BAUDRATE_PARAM = 4
+BAUDRATES = (115200, 57600, 9600, 19200, 38400, 76800)
+
+
+def packet(packet_type, payload):
+    length = len(payload) + 2
+    checksum = (packet_type + (length >> 8) + (length & 0xFF) + sum(payload)) & 0xFFFF
+    return START_CODE + ADDRESS + struct.pack(">BH", packet_type, length) + bytes(payload) + struct.pack(">H", checksum)
+
+
+def connect(port, baudrates=BAUDRATES):
+    """Open the driver on port, trying the port's own baud rate first.
+
+    A sensor keeps the rate raise_baudrate() gave it across power cycles,
+    so if it doesn't answer at the configured rate the others are tried.
+    """
+    for baudrate in dict.fromkeys((port.baudrate,) + tuple(baudrates)):
+        port.baudrate = baudrate
+        port.reset_input_buffer()
+        try:
+            return adafruit_fingerprint.Adafruit_Fingerprint(port)
+        except RuntimeError:
+            continue
+    raise RuntimeError("Failed to find sensor, check wiring!")
+
+
+def raise_baudrate(finger, port, baudrate=115200):
+    """Switch sensor and port to baudrate; returns the rate in use afterwards.
+
+    Falls back to the current rate if the sensor doesn't answer at the new one.
+    """
+    current = port.baudrate
+    if baudrate == current:
+        return current
+    finger.set_sysparam(BAUDRATE_PARAM, baudrate // 9600)
+    port.baudrate = baudrate
+    port.reset_input_buffer()
+    try:
+        if finger.verify_password() == adafruit_fingerprint.OK:
+            return baudrate
+    except RuntimeError:
+        pass
+    port.baudrate = current
+    port.reset_input_buffer()
+    return current
+
+
+def _read_exact(port, view):
+    done = 0
+    while done < len(view):
+        n = port.readinto(view[done:])
+        if not n:
+            raise RuntimeError("Failed to read data from sensor")
+        done += n
+
+
+class ImageReader:
+    """Reads uploaded images straight from the UART into a preallocated buffer.
+
+    The driver's get_fpdata() parses every data packet into a Python list
+    and concatenates them. Here the whole upload (every packet's header,
+    payload and checksum) is read with readinto() into one bytearray sized
+    for it, viewed as a (packets, packet length) array to check all headers
+    and checksums at once, and the payload columns are unpacked into the
+    image without being copied out first.
+
+    Simulators without a UART (SimulatedFingerprint) are read through
+    get_fpdata() instead.
+    """
+
+    def __init__(self, finger):
+        self.finger = finger
+        self.name = getattr(finger, "name", "sensor")
+        self._port = getattr(finger, "_uart", None)
+        self._payload = 32 << finger.data_packet_size
+        self._packets = IMAGE_SIZE // self._payload
+        self._ack = bytearray(12)
+        self._frames = bytearray(self._packets * (self._payload + HEADER_SIZE + 2))
+        self._command = packet(COMMAND_PACKET, [UPLOAD_IMAGE])
+
+    def read(self, out=None):
+        """Upload the sensor's image buffer; returns an IMAGE_HEIGHT x IMAGE_WIDTH uint8 array."""
+        with metrics.timed(metrics.SENSOR_COMMAND_SECONDS, sensor=self.name, command="upload_image"):
+            return self._read(out)
+
+    def _read(self, out):
+        if self._port is None:
+            return unpack_image(bytes(self.finger.get_fpdata(sensorbuffer="image")), out)
+        self._port.write(self._command)
+        _read_exact(self._port, memoryview(self._ack))
+        if self._ack[:2] != START_CODE or self._ack[6] != ACK_PACKET:
+            raise RuntimeError("Incorrect packet data")
+        if self._ack[9] != adafruit_fingerprint.OK:
+            raise RuntimeError(f"Image upload failed with code {self._ack[9]}")
+        _read_exact(self._port, memoryview(self._frames))
+
+        frames = np.frombuffer(self._frames, dtype=np.uint8).reshape(self._packets, -1)
+        end = HEADER_SIZE + self._payload
+        types = frames[:, 6]
+        lengths = frames[:, 7].astype(np.int32) << 8 | frames[:, 8]
+        checksums = frames[:, end].astype(np.int32) << 8 | frames[:, end + 1]
+        if ((frames[:, 0] != 0xEF) | (frames[:, 1] != 0x01)).any():
+            raise RuntimeError("Incorrect packet data")
+        if (types[:-1] != DATA_PACKET).any() or types[-1] != END_DATA_PACKET or (lengths != self._payload + 2).any():
+            raise RuntimeError("Unexpected packet layout in image upload")
+        if ((frames[:, 6:end].sum(axis=1, dtype=np.int32) & 0xFFFF) != checksums).any():
+            raise RuntimeError("Checksum mismatch in image upload")
+        return unpack_image(frames[:, HEADER_SIZE:end], out)
+
+
+class SimulatedUART:
+    """Serial port with a SimulatedFingerprint on the other end.
+
+    Command packets written to it are run on the simulator and the reply
+    packets are queued for read()/readinto(), so the real driver (or
+    ImageReader) can be exercised without hardware. With timing enabled,
+    reads take as long as their bytes would at the port's baud rate, and
+    nothing is answered while the port and the sensor disagree on it.
+    Commands the simulator has no model for are answered with
+    PACKETRECIEVEERR.
+    """
+
+    def __init__(self, sensor, baudrate=57600, timing=False, timeout=1):
+        self.sensor = sensor
+        self.baudrate = baudrate
+        self.sensor_baudrate = baudrate
+        self.timing = timing
+        self.timeout = timeout
+        self._input = bytearray()
+        self._output = bytearray()
+        self._output_baudrate = baudrate
+        self._sent = 0
+        self._download = bytearray()
+        self._download_slot = None
+
+    def _wait(self, size):
+        if self.timing:
+            time.sleep(size * 10 / self.baudrate)
+
+    def write(self, data):
+        self._wait(len(data))
+        if self.baudrate != self.sensor_baudrate:
+            return len(data)  # line noise to the sensor
+        self._input += bytes(data)
+        while len(self._input) >= HEADER_SIZE:
+            packet_type = self._input[6]
+            length = self._input[7] << 8 | self._input[8]
+            if len(self._input) < HEADER_SIZE + length:
+                break
+            payload = bytes(self._input[HEADER_SIZE:HEADER_SIZE + length - 2])
+            del self._input[:HEADER_SIZE + length]
+            if packet_type == COMMAND_PACKET:
+                self._handle(payload)
+            elif self._download_slot is not None:
+                self._download += payload
+                if packet_type == END_DATA_PACKET:
+                    self.sensor.send_fpdata(bytes(self._download), "char", self._download_slot)
+                    self._download.clear()
+                    self._download_slot = None
+        return len(data)
+
+    def readinto(self, buffer):
+        available = len(self._output) - self._sent
+        if self.baudrate != self._output_baudrate or not available:
+            if self.timing:
+                time.sleep(self.timeout)
+            return 0
+        n = min(len(buffer), available)
+        buffer[:n] = self._output[self._sent:self._sent + n]
+        self._sent += n
+        if self._sent == len(self._output):
+            self._output.clear()
+            self._sent = 0
+        self._wait(n)
+        return n
+
+    def read(self, size=1):
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        done = 0
+        while done < size:
+            n = self.readinto(view[done:])
+            if not n:
+                break
+            done += n
+        return bytes(buffer[:done])
+
+    def reset_input_buffer(self):
+        self._output.clear()
+        self._sent = 0
+
+    def close(self):
+        pass
+
+    def _reply(self, data):
+        if not self._output:
+            # Replies go out at the rate the sensor had when it sent them.
+            self._output_baudrate = self.sensor_baudrate
+        self._output += data
+
+    def _ack(self, *payload):
+        self._reply(packet(ACK_PACKET, bytes(payload)))
+
+    def _data(self, data):
+        size = 32 << self.sensor.data_packet_size
+        for start in range(0, len(data), size):
+            last = start + size >= len(data)
+            self._reply(packet(END_DATA_PACKET if last else DATA_PACKET, data[start:start + size]))
+
+    def _handle(self, payload):
+        sensor = self.sensor
+        command, args = payload[0], payload[1:]
+        if command == 0x13:  # verify password
+            self._ack(adafruit_fingerprint.OK)
+        elif command == 0x0F:  # read system parameters
+            params = struct.pack(">HHHH4sHH", 0, 0, sensor.library_size, 3, ADDRESS,
+                                 sensor.data_packet_size, self.sensor_baudrate // 9600)
+            self._ack(adafruit_fingerprint.OK, *params)
+        elif command == 0x0E and args[0] == BAUDRATE_PARAM:
+            self._ack(adafruit_fingerprint.OK)
+            self.sensor_baudrate = args[1] * 9600
+        elif command == 0x01:
+            self._ack(sensor.get_image())
+        elif command == 0x02:
+            self._ack(sensor.image_2_tz(args[0]))
+        elif command == 0x05:
+            self._ack(sensor.create_model())
+        elif command == 0x06:
+            self._ack(sensor.store_model(args[1] << 8 | args[2], args[0]))
+        elif command == 0x07:
+            self._ack(sensor.load_model(args[1] << 8 | args[2], args[0]))
+        elif command == 0x0C:
+            self._ack(sensor.delete_model(args[0] << 8 | args[1]))
+        elif command == 0x0D:
+            self._ack(sensor.empty_library())
+        elif command == 0x1D:
+            sensor.count_templates()
+            self._ack(adafruit_fingerprint.OK, *struct.pack(">H", sensor.template_count))
+        elif command == 0x1F:  # template index table, one bit per location
+            sensor.read_templates()
+            bits = np.zeros(256, dtype=np.uint8)
+            page = [t - 256 * args[0] for t in sensor.templates if 0 <= t - 256 * args[0] < 256]
+            bits[page] = 1
+            self._ack(adafruit_fingerprint.OK, *np.packbits(bits, bitorder="little").tobytes())
+        elif command in (0x04, 0x1B):  # search, high-speed search
+            code = sensor.finger_fast_search()
+            self._ack(code, *struct.pack(">HH", sensor.finger_id, sensor.confidence))
+        elif command == 0x08:
+            self._ack(adafruit_fingerprint.OK)
+            self._data(sensor.upload("char", args[0])[:TEMPLATE_SIZE])
+        elif command == 0x09:  # download to char buffer; the data packets follow
+            self._ack(adafruit_fingerprint.OK)
+            self._download_slot = args[0]
+        elif command == UPLOAD_IMAGE:
+            if sensor._image is None:
+                self._ack(adafruit_fingerprint.UPLOADFAIL)
+                return
+            self._ack(adafruit_fingerprint.OK)
+            self._data(sensor.upload("image"))
+        elif command == 0x35:  # LED control
+            self._ack(adafruit_fingerprint.OK)
+        else:
+            self._ack(adafruit_fingerprint.PACKETRECIEVEERR)
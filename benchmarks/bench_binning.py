@@ -0,0 +1,139 @@
+"""Pattern class binning against a full scan of the gallery.
+
+    python benchmarks/bench_binning.py --fingers 200 --impostors 50 --size 20000
+
+Enrolls impression 0 of --fingers simulated fingers with their bins,
+probes with impression 1 of each (genuine) and of --impostors fingers
+that were never enrolled, and reports for the full scan and the binned
+search (probe bins, then neighbouring bins):
+
+    penetration  fraction of the gallery compared per probe
+    hit rate     genuine probes whose mate is the best match above --threshold
+    false match  impostor probes matched to anyone
+
+Pattern class accuracy is checked against the pattern the simulator drew
+each finger with. Latency is measured on a gallery padded to --size rows
+with jittered copies of the enrolled descriptors (keeping their bins).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+import features
+import pattern_class
+from gallery_file import write_gallery_file
+from identification import IdentificationEngine
+from sensor import pack_image, synthetic_image, unpack_image
+
+
+def simulated_pattern(finger):
+    """The pattern class synthetic_image() draws for finger."""
+    rng = np.random.default_rng([finger, 0])
+    return ("arch", "loop", "loop", "whorl")[rng.integers(4)]
+
+
+def capture(finger, impression):
+    return unpack_image(pack_image(synthetic_image(finger, impression)))
+
+
+def jitter(rng, descriptors, n):
+    """n copies of descriptors with every minutia moved a little, so they match nothing well."""
+    picks = rng.integers(len(descriptors), size=n)
+    out = descriptors[picks].reshape(n, features.MAX_MINUTIAE, 4).copy()
+    used = out[:, :, 3:] != 0
+    moved = out[:, :, :2].astype(int) + rng.integers(-12, 13, size=(n, features.MAX_MINUTIAE, 2))
+    out[:, :, :2] = np.where(used, np.clip(moved, 0, 255), 0)
+    return out.reshape(n, features.DESCRIPTOR_SIZE), picks
+
+
+def search(engine, probe, signature, binned, threshold):
+    """(label or None, rows compared, seconds) of one identification."""
+    started = time.perf_counter()
+    if not binned:
+        labels, scores, _ = engine.identify(probe)
+        compared = engine.last_compared
+    else:
+        bins = pattern_class.probe_bins(signature)
+        compared = 0
+        for tier in (bins, pattern_class.neighbour_bins(bins)):
+            labels, scores, _ = engine.identify(probe, bins=tier)
+            compared += engine.last_compared
+            if len(scores) and scores[0] >= threshold:
+                break
+    seconds = time.perf_counter() - started
+    label = int(labels[0]) if len(scores) and scores[0] >= threshold else None
+    return label, compared, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fingers", type=int, default=200, help="enrolled fingers")
+    parser.add_argument("--impostors", type=int, default=50, help="probes from fingers never enrolled")
+    parser.add_argument("--size", type=int, default=20000, help="gallery rows for the latency test")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    enrolled = range(args.fingers)
+    impostors = range(args.fingers, args.fingers + args.impostors)
+    gallery_images = {f: capture(f, 0) for f in enrolled}
+    probe_images = {f: capture(f, 1) for f in [*enrolled, *impostors]}
+
+    started = time.perf_counter()
+    signatures = {f: pattern_class.classify(image) for f, image in gallery_images.items()}
+    classify_ms = 1000 * (time.perf_counter() - started) / args.fingers
+    probe_signatures = {f: pattern_class.classify(image) for f, image in probe_images.items()}
+    descriptors = np.stack([features.extract(gallery_images[f]) for f in enrolled])
+    bins = np.array([pattern_class.enroll_bin(signatures[f]) for f in enrolled], dtype=np.uint8)
+    probes = {f: features.extract(image) for f, image in probe_images.items()}
+
+    correct = np.mean([signatures[f]["pattern"] == simulated_pattern(f) for f in enrolled])
+    same_bin = np.mean([bins[f] in pattern_class.probe_bins(probe_signatures[f]) for f in enrolled])
+    counts = np.bincount(bins, minlength=bins.max() + 1)
+    print(f"classification: {classify_ms:.1f} ms/image, pattern class correct {correct:.1%}, "
+          f"mate in the probe's bins {same_bin:.1%}")
+    print(f"{np.count_nonzero(counts)} bins in use, largest holds {counts.max() / args.fingers:.1%}: "
+          + ", ".join(f"{pattern_class.describe(b)} {counts[b]}" for b in np.argsort(-counts)[:6]))
+
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "gallery.bin")
+        write_gallery_file(path, features.DESCRIPTOR_SIZE, args.fingers, np.arange(args.fingers),
+                           np.zeros(args.fingers), descriptors, bins)
+        engine = IdentificationEngine(path, workers=args.workers, budget=60)
+        engine.start()
+        print(f"{args.fingers} enrolled, {args.fingers} genuine and {args.impostors} impostor probes")
+        print(f"{'':>10} {'penetration':>12} {'hit rate':>9} {'false match':>12}")
+        for binned in (False, True):
+            genuine = [search(engine, probes[f], probe_signatures[f], binned, args.threshold) for f in enrolled]
+            impostor = [search(engine, probes[f], probe_signatures[f], binned, args.threshold) for f in impostors]
+            penetration = np.mean([compared for _, compared, _ in genuine + impostor]) / args.fingers
+            hits = np.mean([label == f for f, (label, _, _) in zip(enrolled, genuine)])
+            false_matches = np.mean([label is not None for label, _, _ in impostor]) if impostor else 0.0
+            print(f"{'binned' if binned else 'full scan':>10} {penetration:>12.1%} {hits:>9.1%} {false_matches:>12.1%}")
+        engine.close()
+
+        padding, picks = jitter(rng, descriptors, args.size - args.fingers)
+        write_gallery_file(path, features.DESCRIPTOR_SIZE, args.size, np.arange(args.size), np.zeros(args.size),
+                           np.concatenate([descriptors, padding]), np.concatenate([bins, bins[picks]]))
+        engine = IdentificationEngine(path, workers=args.workers, budget=60)
+        engine.start()
+        queries = list(enrolled)[:20]
+        print(f"latency over {args.size} rows, {args.workers} worker(s)")
+        latencies = {}
+        for binned in (False, True):
+            latencies[binned] = [search(engine, probes[f], probe_signatures[f], binned, args.threshold)[2]
+                                 for f in queries]
+            print(f"{'binned' if binned else 'full scan':>10} {1000 * np.mean(latencies[binned]):>8.1f} ms/probe")
+        engine.close()
+        print(f"speedup {np.mean(latencies[False]) / np.mean(latencies[True]):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Finger placements per successful enroll and match, with and without the capture quality gate.
+
+    python benchmarks/bench_capture.py --smudge-rate 0.3 --fingers 20 --matches 5
+
+The simulated sensor smudges a fraction of captures; those fail
+image_2_tz() with IMAGEMESS or template into something that matches
+nothing. "first image" is how requests used to run: one placement,
+template, and on a failure the whole request is repeated by the client,
+with the finger lifted and placed again.
+"gated" retries messy captures inside the request (CAPTURE_ATTEMPTS) and
+enrolls from the best --captures of --candidates quality-scored captures.
+Every placement is counted, including those of repeated requests.
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+import adafruit_fingerprint
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from sensor import SimulatedFingerprint
+from sensor_worker import SensorWorker
+
+OK = adafruit_fingerprint.OK
+
+
+async def first_image_enroll(sensor, location):
+    while True:
+        await sensor.capture()
+        if await sensor.template(1) == OK:
+            return await sensor.store(location)
+        await sensor.wait_for_lift()
+
+
+async def first_image_match(sensor):
+    while True:
+        await sensor.capture()
+        if await sensor.template(1) == OK:
+            return await sensor.search()
+        await sensor.wait_for_lift()
+
+
+async def gated_enroll(sensor, location, args):
+    while await sensor.enroll(args.captures, args.candidates, attempts=args.attempts,
+                              min_quality=args.min_quality) != OK:
+        await sensor.wait_for_lift()
+    return await sensor.store(location)
+
+
+async def gated_match(sensor, attempts):
+    while (await sensor.capture_template(1, attempts=attempts))[0] != OK:
+        await sensor.wait_for_lift()
+    return await sensor.search()
+
+
+async def run(mode, args):
+    finger = SimulatedFingerprint(capture_latency=0, baudrate=args.baudrate, smudge_rate=args.smudge_rate,
+                                  seed=args.seed)
+    sensor = SensorWorker(finger)
+
+    def placed():
+        return finger._impressions
+
+    for location in range(args.fingers):
+        finger.place_finger(location)
+        if mode == "gated":
+            await gated_enroll(sensor, location, args)
+        else:
+            await first_image_enroll(sensor, location)
+    enroll_placements = placed()
+    busy = sensor.busy_seconds
+
+    matched = 0
+    for location in range(args.fingers):
+        for _ in range(args.matches):
+            finger.place_finger(location)
+            if mode == "gated":
+                code, finger_id, _ = await gated_match(sensor, args.attempts)
+            else:
+                code, finger_id, _ = await first_image_match(sensor)
+            matched += code == OK and finger_id == location
+    placements = (enroll_placements, placed() - enroll_placements)
+    sensor.close()
+    return placements, matched, busy, sensor.busy_seconds - busy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fingers", type=int, default=20)
+    parser.add_argument("--matches", type=int, default=5, help="match requests per finger")
+    parser.add_argument("--smudge-rate", type=float, default=0.3)
+    parser.add_argument("--attempts", type=int, default=3)
+    parser.add_argument("--captures", type=int, default=2, help="captures merged into an enrolled model")
+    parser.add_argument("--candidates", type=int, default=3, help="captures the enrolled ones are picked from")
+    parser.add_argument("--min-quality", type=float, default=0.6, help="0 disables the quality gate")
+    parser.add_argument("--baudrate", type=int, default=0, help="simulate UART transfer times (0 disables)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    requests = args.fingers * args.matches
+    print(f"{args.fingers} fingers, {requests} match requests, {args.smudge_rate:.0%} of captures smudged")
+    print(f"{'':>12} {'placements/enroll':>18} {'placements/match':>17} {'matched':>8} "
+          f"{'enroll s':>9} {'match s':>8}")
+    for mode in ("first image", "gated"):
+        (enrolls, matches), matched, enroll_seconds, match_seconds = asyncio.run(run(mode, args))
+        print(f"{mode:>12} {enrolls / args.fingers:>18.2f} {matches / requests:>17.2f} "
+              f"{matched / requests:>8.0%} {enroll_seconds / args.fingers:>9.2f} {match_seconds / requests:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Minutiae extraction and matching on simulated sensor images.
+
+    python benchmarks/bench_features.py --fingers 100 --gallery 10000
+
+Enrolls impression 0 of each simulated finger and probes with impression 1
+(shifted, slightly rotated, different pressure and noise), both as the
+sensor would upload them at 4 bits per pixel. Reports time per extraction
+stage, comparisons per second against a gallery of the given size, and
+rank-1 accuracy next to the old Euclidean matching on the raw upload bytes.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+import features
+from gallery import Gallery
+from sensor import IMAGE_SIZE, pack_image, synthetic_image, unpack_image
+
+
+def stage_times(images):
+    """Mean milliseconds spent in each extraction stage."""
+    totals = dict.fromkeys(["segment", "normalize", "orientation", "enhance", "thin", "minutiae"], 0.0)
+    for image in images:
+        image = image.astype(np.float32)
+        t0 = time.perf_counter()
+        mask = features.segment(image)
+        t1 = time.perf_counter()
+        normalized = features.normalize(image, mask)
+        t2 = time.perf_counter()
+        theta, coherence = features.orientation_field(normalized, mask)
+        t3 = time.perf_counter()
+        enhanced = features.enhance(normalized, theta, mask, features.ridge_frequency(normalized, mask))
+        t4 = time.perf_counter()
+        skeleton = features.thin((enhanced < 0) & features._upsample(mask))
+        t5 = time.perf_counter()
+        features.encode(features.find_minutiae(skeleton, theta, coherence, mask))
+        t6 = time.perf_counter()
+        for name, spent in zip(totals, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4, t6 - t5)):
+            totals[name] += spent
+    return {name: 1000 * spent / len(images) for name, spent in totals.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fingers", type=int, default=100)
+    parser.add_argument("--gallery", type=int, default=10000, help="gallery size for the throughput test")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    uploads = {(f, i): pack_image(synthetic_image(f, i)) for f in range(args.fingers) for i in (0, 1)}
+    enrolled = [unpack_image(uploads[f, 0]) for f in range(args.fingers)]
+    probes = [unpack_image(uploads[f, 1]) for f in range(args.fingers)]
+
+    started = time.perf_counter()
+    enrolled_descriptors = np.stack([features.extract(image) for image in enrolled])
+    probe_descriptors = np.stack([features.extract(image) for image in probes])
+    extract_ms = 1000 * (time.perf_counter() - started) / (2 * args.fingers)
+    minutiae = [len(features.decode(d)) for d in enrolled_descriptors]
+    print(f"extraction: {extract_ms:.1f} ms/image, {np.mean(minutiae):.1f} minutiae/image on average")
+    print("  " + "  ".join(f"{name} {ms:.1f}" for name, ms in stage_times(enrolled[:20]).items()))
+
+    scores = np.stack([features.match_scores(probe, enrolled_descriptors) for probe in probe_descriptors])
+    genuine = np.diag(scores)
+    impostor = scores[~np.eye(args.fingers, dtype=bool)]
+    print(f"minutiae:   rank-1 {np.mean(scores.argmax(axis=1) == np.arange(args.fingers)):.3f}, "
+          f"FRR {np.mean(genuine < args.threshold):.3f} / FAR {np.mean(impostor >= args.threshold):.4f} "
+          f"at threshold {args.threshold}, {features.DESCRIPTOR_SIZE} bytes/template")
+
+    def raw(f, i):
+        return np.frombuffer(uploads[f, i], dtype=np.uint8)
+
+    pixels = Gallery(IMAGE_SIZE, dtype=np.uint8)
+    for f in range(args.fingers):
+        pixels.add(f, raw(f, 0))
+    nearest = [pixels.search(raw(f, 1), k=1)[0][0] for f in range(args.fingers)]
+    print(f"raw upload: rank-1 {np.mean(np.array(nearest) == np.arange(args.fingers)):.3f}, "
+          f"{IMAGE_SIZE} bytes/template")
+
+    gallery = enrolled_descriptors[np.arange(args.gallery) % args.fingers]
+    started = time.perf_counter()
+    features.match_scores(probe_descriptors[0], gallery)
+    minutiae_rate = args.gallery / (time.perf_counter() - started)
+    pixels = Gallery(IMAGE_SIZE, capacity=args.gallery, dtype=np.uint8)
+    for label in range(args.gallery):
+        pixels.add(label, raw(label % args.fingers, 0))
+    started = time.perf_counter()
+    pixels.distances(raw(0, 1))
+    pixel_rate = args.gallery / (time.perf_counter() - started)
+    print(f"throughput over {args.gallery} entries: minutiae {minutiae_rate:,.0f} comparisons/s, "
+          f"raw upload {pixel_rate:,.0f} comparisons/s")
+    print(f"gallery memory: minutiae {args.gallery * features.DESCRIPTOR_SIZE / 2**20:.1f} MiB, "
+          f"raw upload {args.gallery * IMAGE_SIZE / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
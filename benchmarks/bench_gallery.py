@@ -0,0 +1,81 @@
+"""Enroll and match latency of the host gallery as it grows.
+
+    python benchmarks/bench_gallery.py --sizes 1000 10000 100000 --dim 512
+
+Vectors are drawn around random cluster centres so the IVF index has some
+structure to exploit. If scikit-learn is installed, the old approach of
+refitting a KNeighborsClassifier on every enroll is timed for comparison.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from gallery import Gallery
+
+
+def make_vectors(rng, n, dim, clusters):
+    centres = rng.normal(0, 4, (clusters, dim)).astype(np.float32)
+    return centres[rng.integers(clusters, size=n)] + rng.normal(0, 1, (n, dim)).astype(np.float32)
+
+
+def time_per_call(fn, items):
+    started = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - started) / len(items)
+
+
+def sklearn_refit_latency(vectors, labels):
+    try:
+        from sklearn.neighbors import KNeighborsClassifier
+    except ImportError:
+        return None
+    model = KNeighborsClassifier(n_neighbors=1)
+    features = list(vectors)
+    started = time.perf_counter()
+    model.fit(features, labels)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = make_vectors(rng, max(args.sizes), args.dim, args.clusters)
+    probes = vectors[rng.integers(min(args.sizes), size=args.queries)]
+    probes = probes + rng.normal(0, 0.1, probes.shape).astype(np.float32)
+
+    print(f"{'size':>8} {'enroll us':>10} {'exact ms':>9} {'ivf ms':>8} {'recall':>7} {'refit ms':>9}")
+    gallery = Gallery(args.dim)
+    enrolled = 0
+    for size in sorted(args.sizes):
+        batch = range(enrolled, size)
+        enroll = time_per_call(lambda i: gallery.add(i, vectors[i]), batch)
+        enrolled = size
+
+        exact_labels = [gallery.search(p)[0][0] for p in probes]
+        exact = time_per_call(gallery.search, probes)
+
+        gallery.build_index(nprobe=args.nprobe)
+        recall = np.mean([gallery.search(p)[0][0] == label for p, label in zip(probes, exact_labels)])
+        approximate = time_per_call(gallery.search, probes)
+        gallery.index = None
+
+        refit = sklearn_refit_latency(vectors[:size], np.arange(size)) if size <= 20000 else None
+        refit_ms = f"{refit * 1000:9.1f}" if refit is not None else f"{'-':>9}"
+        print(f"{size:8d} {enroll * 1e6:10.1f} {exact * 1000:9.3f} {approximate * 1000:8.3f} {recall:7.3f} {refit_ms}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Probes per second of the multi-process identification engine.
+
+    python benchmarks/bench_identify.py --sizes 10000 50000 --workers 1 2 4
+
+Builds gallery files of minutiae descriptors (simulated fingers, each
+enrolled many times with its minutiae shifted, to reach the gallery size)
+and runs identification with different numbers of worker processes, next
+to a single-process scan with features.match_scores for reference.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+import features
+from gallery_file import write_gallery_file
+from identification import IdentificationEngine
+from sensor import synthetic_image
+
+
+def make_descriptors(rng, base, n):
+    """n descriptors made from base ones with their minutiae moved around."""
+    out = base[rng.integers(len(base), size=n)].reshape(n, features.MAX_MINUTIAE, 4).copy()
+    shift = rng.integers(-20, 21, size=(n, 1, 2))
+    used = out[:, :, 3:] != 0
+    out[:, :, :2] = np.where(used, np.clip(out[:, :, :2].astype(int) + shift, 0, 255), 0)
+    return out.reshape(n, features.DESCRIPTOR_SIZE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--fingers", type=int, default=20)
+    parser.add_argument("--budget", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    base = np.stack([features.extract(synthetic_image(f, 0)) for f in range(args.fingers)])
+    probes = [features.extract(synthetic_image(f % args.fingers, 1)) for f in range(args.queries)]
+    print(f"{os.cpu_count()} CPUs")
+    print(f"{'size':>8} {'workers':>8} {'probes/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'incomplete':>10}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = os.path.join(tmp, f"gallery-{size}.bin")
+            descriptors = make_descriptors(rng, base, size)
+            write_gallery_file(path, features.DESCRIPTOR_SIZE, size, np.arange(size), np.zeros(size), descriptors)
+
+            started = time.perf_counter()
+            for probe in probes:
+                features.match_scores(probe, descriptors)
+            rate = args.queries / (time.perf_counter() - started)
+            print(f"{size:>8} {'inline':>8} {rate:>9.1f}")
+
+            for workers in args.workers:
+                engine = IdentificationEngine(path, workers=workers, budget=args.budget)
+                engine.start()
+                latencies = []
+                started = time.perf_counter()
+                for probe in probes:
+                    engine.identify(probe, k=5)
+                    latencies.append(engine.last_latency * 1000)
+                rate = args.queries / (time.perf_counter() - started)
+                engine.close()
+                print(f"{size:>8} {workers:>8} {rate:>9.1f} {np.percentile(latencies, 50):>8.1f} "
+                      f"{np.percentile(latencies, 95):>8.1f} {engine.incomplete:>10}")
+
+
+if __name__ == "__main__":
+    main()
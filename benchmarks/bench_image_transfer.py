@@ -0,0 +1,70 @@
+"""Capture-to-array latency: driver get_fpdata() versus uart.ImageReader.
+
+    python benchmarks/bench_image_transfer.py --captures 50 --timed-captures 1
+
+Both paths run the real adafruit_fingerprint driver against the simulator
+through SimulatedUART. The first table has UART timing off, so it shows
+only the host-side cost of parsing packets and building the array. The
+second has timing on and compares the old setup (get_fpdata at 57600 baud)
+with the new one (ImageReader after raising the link to 115200 baud).
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from sensor import SimulatedFingerprint, unpack_image
+from uart import ImageReader, SimulatedUART, connect, raise_baudrate
+
+
+def old_read(finger):
+    return unpack_image(np.array(finger.get_fpdata(sensorbuffer="image"), dtype=np.uint8))
+
+
+def open_simulated(timing):
+    simulator = SimulatedFingerprint(capture_latency=0, seed=0)
+    port = SimulatedUART(simulator, baudrate=57600, timing=timing)
+    return connect(port), port
+
+
+def capture_ms(finger, port, read, captures):
+    """Mean ms from a captured image to a uint8 array on the host, and the last image."""
+    spent = 0
+    for _ in range(captures):
+        while finger.get_image() != 0:
+            pass
+        port.sensor.upload("image")  # render the simulated print outside the timed part
+        started = time.perf_counter()
+        image = read(finger)
+        spent += time.perf_counter() - started
+    return 1000 * spent / captures, image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--captures", type=int, default=50)
+    parser.add_argument("--timed-captures", type=int, default=1, help="captures with UART timing (each takes seconds)")
+    args = parser.parse_args()
+
+    finger, port = open_simulated(timing=False)
+    reader = ImageReader(finger)
+    old_ms, _ = capture_ms(finger, port, old_read, args.captures)
+    new_ms, _ = capture_ms(finger, port, lambda f: reader.read(), args.captures)
+    print(f"host cost, no UART timing: get_fpdata {old_ms:.2f} ms, ImageReader {new_ms:.2f} ms "
+          f"({old_ms / new_ms:.1f}x)")
+
+    if args.timed_captures:
+        finger, port = open_simulated(timing=True)
+        old_ms, _ = capture_ms(finger, port, old_read, args.timed_captures)
+        raise_baudrate(finger, port, 115200)
+        reader = ImageReader(finger)
+        new_ms, _ = capture_ms(finger, port, lambda f: reader.read(), args.timed_captures)
+        print(f"with UART timing: get_fpdata @57600 {old_ms:.0f} ms, ImageReader @{port.baudrate} {new_ms:.0f} ms "
+              f"({old_ms / new_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
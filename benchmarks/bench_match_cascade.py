@@ -0,0 +1,92 @@
+"""Match latency of the sensor-first cascade versus gallery-first matching.
+
+    python benchmarks/bench_match_cascade.py --fingers 120 --on-sensor 100 --captures 10
+
+The simulated sensor sleeps for the UART time of every command at the
+given baud rate. The first `--on-sensor` fingers are enrolled in the
+sensor's library and every finger is in the host minutiae gallery, so
+probes of the remaining fingers can only be matched by the gallery.
+"Gallery first" is the order utils/knn_test.py used to match in: upload
+the image, extract and search the gallery, then try the sensor.
+"""
+import argparse
+import os
+import sys
+import time
+
+import adafruit_fingerprint
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+import features
+from cascade import CascadeMatcher
+from sensor import SimulatedFingerprint, synthetic_image, unpack_image
+
+
+def gallery_first(finger, identify, threshold):
+    image = unpack_image(bytes(finger.get_fpdata(sensorbuffer="image")))
+    labels, scores, _ = identify(features.extract(image))
+    if len(scores) and scores[0] >= threshold:
+        return "gallery", int(labels[0]), float(scores[0])
+    if finger.finger_fast_search() == adafruit_fingerprint.OK:
+        return "sensor", finger.finger_id, finger.confidence
+    return None
+
+
+def run(finger, probes, match):
+    latencies, stages = [], []
+    for probe in probes:
+        finger.place_finger(probe)
+        while finger.get_image() != adafruit_fingerprint.OK:
+            pass
+        finger.image_2_tz(1)
+        started = time.perf_counter()
+        result = match(finger)
+        latencies.append(1000 * (time.perf_counter() - started))
+        stages.append(result[0] if result and result[1] == probe else "miss")
+    return np.array(latencies), stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fingers", type=int, default=120)
+    parser.add_argument("--on-sensor", type=int, default=100, help="fingers also enrolled on the sensor")
+    parser.add_argument("--captures", type=int, default=10)
+    parser.add_argument("--baudrate", type=int, default=115200)
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    descriptors = np.stack([features.extract(synthetic_image(f, 0)) for f in range(args.fingers)])
+
+    def identify(descriptor):
+        scores = features.match_scores(descriptor, descriptors)
+        best = np.argsort(-scores)[:1]
+        return best, scores[best], True
+
+    finger = SimulatedFingerprint(capture_latency=0, seed=args.seed)
+    for location in range(args.on_sensor):
+        finger.place_finger(location)
+        finger.get_image()
+        finger.image_2_tz(1)
+        finger.store_model(location)
+        finger.get_image()  # lift the finger
+    finger.baudrate = args.baudrate
+
+    probes = np.random.default_rng(args.seed).integers(args.fingers, size=args.captures).tolist()
+    matcher = CascadeMatcher(identify=identify, threshold=args.threshold)
+    print(f"{args.captures} captures at {args.baudrate} baud, "
+          f"{args.on_sensor}/{args.fingers} fingers on the sensor")
+    for name, match in (("gallery first", lambda f: gallery_first(f, identify, args.threshold)),
+                        ("cascade", matcher.match)):
+        latencies, stages = run(finger, probes, match)
+        counts = {stage: stages.count(stage) for stage in ("sensor", "gallery", "miss")}
+        print(f"{name:>14}: mean {latencies.mean():7.0f} ms, p50 {np.percentile(latencies, 50):7.0f} ms, "
+              f"p95 {np.percentile(latencies, 95):7.0f} ms, matched by "
+              + ", ".join(f"{stage} {n}" for stage, n in counts.items()))
+    print("cascade stage means (ms): " + ", ".join(
+        f"{stage} {ms:.0f}" for stage, ms in matcher.stats()["stage_mean_ms"].items() if ms is not None))
+
+
+if __name__ == "__main__":
+    main()
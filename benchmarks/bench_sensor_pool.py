@@ -0,0 +1,55 @@
+"""Match throughput of a SensorPool against the number of attached readers.
+
+    python benchmarks/bench_sensor_pool.py --sensors 1 2 4 --requests 16
+
+Each reader is a SimulatedFingerprint with UART timing, and each request
+does what /match does on the sensor: wait for a finger, template it and
+search the library. All requests are issued at once and routed to any
+free reader.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from sensor import SimulatedFingerprint
+from sensor_pool import SensorPool
+
+
+async def match(pool):
+    async with pool.session() as sensor:
+        await sensor.capture()
+        await sensor.template(1)
+        return await sensor.search()
+
+
+async def run(sensors, requests, capture_latency, baudrate):
+    fingers = {f"sim{i}": SimulatedFingerprint(capture_latency=capture_latency, baudrate=baudrate, seed=i)
+               for i in range(sensors)}
+    pool = SensorPool.open(fingers)
+    started = time.perf_counter()
+    await asyncio.gather(*(match(pool) for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    sessions = [stats["sessions"] for stats in pool.stats().values()]
+    pool.close()
+    return requests / elapsed, sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sensors", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--capture-latency", type=float, default=0.3, help="seconds until the finger is down")
+    parser.add_argument("--baudrate", type=int, default=57600)
+    args = parser.parse_args()
+
+    print(f"{'sensors':>8} {'matches/s':>10}  requests per sensor")
+    for sensors in args.sensors:
+        rate, sessions = asyncio.run(run(sensors, args.requests, args.capture_latency, args.baudrate))
+        print(f"{sensors:>8} {rate:>10.2f}  {sessions}")
+
+
+if __name__ == "__main__":
+    main()
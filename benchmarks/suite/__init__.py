@@ -0,0 +1,20 @@
+"""Reproducible benchmarks of the backend against the simulated sensor and the fake database.
+
+    python -m benchmarks.suite --out results.json
+    python -m benchmarks.suite.compare baseline.json results.json
+
+Groups (select with --groups):
+
+    endpoints  single-request latency of each HTTP endpoint, in process
+    load       throughput and latency under concurrent HTTP load (uvicorn subprocess)
+    gallery    minutiae matcher time per probe as the gallery grows
+    history    /aliases and /matches latency as the match history grows
+
+Results are written as JSON with the commit they were measured on, so
+runs from two commits can be compared with benchmarks.suite.compare.
+"""
+import os
+import sys
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "backend")
+sys.path.insert(0, BACKEND)
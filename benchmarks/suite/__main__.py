@@ -0,0 +1,68 @@
+import argparse
+import contextlib
+import os
+import tempfile
+
+from benchmarks.suite import __doc__
+from benchmarks.suite.results import Results
+
+GROUPS = ("endpoints", "load", "gallery", "history")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", nargs="+", choices=GROUPS, default=list(GROUPS))
+    parser.add_argument("--out", default="results.json")
+    parser.add_argument("--quick", action="store_true", help="fewer requests and smaller sizes, for a smoke test")
+    parser.add_argument("--requests", type=int, help="requests per endpoint and history query")
+    parser.add_argument("--gallery-sizes", type=int, nargs="+")
+    parser.add_argument("--history-sizes", type=int, nargs="+")
+    parser.add_argument("--concurrency", type=int, nargs="+")
+    parser.add_argument("--duration", type=float, help="seconds of load per scenario and concurrency")
+    parser.add_argument("--url", help="load-test this running backend instead of starting one")
+    parser.add_argument("--in-process", action="store_true", help="load-test through ASGI instead of uvicorn")
+    args = parser.parse_args()
+
+    quick = args.quick
+    requests = args.requests or (10 if quick else 50)
+    gallery_sizes = args.gallery_sizes or ([1000, 5000] if quick else [1000, 10000, 50000])
+    history_sizes = args.history_sizes or ([1000, 10000] if quick else [1000, 10000, 100000])
+    concurrency = args.concurrency or ([1, 4] if quick else [1, 4, 16])
+    duration = args.duration or (1 if quick else 5)
+
+    results = Results()
+    # The backend prints a line per request; keep only the results on stdout.
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        server = None
+        if {"endpoints", "history"} & set(args.groups) or args.in_process:
+            from benchmarks.suite.app import import_server
+
+            server = import_server(tmp)
+        try:
+            if "endpoints" in args.groups:
+                from benchmarks.suite import endpoints
+
+                endpoints.run(server, results, requests)
+            if "load" in args.groups:
+                from benchmarks.suite import load
+
+                load.run(results, tmp, concurrency, duration, url=args.url,
+                         server=server if args.in_process else None)
+            if "gallery" in args.groups:
+                from benchmarks.suite import gallery
+
+                gallery.run(results, gallery_sizes)
+            if "history" in args.groups:
+                from benchmarks.suite import history
+
+                history.run(server, results, history_sizes, requests)
+        finally:
+            if server is not None:
+                server.close_resources()
+    results.write(args.out, args.groups)
+    print(f"wrote {len(results.records)} results to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
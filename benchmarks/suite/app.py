@@ -0,0 +1,54 @@
+import os
+
+# Settings every benchmark runs the backend with: simulated sensor, fake database,
+# no artificial latency, fixed seeds, and scratch files under the run's directory.
+SETTINGS = {
+    "SENSOR_BACKEND": "simulated",
+    "DATABASE_BACKEND": "fake",
+    "SIM_CAPTURE_LATENCY": "0",
+    "SIM_BAUDRATE": "0",
+    "SIM_SEED": "0",
+    "SIM_SENSORS": "1",
+    "SENSOR_HEALTH_INTERVAL": "0",
+    "TRACE_REQUESTS": "0",
+}
+# Settings that would make runs depend on files outside the run's directory.
+UNSET = ("CACHE_SNAPSHOT", "MATCH_GALLERY_FILE", "SIM_IMAGE_DIR", "SIM_FAILURES")
+
+
+def environment(tmp, **overrides):
+    """Environment for a backend process whose files all live in tmp."""
+    env = {key: value for key, value in os.environ.items() if key not in UNSET}
+    env.update(SETTINGS)
+    env["MATCH_LOG_PATH"] = os.path.join(tmp, "match_log.db")
+    env["IMAGE_STORE_DIR"] = os.path.join(tmp, "images")
+    env.update({key: str(value) for key, value in overrides.items()})
+    return env
+
+
+def import_server(tmp):
+    """The server module, configured for benchmarking in this process, with its resources open.
+
+    Requests go through httpx.ASGITransport, which does not run the app's
+    lifespan, so the resources are opened here instead. config reads the
+    environment once, on import, so the caller's environment is put back
+    afterwards.
+    """
+    original = dict(os.environ)
+    env = environment(tmp)
+    os.environ.clear()
+    os.environ.update(env)
+    try:
+        import server
+
+        server.open_resources()
+    finally:
+        os.environ.clear()
+        os.environ.update(original)
+    return server
+
+
+def place_finger(server, finger):
+    """Make every simulated reader see finger on its next capture."""
+    for worker in server.sensors.workers.values():
+        worker.finger.place_finger(finger)
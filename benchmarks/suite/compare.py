@@ -0,0 +1,67 @@
+"""Compare two benchmark result files and flag regressions.
+
+    python -m benchmarks.suite.compare baseline.json results.json --threshold 10
+
+Exits with status 1 if any record got worse by more than threshold percent.
+"""
+import argparse
+import json
+import sys
+
+
+def _key(record):
+    return record["group"], record["name"], json.dumps(record["params"], sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def change(before, after):
+    """Percent change from before to after, positive when after is better."""
+    if before["value"] == 0:
+        return 0.0
+    delta = 100 * (after["value"] - before["value"]) / before["value"]
+    return delta if after["better"] == "higher" else -delta
+
+
+def compare(baseline, current, threshold):
+    """Print every record present in both runs; returns the regressed ones."""
+    before = {_key(record): record for record in baseline["records"]}
+    regressions = []
+    for record in current["records"]:
+        old = before.get(_key(record))
+        if old is None:
+            continue
+        delta = change(old, record)
+        flag = ""
+        if delta < -threshold:
+            flag = "  REGRESSION"
+            regressions.append(record)
+        elif delta > threshold:
+            flag = "  improved"
+        params = ", ".join(f"{key}={value}" for key, value in record["params"].items())
+        print(f"{record['group']:>9}  {record['name']:<32} {params:<28} "
+              f"{old['value']:>10.3f} -> {record['value']:>10.3f} {record['unit']:<5} {delta:+7.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change counted as a regression")
+    args = parser.parse_args()
+
+    baseline, current = load(args.baseline), load(args.current)
+    for name, run in (("baseline", baseline), ("current", current)):
+        env = run["environment"]
+        print(f"{name:>8}: {(env['commit'] or 'unknown')[:12]}{' (dirty)' if env['dirty'] else ''} {env['timestamp']}")
+    regressions = compare(baseline, current, args.threshold)
+    print(f"{len(regressions)} regression(s) beyond {args.threshold:g}%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.suite.app import place_finger
+
+GROUP = "endpoints"
+
+
+def _cases(n):
+    """(name, expected status, request(i) -> (finger, method, url, json)) for each endpoint."""
+    return [
+        ("POST /enroll", 200, lambda i: (i, "POST", "/enroll", {"id": i, "alias": f"user{i}"})),
+        ("POST /match (sensor hit)", 200, lambda i: (i % n, "POST", "/match", None)),
+        ("POST /match (miss)", 404, lambda i: (1000 + i, "POST", "/match", None)),
+        ("POST /save-image", 200, lambda i: (i % n, "POST", "/save-image", None)),
+        ("GET /aliases", 200, lambda i: (None, "GET", "/aliases", None)),
+        ("GET /matches/{alias}", 200, lambda i: (None, "GET", f"/matches/user{i % n}", None)),
+        ("GET /metrics", 200, lambda i: (None, "GET", "/metrics", None)),
+    ]
+
+
+async def _run(server, results, n):
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        for name, expected, request in _cases(n):
+            latencies = []
+            for i in range(n):
+                finger, method, url, body = request(i)
+                if finger is not None:
+                    place_finger(server, finger)
+                started = time.perf_counter()
+                response = await client.request(method, url, json=body)
+                latencies.append(1000 * (time.perf_counter() - started))
+                if response.status_code != expected:
+                    raise RuntimeError(f"{name} returned {response.status_code}: {response.text}")
+            results.add_latencies(GROUP, name, latencies, params={"requests": n})
+
+
+def run(server, results, n=50):
+    """Latency of one request at a time to each endpoint, through the ASGI app in process.
+
+    n fingers are enrolled first (as ids 0..n-1), so n must fit the sensor library.
+    """
+    asyncio.run(_run(server, results, n))
@@ -0,0 +1,33 @@
+import time
+
+import numpy as np
+
+from benchmarks.bench_identify import make_descriptors
+import features
+from sensor import synthetic_image
+
+GROUP = "gallery"
+
+
+def run(results, sizes=(1000, 10000, 50000), probes=5, fingers=20, seed=0):
+    """Time per probe of features.match_scores against galleries of each size.
+
+    Also records features.extract time per image, so compare.py flags
+    extraction regressions alongside matcher ones.
+    """
+    rng = np.random.default_rng(seed)
+    images = [synthetic_image(f, 0) for f in range(fingers)]
+    started = time.perf_counter()
+    base = np.stack([features.extract(image) for image in images])
+    results.add(GROUP, "extract per image", 1000 * (time.perf_counter() - started) / fingers, "ms",
+                params={"fingers": fingers})
+    queries = [features.extract(synthetic_image(f % fingers, 1)) for f in range(probes)]
+    for size in sizes:
+        gallery = make_descriptors(rng, base, size)
+        started = time.perf_counter()
+        for probe in queries:
+            features.match_scores(probe, gallery)
+        per_probe = (time.perf_counter() - started) / probes
+        params = {"gallery": size}
+        results.add(GROUP, "match_scores per probe", 1000 * per_probe, "ms", params=params)
+        results.add(GROUP, "comparisons per second", size / per_probe, "1/s", better="higher", params=params)
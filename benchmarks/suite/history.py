@@ -0,0 +1,79 @@
+import asyncio
+import datetime
+import time
+
+import httpx
+
+GROUP = "history"
+START = datetime.datetime(2024, 1, 1)
+
+
+def build_tree(total, fingerprints):
+    """A fingerprints tree with total matches spread over fingerprints and one year.
+
+    Every alias is shared by two fingerprints, like a person enrolled with two fingers.
+    """
+    per_fingerprint = total // fingerprints
+    step = 365 * 86400 / max(per_fingerprint, 1)
+    tree = {}
+    for i in range(fingerprints):
+        matches = {
+            f"-m{i:06d}{j:08d}": {"timestamp": (START + datetime.timedelta(seconds=j * step + i)).strftime("%Y-%m-%d %H:%M:%S")}
+            for j in range(per_fingerprint)
+        }
+        tree[str(i)] = {"id": i, "alias": f"user{i // 2}", "matches": matches}
+    return tree
+
+
+async def _run(server, results, sizes, n):
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        for total in sizes:
+            fingerprints = min(1000, max(10, total // 100))
+            server.db.reference("fingerprints").set(build_tree(total, fingerprints))
+            params = {"history": total, "fingerprints": fingerprints}
+            aliases = fingerprints // 2
+            queries = [
+                ("GET /aliases", lambda i: "/aliases"),
+                ("GET /matches/{alias}?limit=100", lambda i: f"/matches/user{i % aliases}?limit=100"),
+                ("GET /matches/{alias} one month", lambda i: f"/matches/user{i % aliases}?since=2024-06&until=2024-07"),
+            ]
+            for name, url in queries:
+                await client.get(url(0))  # the first read after set() pays for reloading the mirror
+                # Every request recomputes its response: the response cache is emptied first.
+                await _time(client, results, name, params, n, url, before=server.responses.clear)
+
+            full = "/matches/user0"
+            response = await client.get(full, headers={"Accept-Encoding": "identity"})
+            results.add(GROUP, "GET /matches/{alias} body", len(response.content), "B",
+                        params={**params, "encoding": "identity"})
+            response = await client.get(full, headers={"Accept-Encoding": "gzip"})
+            results.add(GROUP, "GET /matches/{alias} body", int(response.headers["content-length"]), "B",
+                        params={**params, "encoding": response.headers.get("content-encoding", "identity")})
+            await _time(client, results, "GET /matches/{alias} cached", params, n, lambda i: full)
+            etag = {"If-None-Match": response.headers["etag"]}
+            await _time(client, results, "GET /matches/{alias} revalidated", params, n, lambda i: full,
+                        headers=etag, expected=304)
+
+
+async def _time(client, results, name, params, n, url, before=None, headers=None, expected=200):
+    latencies = []
+    for i in range(n):
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        response = await client.get(url(i), headers=headers)
+        latencies.append(1000 * (time.perf_counter() - started))
+        if response.status_code != expected:
+            raise RuntimeError(f"{name} returned {response.status_code}: {response.text}")
+    results.add_latencies(GROUP, name, latencies, params=params)
+
+
+def run(server, results, sizes=(1000, 10000, 100000), n=50):
+    """Latency of the history endpoints with sizes[i] matches recorded in total.
+
+    Also records the size of one alias's full history with and without
+    gzip, and its latency when served from the response cache and when
+    revalidated with If-None-Match.
+    """
+    asyncio.run(_run(server, results, sizes, n))
@@ -0,0 +1,125 @@
+import asyncio
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.suite import BACKEND
+from benchmarks.suite.app import environment
+from benchmarks.suite.results import summarize
+
+GROUP = "load"
+# Requests issued under load, with the statuses that count as served.
+SCENARIOS = [
+    ("POST /match", "POST", "/match", (200, 404)),
+    ("GET /aliases", "GET", "/aliases", (200,)),
+]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(tmp, sensors, population):
+    """Run the backend under uvicorn in a subprocess; returns (process, base url)."""
+    port = _free_port()
+    env = environment(tmp, SIM_SENSORS=sensors, SIM_POPULATION=population)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND, env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+        try:
+            httpx.get(url + "/", timeout=1)
+            return process, url
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("uvicorn did not start within 30 s")
+
+
+async def generate(client, method, url, ok, concurrency, duration):
+    """Keep concurrency requests in flight for duration seconds.
+
+    Returns (latencies in ms, failed requests, elapsed seconds).
+    """
+    latencies, failed = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def user():
+        nonlocal failed
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url)
+                served = response.status_code in ok
+            except httpx.HTTPError:
+                served = False
+            latencies.append(1000 * (time.perf_counter() - started))
+            failed += not served
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    return latencies, failed, time.perf_counter() - started
+
+
+async def _run(client, results, concurrencies, duration, enroll, params):
+    for i in range(enroll):
+        response = await client.post("/enroll", json={"id": i, "alias": f"user{i}"})
+        if response.status_code != 200:
+            raise RuntimeError(f"POST /enroll returned {response.status_code}: {response.text}")
+    for name, method, url, ok in SCENARIOS:
+        for concurrency in concurrencies:
+            latencies, failed, elapsed = await generate(client, method, url, ok, concurrency, duration)
+            results.add(
+                GROUP, name, len(latencies) / elapsed, "req/s", better="higher",
+                params={**params, "concurrency": concurrency}, latency=summarize(latencies), failed=failed,
+            )
+
+
+def run(results, tmp, concurrencies=(1, 4, 16), duration=5, sensors=4, population=8, enroll=24,
+        url=None, server=None):
+    """Throughput of the backend under concurrent requests.
+
+    By default the backend runs under uvicorn in a subprocess with a
+    `sensors`-reader simulated pool; url points at a backend that is
+    already running instead, and server (the imported server module)
+    serves the requests in this process through ASGI.
+    """
+    process = None
+    if server is not None:
+        transport = httpx.ASGITransport(app=server.app)
+        base_url, params = "http://bench", {"server": "asgi", "sensors": len(server.sensors)}
+    else:
+        transport = None
+        if url is None:
+            if importlib.util.find_spec("uvicorn") is None:
+                print("load: uvicorn is not installed, skipping (use --in-process or --url)", file=sys.stderr)
+                return
+            process, url = start_server(tmp, sensors, population)
+            params = {"server": "uvicorn", "sensors": sensors}
+        else:
+            params = {"server": url}
+        base_url = url
+    try:
+        asyncio.run(_load(transport, base_url, results, concurrencies, duration, enroll, params))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+async def _load(transport, base_url, results, concurrencies, duration, enroll, params):
+    limits = httpx.Limits(max_connections=max(concurrencies))
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=60, limits=limits) as client:
+        await _run(client, results, concurrencies, duration, enroll, params)
@@ -0,0 +1,71 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.suite import BACKEND
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=BACKEND, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """Where and on what a run was measured."""
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def summarize(latencies):
+    latencies = np.asarray(latencies, dtype=float)
+    return {
+        "n": len(latencies),
+        "mean": float(latencies.mean()),
+        "p50": float(np.percentile(latencies, 50)),
+        "p95": float(np.percentile(latencies, 95)),
+        "p99": float(np.percentile(latencies, 99)),
+    }
+
+
+class Results:
+    """Benchmark records, each one number with its unit and direction.
+
+    A record is identified by (group, name, params); value is what
+    compare.py compares, and better says whether lower or higher is an
+    improvement. Records are printed to out as they are added.
+    """
+
+    def __init__(self, out=sys.stdout):
+        self.records = []
+        self.out = out
+
+    def add(self, group, name, value, unit, better="lower", params=None, **extra):
+        record = {"group": group, "name": name, "params": params or {}, "value": float(value),
+                  "unit": unit, "better": better, **extra}
+        self.records.append(record)
+        shown = ", ".join(f"{key}={value}" for key, value in record["params"].items())
+        print(f"{group:>9}  {name:<32} {shown:<28} {value:>12.3f} {unit}", file=self.out)
+        return record
+
+    def add_latencies(self, group, name, latencies_ms, params=None):
+        """Record the median of latencies_ms, keeping the other percentiles alongside."""
+        stats = summarize(latencies_ms)
+        return self.add(group, name, stats["p50"], "ms", params=params, latency=stats)
+
+    def write(self, path, groups):
+        with open(path, "w") as f:
+            json.dump({"environment": environment(), "groups": groups, "records": self.records}, f, indent=1)
@@ -1,4 +1,4 @@
-import React, { useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import axios from "axios";
 
 const MatchList = () => {
@@ -7,14 +7,37 @@ const MatchList = () => {
   const [aliases, setAliases] = useState([]);
   const [error, setError] = useState("");
   const [aliasError, setAliasError] = useState("");
+  const shown = useRef({ alias: null, aliases: false });
 
-  const handleSearch = async () => {
+  // Live updates instead of polling: new matches for the alias on screen are
+  // appended, and the alias list is refetched when a print is enrolled or deleted.
+  useEffect(() => {
+    const source = new EventSource("http://localhost:8000/events?types=match,enroll,delete");
+    source.addEventListener("match", (e) => {
+      const match = JSON.parse(e.data);
+      if (match.alias === shown.current.alias) {
+        setMatches((matches) => [...matches, match]);
+      }
+    });
+    const refreshAliases = () => shown.current.aliases && handleShowAliases();
+    source.addEventListener("enroll", refreshAliases);
+    source.addEventListener("delete", refreshAliases);
+    source.addEventListener("reset", () => {
+      if (shown.current.alias !== null) handleSearch(shown.current.alias);
+      refreshAliases();
+    });
+    return () => source.close();
+  }, []);
+
+  const handleSearch = async (searched = alias) => {
     setError("");
     setMatches([]);
+    shown.current.alias = null;
 
     try {
-      const response = await axios.get(`http://localhost:8000/matches/${alias}`);
+      const response = await axios.get(`http://localhost:8000/matches/${searched}`);
       setMatches(response.data.matches);
+      shown.current.alias = searched;
     } catch (err) {
       setError(err.response?.data?.detail || "An error occurred");
     }
@@ -27,6 +50,7 @@ const MatchList = () => {
     try {
       const response = await axios.get("http://localhost:8000/aliases");
       setAliases(response.data.aliases);
+      shown.current.aliases = true;
     } catch (err) {
       setAliasError(err.response?.data?.detail || "An error occurred while fetching aliases.");
     }
@@ -43,7 +67,7 @@ const MatchList = () => {
           placeholder="Enter alias"
           style={{ padding: "10px", marginRight: "10px", width: "300px" }}
         />
-        <button onClick={handleSearch} style={{ padding: "10px", marginRight: "10px" }}>
+        <button onClick={() => handleSearch()} style={{ padding: "10px", marginRight: "10px" }}>
           Search
         </button>
         <button onClick={handleShowAliases} style={{ padding: "10px" }}>
@@ -1,136 +1,112 @@
-from digitalio import DigitalInOut, Direction
-import board
+import os
+import sys
 import adafruit_fingerprint
-import serial
-import numpy as np
-from sklearn.neighbors import KNeighborsClassifier
-import pickle
-from PIL import Image
 
-
-led = DigitalInOut(board.D13)
-led.direction = Direction.OUTPUT
-
-uart = serial.Serial("/dev/ttyS0", baudrate=57600, timeout=1)
-finger = adafruit_fingerprint.Adafruit_Fingerprint(uart)
-
-MODEL_FILE = "fingerprint_model.pkl"
-FEATURES_FILE = "fingerprint_features.pkl"
-LABELS_FILE = "fingerprint_labels.pkl"
-
-knn_model = KNeighborsClassifier(n_neighbors=1)
-fingerprint_features = []
-fingerprint_labels = []
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+import capture
+from cascade import CascadeMatcher
+import config
+import features
+from gallery_file import MappedGallery
+from identification import IdentificationEngine
+from image_store import ImageStore
+import pattern_class
+from sensor import open_sensor
+from uart import ImageReader
+
+GALLERY_FILE = "fingerprint_minutiae.bin"
+
+finger = None
+reader = None
+images = None
+gallery = None
+engine = None
+matcher = None
+
+def open_devices():
+    """Open the sensor and the image store the menu works with."""
+    global finger, reader, images
+    finger = open_sensor()
+    reader = ImageReader(finger)
+    images = ImageStore(config.IMAGE_STORE_DIR, formats=("png",))
 
 def load_persistent_data():
-    """Load model, features, and labels from files."""
-    global knn_model, fingerprint_features, fingerprint_labels
-    try:
-        with open(MODEL_FILE, "rb") as model_file:
-            knn_model = pickle.load(model_file)
-        with open(FEATURES_FILE, "rb") as features_file:
-            fingerprint_features = pickle.load(features_file)
-        with open(LABELS_FILE, "rb") as labels_file:
-            fingerprint_labels = pickle.load(labels_file)
-        print("Persistent data loaded successfully.")
-    except FileNotFoundError:
-        print("No persistent data found. Starting fresh.")
-    except Exception as e:
-        print(f"Error loading persistent data: {e}")
+    """Open the gallery file, creating it if needed.
 
-def save_persistent_data():
-    """Save model, features, and labels to files."""
-    try:
-        with open(MODEL_FILE, "wb") as model_file:
-            pickle.dump(knn_model, model_file)
-        with open(FEATURES_FILE, "wb") as features_file:
-            pickle.dump(fingerprint_features, features_file)
-        with open(LABELS_FILE, "wb") as labels_file:
-            pickle.dump(fingerprint_labels, labels_file)
-        print("Persistent data saved successfully.")
-    except Exception as e:
-        print(f"Error saving persistent data: {e}")
+    The file is memory-mapped and every enroll/delete is written through to
+    it, so there is nothing to save afterwards.
+    """
+    global gallery, engine, matcher
+    if not os.path.exists(GALLERY_FILE):
+        print("No persistent data found. Starting fresh.")
+    gallery = MappedGallery.open(GALLERY_FILE, dim=features.DESCRIPTOR_SIZE)
+    engine = IdentificationEngine(GALLERY_FILE)
+    matcher = CascadeMatcher(identify=engine.identify, threshold=config.MATCH_THRESHOLD, binning=config.MATCH_BINNING)
+    print(f"Gallery loaded with {len(gallery)} fingerprints.")
 
 def save_fingerprint_image_as_png(image_data):
-    """Capture a fingerprint image and save it as a PNG file."""
-    print("Started saving image process")
-    image_width = 256
-    image_height = 144
-    img_array = np.array(image_data, dtype=np.uint8).reshape((image_height, image_width))
-    img = Image.fromarray(img_array, mode="L")
-    img.save("fingerprint_image.png")
-    print("Fingerprint image saved as 'fingerprint_image.png'")
+    """Store a captured fingerprint image and its PNG in the image store."""
+    digest = images.put(image_data)
+    print(f"Fingerprint image saved as '{images.get(digest, 'png')}'")
 
 def extract_features(template_data):
     """
-    Extract features from the fingerprint template.
-    This function simplifies the template into a feature vector.
+    Extract features from the fingerprint image.
+    Returns a compact minutiae descriptor (see backend/features.py).
     """
-    return np.array(template_data).flatten()
+    return features.extract(template_data)
 
 def store_fingerprint():
-    """Store a fingerprint template in the array and train the ML model."""
+    """Store a fingerprint on the sensor and in the gallery, under the same ID."""
+    print("Enter the ID to enroll the fingerprint under:")
+    try:
+        label = int(input("Fingerprint ID: "))
+    except ValueError:
+        print("Invalid ID. Please enter a valid number.")
+        return False
     print("Place your finger on the sensor to enroll...")
-    while finger.get_image() != adafruit_fingerprint.OK:
-        pass
-    print("Templating...")
-    if finger.image_2_tz(1) != adafruit_fingerprint.OK:
+    code, template_data, quality = capture.capture_template(
+        finger, 1, attempts=config.CAPTURE_ATTEMPTS, reader=reader, min_quality=config.CAPTURE_MIN_QUALITY
+    )
+    if code != adafruit_fingerprint.OK:
         print("Failed to template fingerprint.")
         return False
-    print("Storing fingerprint...")
-    template_data = finger.get_fpdata(sensorbuffer="image")
-    features = extract_features(template_data)
-    label = len(fingerprint_features) + 1
-    fingerprint_features.append(features)
-    fingerprint_labels.append(label)
-    # Train the kNN model
-    knn_model.fit(fingerprint_features, fingerprint_labels)
-    save_persistent_data()
-    print(f"Fingerprint stored with ID: {label}. Total fingerprints stored: {len(fingerprint_features)}")
+    print(f"Storing fingerprint (image quality {quality['score']:.2f})...")
+    if finger.store_model(label, 1) != adafruit_fingerprint.OK:
+        print("Failed to store fingerprint in sensor.")
+        return False
+    descriptor = extract_features(template_data)
+    bin = pattern_class.enroll_bin(pattern_class.classify(template_data))
+    gallery.add(label, descriptor, bin)
+    print(f"Fingerprint stored with ID: {label} ({pattern_class.describe(bin)}). "
+          f"Total fingerprints stored: {len(gallery)}")
     return True
 
 def match_fingerprint():
-    """Match a fingerprint against stored templates using ML or fallback to Adafruit library."""
+    """Match a fingerprint on the sensor, falling back to the gallery on a miss."""
     print("Place your finger on the sensor to match...")
-    while finger.get_image() != adafruit_fingerprint.OK:
-        pass
-    print("Templating...")
-    if finger.image_2_tz(1) != adafruit_fingerprint.OK:
+    if capture.capture_template(finger, 1, attempts=config.CAPTURE_ATTEMPTS)[0] != adafruit_fingerprint.OK:
         print("Failed to template fingerprint.")
         return False
-    print("Extracting fingerprint data for matching...")
-    current_template = finger.get_fpdata(sensorbuffer="image")
-    current_features = extract_features(current_template)
-    
-    if not fingerprint_features:
-        print("No fingerprints stored. Please enroll fingerprints first.")
-        return False
-    # Try matching using KNN
-    try:
-        prediction = knn_model.predict([current_features])
-        distance, index = knn_model.kneighbors([current_features], n_neighbors=1, return_distance=True)
-        if distance[0][0] < 0.5:
-            print(f"Fingerprint matched with ID: {prediction[0]} (Confidence: {1 - distance[0][0]:.2f})")
-            return True
-    except Exception as e:
-        print(f"Error during ML matching: {e}")
-    
-    # Fallback to Adafruit library matching
-    print("ML matching failed or no confident match found. Attempting Adafruit library matching...")
-    if finger.finger_fast_search() == adafruit_fingerprint.OK:
-        print(f"Fingerprint matched with ID: {finger.finger_id}, Confidence: {finger.confidence}")
-        return True
-    else:
-        print("No match found using Adafruit library.")
+    result = matcher.match(finger)
+    if result is None:
+        print("No match found on the sensor or in the gallery.")
         return False
+    stage, matched_id, confidence = result
+    print(f"Fingerprint matched by the {stage} with ID: {matched_id} (Confidence: {confidence:.2f})")
+    print(f"Match took {matcher.last_latency * 1000:.0f} ms")
+    return True
 
 
 def save_fingerprint_image():
     """Capture and save the fingerprint image."""
     print("Place your finger on the sensor to capture the image...")
-    while finger.get_image() != adafruit_fingerprint.OK:
-        pass
-    image_data = finger.get_fpdata(sensorbuffer="image")
+    code, image_data, _ = capture.capture_template(
+        finger, None, attempts=config.CAPTURE_ATTEMPTS, reader=reader, min_quality=config.CAPTURE_MIN_QUALITY
+    )
+    if code != adafruit_fingerprint.OK:
+        print("Could not capture a clear image.")
+        return False
     save_fingerprint_image_as_png(image_data=image_data)
     
 def delete_fingerprint():
@@ -143,17 +119,8 @@ def delete_fingerprint():
         return False
 
     # Remove from local dataset
-    global fingerprint_features, fingerprint_labels
-    if delete_id in fingerprint_labels:
-        index = fingerprint_labels.index(delete_id)
-        del fingerprint_features[index]
-        del fingerprint_labels[index]
+    if gallery.remove(delete_id):
         print(f"Fingerprint with ID {delete_id} removed from the local dataset.")
-    # Retrain the k-NN model
-        if fingerprint_features:
-            knn_model.fit(fingerprint_features, fingerprint_labels)
-        else:
-            knn_model = KNeighborsClassifier(n_neighbors=1)
     else:
         print(f"Fingerprint with ID {delete_id} not found in the local dataset.")
 
@@ -164,27 +131,33 @@ def delete_fingerprint():
     else:
         print(f"Failed to remove fingerprint with ID {delete_id} from the sensor. It may not exist.")
 
-    save_persistent_data()
     return True
 
 
-load_persistent_data()
-while True:
-    print("\nFingerprint Options:")
-    print("1. Enroll Fingerprint")
-    print("2. Match Fingerprint")
-    print("3. Save Fingerprint Image")
-    print("4. Exit")
-    option = input("Select an option: ")
-
-    if option == "1":
-        store_fingerprint()
-    elif option == "2":
-        match_fingerprint()
-    elif option == "3":
-        save_fingerprint_image()
-    elif option == "4":
-        print("Exiting...")
-        break
-    else:
-        print("Invalid option. Please select again.")
+def main():
+    open_devices()
+    load_persistent_data()
+    while True:
+        print("\nFingerprint Options:")
+        print("1. Enroll Fingerprint")
+        print("2. Match Fingerprint")
+        print("3. Save Fingerprint Image")
+        print("4. Exit")
+        option = input("Select an option: ")
+
+        if option == "1":
+            store_fingerprint()
+        elif option == "2":
+            match_fingerprint()
+        elif option == "3":
+            save_fingerprint_image()
+        elif option == "4":
+            print("Exiting...")
+            engine.close()
+            break
+        else:
+            print("Invalid option. Please select again.")
+
+
+if __name__ == "__main__":
+    main()
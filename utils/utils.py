@@ -1,33 +1,41 @@
+import os
+import sys
 import time
-import board
-import busio
-from digitalio import DigitalInOut, Direction
 import adafruit_fingerprint
-from PIL import Image
-import numpy as np
 
-led = DigitalInOut(board.D13)
-led.direction = Direction.OUTPUT
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+import capture
+import config
+from image_store import ImageStore
+from sensor import open_sensor
+import template_sync
+from uart import ImageReader
 
-import serial
-uart = serial.Serial("/dev/ttyS0", baudrate=57600, timeout=1)
+finger = None
+reader = None
+images = None
 
-finger = adafruit_fingerprint.Adafruit_Fingerprint(uart)
+
+def open_devices():
+    """Open the sensor and the image store the menu works with."""
+    global finger, reader, images
+    finger = open_sensor()
+    reader = ImageReader(finger)
+    images = ImageStore(config.IMAGE_STORE_DIR, formats=("png",))
 
 
 def get_fingerprint():
     """Get a finger print image, template it, and see if it matches!"""
     print("Waiting for image...")
-    while finger.get_image() != adafruit_fingerprint.OK:
-        pass
-    print("Templating...")
-    if finger.image_2_tz(1) != adafruit_fingerprint.OK:
+    code, image_data, _ = capture.capture_template(
+        finger, 1, attempts=config.CAPTURE_ATTEMPTS, reader=reader, min_quality=config.CAPTURE_MIN_QUALITY
+    )
+    if code != adafruit_fingerprint.OK:
         return False
     print("Searching...")
     if finger.finger_search() != adafruit_fingerprint.OK:
         return False
-    
-    image_data = finger.get_fpdata(sensorbuffer="image")
+
     save_fingerprint_image_as_png(image_data=image_data)
     return True
 
@@ -95,19 +103,9 @@ def save_fingerprint_image():
 
 
 def save_fingerprint_image_as_png(image_data):
-    """Capture a fingerprint image and save it as a PNG file."""
-    print("Started saving image process")
-
-    image_width = 256
-    image_height = 144
-
-    img_array = np.array(image_data, dtype=np.uint8).reshape((image_height, image_width))
-
-    img = Image.fromarray(img_array, mode="L")
-
-    img.save("fingerprint_image.png")
-    print("Fingerprint image saved as 'fingerprint_image.png'")
-
+    """Store a captured fingerprint image and its PNG in the image store."""
+    digest = images.put(image_data)
+    print(f"Fingerprint image saved as '{images.get(digest, 'png')}'")
 
 
 def enroll_finger(location):
@@ -191,26 +189,42 @@ def get_num():
     return i
 
 
-while True:
-    print("----------------")
-    if finger.read_templates() != adafruit_fingerprint.OK:
-        raise RuntimeError("Failed to read templates")
-    print("Fingerprint templates:", finger.templates)
-    print("e) enroll print")
-    print("f) find print")
-    print("d) delete print")
-    print("----------------")
-    c = input("> ")
-
-    if c == "e":
-        enroll_finger(get_num())
-    if c == "f":
-        if get_fingerprint():
-            print("Detected #", finger.finger_id, "with confidence", finger.confidence)
-        else:
-            print("Finger not found")
-    if c == "d":
-        if finger.delete_model(get_num()) == adafruit_fingerprint.OK:
-            print("Deleted!")
-        else:
-            print("Failed to delete")
+def main():
+    open_devices()
+    while True:
+        print("----------------")
+        if finger.read_templates() != adafruit_fingerprint.OK:
+            raise RuntimeError("Failed to read templates")
+        print("Fingerprint templates:", finger.templates)
+        print("e) enroll print")
+        print("f) find print")
+        print("d) delete print")
+        print("x) export templates to a file")
+        print("i) import templates from a file")
+        print("----------------")
+        c = input("> ")
+
+        if c == "e":
+            enroll_finger(get_num())
+        if c == "f":
+            if get_fingerprint():
+                print("Detected #", finger.finger_id, "with confidence", finger.confidence)
+            else:
+                print("Finger not found")
+        if c == "d":
+            if finger.delete_model(get_num()) == adafruit_fingerprint.OK:
+                print("Deleted!")
+            else:
+                print("Failed to delete")
+        if c == "x":
+            path = input("File to write [fingerprint_templates.bin]: ") or "fingerprint_templates.bin"
+            with open(path, "wb") as f:
+                print("Exported", template_sync.export_templates(finger, f), "templates to", path)
+        if c == "i":
+            path = input("File to read [fingerprint_templates.bin]: ") or "fingerprint_templates.bin"
+            with open(path, "rb") as f:
+                print("Imported templates:", sorted(template_sync.import_templates(finger, f)))
+
+
+if __name__ == "__main__":
+    main()